@@ -0,0 +1,302 @@
+"""
+AI 서버 요청 경로 마이크로 벤치마크
+
+매 요청마다 실행되는 CPU 작업(멘션/키워드/학습 모델 라우팅, 캘린더 컨텍스트 구성, 라우터 JSON 파싱(전체/스트리밍),
+시스템 프롬프트 생성, 폴백 일기 생성)을 길이가 다른 한국어 메시지 코퍼스로 측정합니다.
+
+실행:
+    python benchmarks/hot_paths.py                                  # 측정 결과만 출력
+    python benchmarks/hot_paths.py --output results.json            # JSON으로 저장
+    python benchmarks/hot_paths.py --save-baseline                  # 이 머신의 기준값 저장 (benchmarks/baseline.json)
+    python benchmarks/hot_paths.py --compare                        # 저장한 기준값 대비 회귀 검사 (회귀 시 종료 코드 1)
+    python benchmarks/hot_paths.py --compare other.json             # 다른 기준값과 비교
+
+기준값은 측정한 머신에 따라 달라지므로 저장소에 커밋하지 않습니다 (.gitignore).
+같은 머신(또는 같은 CI 작업 안)에서 --save-baseline으로 만든 기준값과만 비교하세요.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# 벤치마크 중 요청별 로그가 측정을 방해하지 않도록
+os.environ.setdefault('AI_LOG_LEVEL', 'WARNING')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+sys.path.insert(0, os.path.join(ROOT, 'src', 'local-backend'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'ai_serever'))
+
+import ai_server  # noqa: E402
+
+try:
+    import main_naver_ollama  # noqa: E402
+except ImportError as e:  # LangChain 의존성이 없으면 해당 벤치마크만 건너뜀
+    main_naver_ollama = None
+    print(f"⚠️ main_naver_ollama unavailable, skipping LangChain service benchmarks: {e}")
+
+
+# ==================== 코퍼스 ====================
+
+FRAGMENTS = [
+    '오늘 회사에서 발표를 했는데', '요즘 너무 지쳐서', '친구랑 싸워서 마음이 아파',
+    '이직 준비를 어떻게 해야 할지 모르겠어', '운동 습관을 만들고 싶은데', '왜 자꾸 같은 실수를 반복할까',
+    '시험이 다가와서 불안해', '돈 관리 계획을 세우고 싶어', '내가 진짜 원하는 게 뭔지 궁금해',
+    '주말에 뭐 할지 고민이야', '잠을 잘 못 자서 피곤해', '새로운 프로젝트를 시작했어',
+    '가족이랑 이야기하다가 서운했어', '목표를 세웠는데 실천이 안 돼', '그냥 아무 생각 없이 쉬고 싶다',
+]
+MENTIONS = ['@루미', '@카이', '@레오', '@리브', '@lumi', '@kai']
+
+
+def build_messages(rng: random.Random, target_chars: int, count: int, mention_ratio: float = 0.2) -> List[str]:
+    """target_chars 길이 안팎의 메시지 count개 (일부는 멘션 포함)"""
+    messages = []
+    for _ in range(count):
+        parts: List[str] = []
+        while sum(len(part) + 1 for part in parts) < target_chars:
+            parts.append(rng.choice(FRAGMENTS))
+        if rng.random() < mention_ratio:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(MENTIONS))
+        messages.append(' '.join(parts))
+    return messages
+
+
+def build_calendar_events(rng: random.Random, count: int) -> List[Dict[str, Any]]:
+    """구글 캘린더 API 형식의 일정 count개 (시간 지정/종일 일정 혼합)
+    
+    CalendarContextBuilder.build()는 현재 시각 기준 범위로 고르므로 지금 시각에 맞춰 배치
+    (3일 전 ~ 14일 후: 범위 안팎의 일정이 섞여 bisect/확장 경로를 거침)
+    """
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    events = []
+    for i in range(count):
+        start = now + timedelta(hours=rng.randrange(-72, 24 * 14))
+        if rng.random() < 0.2:
+            start_field = {'date': start.strftime('%Y-%m-%d')}
+        else:
+            start_field = {'dateTime': start.strftime('%Y-%m-%dT%H:%M:%SZ')}
+        event = {'summary': f"{rng.choice(['회의', '운동', '스터디', '점심 약속', '병원'])} {i}", 'start': start_field}
+        if rng.random() < 0.3:
+            event['location'] = rng.choice(['강남역', '회사', '집 근처 카페'])
+        events.append(event)
+    return events
+
+
+ROUTING_CONTENTS = {
+    'plain': '{"character": "char_2", "reason": "구체적인 계획 수립이 필요한 질문"}',
+    'fenced': '분석 결과입니다.\n```json\n{"character": "char_1", "reason": "감정적 지원이 필요함"}\n```',
+    'prose': '사용자의 메시지를 보면 {"character": "char_3", "reason": "자기 성찰을 원함"} 이 적합합니다.',
+}
+
+
+# ==================== 측정 ====================
+
+def measure(fn: Callable[[], Any], rounds: int, min_round_time: float) -> Dict[str, float]:
+    """호출 1회당 시간(마이크로초) 통계 - 라운드마다 min_round_time 이상 걸리도록 반복 횟수를 보정"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - started >= min_round_time or loops >= 1_000_000:
+            break
+        loops *= 2
+
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            samples.append((time.perf_counter() - started) / loops * 1e6)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'median_us': round(median, 3),
+        'mean_us': round(statistics.fmean(samples), 3),
+        'p95_us': round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+        'min_us': round(samples[0], 3),
+        'ops_per_sec': round(1e6 / median, 1) if median else 0.0,
+        'rounds': rounds,
+        'loops': loops,
+    }
+
+
+def cycle(items: List[Any]) -> Callable[[], Any]:
+    """호출할 때마다 다음 항목을 반환 (같은 입력만 반복해서 캐시 효과만 재지 않도록)"""
+    index = [0]
+
+    def next_item() -> Any:
+        item = items[index[0]]
+        index[0] = (index[0] + 1) % len(items)
+        return item
+
+    return next_item
+
+
+def build_chat_messages_cold(request: Any) -> Any:
+    ai_server.calendar_context_builder._indexes.clear()
+    return ai_server.build_chat_messages(request, 'char_4')
+
+
+def build_benchmarks(seed: int) -> List[Tuple[str, Callable[[], Any]]]:
+    rng = random.Random(seed)
+    corpora = {
+        'short': build_messages(rng, 20, 200),
+        'medium': build_messages(rng, 120, 200),
+        'long': build_messages(rng, 1000, 50),
+    }
+    benchmarks: List[Tuple[str, Callable[[], Any]]] = []
+
+    for size, messages in corpora.items():
+        next_message = cycle(messages)
+        benchmarks.append((f'select_character_by_mention[{size}]',
+                           lambda next_message=next_message: ai_server.select_character_by_mention(next_message())))
+        benchmarks.append((f'select_character_by_keywords[{size}]',
+                           lambda next_message=next_message: ai_server.select_character_by_keywords(next_message())))
+
+    history = [ai_server.Message(role='user' if i % 2 == 0 else 'assistant', content=text)
+               for i, text in enumerate(corpora['medium'][:20])]
+    for event_count in (10, 100, 500):
+        request = ai_server.ChatRequest(
+            characterId='char_4',
+            message=corpora['medium'][0],
+            profile={'nickname': '테스터', 'aiInfo': '아침형 인간'},
+            chatHistory=history,
+            calendarEvents=build_calendar_events(rng, event_count)
+        )
+        benchmarks.append((f'build_chat_messages[char_4,{event_count}_events]',
+                           lambda request=request: ai_server.build_chat_messages(request, 'char_4')))
+        # 캘린더 캐시를 매번 비워 일정 파싱·정렬·포맷 경로까지 측정
+        benchmarks.append((f'build_chat_messages[char_4,{event_count}_events,cold]',
+                           lambda request=request: build_chat_messages_cold(request)))
+
+    # 학습된 라우팅 모델(AI_ROUTING_MODEL_PATH)이 있을 때만
+    if ai_server.routing_classifier is not None:
+        for size, messages in corpora.items():
+            next_message = cycle(messages)
+            benchmarks.append((f'RoutingClassifier.predict[{size}]',
+                               lambda next_message=next_message: ai_server.routing_classifier.predict(next_message())))
+
+    for kind, content in ROUTING_CONTENTS.items():
+        benchmarks.append((f'parse_routing_content[{kind}]',
+                           lambda content=content: ai_server.parse_routing_content(content)))
+
+    def feed_stream(tokens: List[str]) -> Optional[str]:
+        parser = ai_server.RoutingStreamParser()
+        for token in tokens:
+            if parser.feed(token):
+                break
+        return parser.character
+
+    for kind, content in ROUTING_CONTENTS.items():
+        tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+        benchmarks.append((f'RoutingStreamParser[{kind}]',
+                           lambda tokens=tokens: feed_stream(tokens)))
+
+    if main_naver_ollama is not None:
+        service = main_naver_ollama.ai_service
+        profile = {'nickname': '테스터', 'aiInfo': '친근한 말투를 좋아함', 'locale': 'ko-KR'}
+        next_character = cycle(['char_1', 'char_2', 'char_3', 'char_4'])
+        benchmarks.append(('AIService.build_system_prompt+user_context',
+                           lambda: (service.build_system_prompt(next_character()), service.build_user_context(profile))))
+
+        for size, messages in corpora.items():
+            days = [messages[i:i + 10] for i in range(0, len(messages), 10)]
+            next_day = cycle(days)
+            benchmarks.append((f'AIService._generate_fallback_diary[{size}]',
+                               lambda next_day=next_day: service._generate_fallback_diary(next_day())))
+
+    return benchmarks
+
+
+# ==================== 기준값 비교 ====================
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """중앙값이 기준보다 threshold 비율 이상 느려진 벤치마크 목록"""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = stats['median_us'] / base['median_us'] if base['median_us'] else 1.0
+        stats['baseline_median_us'] = base['median_us']
+        stats['change'] = round(ratio - 1, 4)
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {base['median_us']:.2f}us → {stats['median_us']:.2f}us (+{(ratio - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='AI 서버 요청 경로 마이크로 벤치마크')
+    parser.add_argument('--filter', default='', help='이름에 이 문자열이 포함된 벤치마크만 실행')
+    parser.add_argument('--rounds', type=int, default=20, help='라운드 수 (기본 20)')
+    parser.add_argument('--min-round-time', type=float, default=0.01, help='라운드당 최소 측정 시간(초)')
+    parser.add_argument('--seed', type=int, default=42, help='코퍼스 생성 시드')
+    parser.add_argument('--output', help='결과를 JSON으로 저장할 경로')
+    parser.add_argument(
+        '--compare', nargs='?', const=DEFAULT_BASELINE,
+        help='이 기준값 JSON과 비교해 회귀를 검사 (경로 생략 시 benchmarks/baseline.json)'
+    )
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help='결과를 기준값으로 저장 (경로 생략 시 benchmarks/baseline.json)')
+    parser.add_argument('--threshold', type=float, default=0.2, help='회귀로 판단할 중앙값 증가 비율 (기본 0.2 = 20%%)')
+    args = parser.parse_args(argv)
+    if args.compare and not os.path.exists(args.compare):
+        print(f"❌ Baseline {args.compare} not found (create it on this machine with --save-baseline)")
+        return 2
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, fn in build_benchmarks(args.seed):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, args.rounds, args.min_round_time)
+        stats = results[name]
+        print(f"{name:<52} median {stats['median_us']:>10.2f}us  p95 {stats['p95_us']:>10.2f}us  ({stats['ops_per_sec']:,.0f} ops/s)")
+
+    regressions: List[str] = []
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f)['benchmarks'], args.threshold)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'threshold': args.threshold,
+        },
+        'benchmarks': results,
+        'regressions': regressions,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Saved results to {path}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) over {args.threshold * 100:.0f}%:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
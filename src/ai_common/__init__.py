@@ -0,0 +1,9 @@
+"""두 AI 서버(local-backend/ai_server.py, ai_serever/main_naver_ollama.py)가 함께 쓰는 인프라 모듈
+
+- keywords: 키워드 그룹 매칭
+- resilience: 서킷 브레이커, 재시도 예산, 동시 실행 제한, 업스트림 오류 분류
+- logging_setup: 큐 기반 구조화 로깅과 요청 ID 미들웨어
+- metrics: Prometheus 텍스트 포맷 메트릭
+
+서버 파일은 src/를 sys.path에 추가한 뒤 `from ai_common.<모듈> import ...`로 불러옵니다.
+"""
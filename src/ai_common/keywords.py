@@ -0,0 +1,44 @@
+"""키워드 그룹 매칭 (그룹 채팅 라우팅, 폴백 일기 감정 분류)"""
+
+import re
+from typing import Dict, List
+
+
+class KeywordMatcher:
+    """여러 키워드 그룹을 미리 컴파일한 하나의 정규식으로 매칭
+    
+    count()는 텍스트를 한 번 훑으면서 그룹별로 등장한 서로 다른 키워드 수를 반환합니다.
+    긴 키워드를 우선 매칭하고 접두사 키워드('힘들' ⊂ '힘들어')는 미리 계산한 목록으로 함께 집계하며,
+    다음 검색을 매칭 시작 위치 다음 글자부터 이어가므로 겹치는 키워드도 놓치지 않습니다.
+    """
+    
+    def __init__(self, groups: Dict[str, List[str]]):
+        self.groups = list(groups)
+        self._owners: Dict[str, List[str]] = {}
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                owners = self._owners.setdefault(keyword.lower(), [])
+                if group not in owners:
+                    owners.append(group)
+        
+        keywords = sorted(self._owners, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+        self._prefixes = {
+            keyword: [prefix for prefix in keywords if keyword.startswith(prefix)]
+            for keyword in keywords
+        }
+    
+    def count(self, text: str) -> Dict[str, int]:
+        text = text.lower()
+        search = self._pattern.search
+        found = set()
+        match = search(text)
+        while match:
+            found.update(self._prefixes[match.group()])
+            match = search(text, match.start() + 1)
+        
+        counts = dict.fromkeys(self.groups, 0)
+        for keyword in found:
+            for group in self._owners[keyword]:
+                counts[group] += 1
+        return counts
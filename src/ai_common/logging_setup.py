@@ -0,0 +1,144 @@
+"""구조화 로깅: 큐 기반 비동기 출력, 요청 ID 상관관계, 요청별 상세 로그 샘플링"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, Sequence
+
+
+# 요청별 상관관계 ID와 상세 로그 샘플링 여부 (RequestContextMiddleware가 설정)
+request_id_var: ContextVar[str] = ContextVar('request_id', default='-')
+log_sampled_var: ContextVar[bool] = ContextVar('log_sampled', default=True)
+
+# LogRecord 기본 속성 - 나머지(extra)는 구조화 필드로 출력
+LOG_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'request_id', 'verbose'}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """한 줄짜리 JSON 로그 (extra로 넘긴 필드 포함)
+    
+    request_id_key는 요청 ID 필드 이름 - 서버마다 응답 JSON과 같은 표기(requestId / request_id)를 씁니다.
+    """
+    
+    def __init__(self, request_id_key: str = 'request_id'):
+        super().__init__()
+        self.request_id_key = request_id_key
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            self.request_id_key: getattr(record, 'request_id', '-'),
+            'msg': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in LOG_RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """요청 ID를 붙이고, 샘플링되지 않은 요청의 상세(verbose) 로그는 버림"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return not getattr(record, 'verbose', False) or log_sampled_var.get()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """큐가 가득 차면 기다리지 않고 로그를 버림 (stdout이 막혀도 이벤트 루프가 멈추지 않도록)"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 포맷(JSON 직렬화, 예외 traceback)은 리스너 스레드에서 - 여기서는 인자만 메시지에 합침
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(
+    level: str,
+    log_format: str,
+    queue_size: int,
+    request_id_key: str = 'request_id',
+    logger_names: Sequence[str] = ()
+) -> DroppingQueueHandler:
+    """요청 경로는 큐에 넣기만 하고, 실제 stdout 쓰기는 QueueListener 스레드가 담당
+    
+    logger_names를 주면 그 로거들에만 큐 핸들러를 붙이고(전파 없음), 없으면 루트 로거를 교체합니다.
+    """
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if log_format == 'json':
+        stream_handler.setFormatter(JsonLogFormatter(request_id_key))
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+    
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(RequestContextFilter())
+    
+    listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    if not logger_names:
+        logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+    for name in logger_names:
+        named_logger = logging.getLogger(name)
+        named_logger.setLevel(level)
+        named_logger.addHandler(queue_handler)
+        named_logger.propagate = False
+    return queue_handler
+
+
+class RequestContextMiddleware:
+    """요청마다 상관관계 ID(X-Request-Id, 없으면 생성)와 로그 샘플링 여부를 정하고 응답 헤더로 ID를 돌려줌"""
+    
+    def __init__(self, app, sample_rate: float = 1.0):
+        self.app = app
+        self.sample_rate = sample_rate
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        request_id = None
+        for name, value in scope.get('headers', []):
+            if name == b'x-request-id':
+                request_id = value.decode('latin-1')[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        
+        id_token = request_id_var.set(request_id)
+        sampled_token = log_sampled_var.set(self.sample_rate >= 1.0 or random.random() < self.sample_rate)
+        
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (b'x-request-id', request_id.encode('latin-1'))]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(id_token)
+            log_sampled_var.reset(sampled_token)
@@ -0,0 +1,120 @@
+"""Prometheus 텍스트 포맷 메트릭 (두 서버가 같은 이름의 요청/단계 지연 시간 메트릭을 노출)"""
+
+import bisect
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+# 지연 시간 히스토그램 버킷 (초) - 키워드 라우팅 같은 마이크로초 단위 단계부터 업스트림 생성까지
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_metric_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    """Prometheus 텍스트 포맷 라벨 문자열 ({a="1",b="2"})"""
+    pairs = [
+        f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class MetricCounter:
+    """Prometheus 카운터 (라벨 조합별 누적값)"""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for key, value in self._values.items():
+            lines.append(f'{self.name}{format_metric_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class MetricHistogram:
+    """Prometheus 히스토그램 (라벨 조합별 버킷 카운트 + 합계)"""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # 라벨 조합 → [버킷별 카운트(누적 아님), 합계, 개수]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+    
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_metric_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_metric_labels(self.labelnames, key)
+            inf_labels = format_metric_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{inf_labels} {count}')
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class RequestMetrics:
+    """요청 전체/단계별 지연 시간 히스토그램과 폴백 카운터 (두 서버가 같은 이름으로 노출)
+    
+    character 라벨은 known_characters에 있는 ID와 'none'만 그대로 쓰고 나머지는 'other'로 묶어,
+    클라이언트가 보낸 임의의 ID로 시계열이 무한히 늘지 않도록 합니다.
+    """
+    
+    def __init__(self, known_characters: Iterable[str]):
+        self.known_characters = frozenset(known_characters)
+        self.request_duration = MetricHistogram(
+            'ai_request_duration_seconds', 'Total request latency',
+            ('endpoint', 'character', 'provider', 'outcome')
+        )
+        self.stage_duration = MetricHistogram(
+            'ai_stage_duration_seconds', 'Latency of each request stage',
+            ('stage', 'character', 'provider', 'outcome')
+        )
+        self.fallback_counter = MetricCounter(
+            'ai_fallback_responses_total', 'Fallback responses returned instead of model output',
+            ('endpoint', 'character')
+        )
+    
+    @property
+    def metrics(self) -> List[Any]:
+        return [self.request_duration, self.stage_duration, self.fallback_counter]
+    
+    def character_label(self, character: str) -> str:
+        return character if character == 'none' or character in self.known_characters else 'other'
+    
+    def observe_stage(self, stage: str, started: float, character: str = 'none', provider: str = 'none', outcome: str = 'success') -> None:
+        """started(time.perf_counter())부터 지금까지를 단계 지연 시간으로 기록"""
+        character = self.character_label(character)
+        self.stage_duration.observe(time.perf_counter() - started, stage=stage, character=character, provider=provider, outcome=outcome)
+    
+    def observe_request(self, endpoint: str, started: float, character: str, provider: str, outcome: str) -> None:
+        """요청 전체 지연 시간 기록 (폴백이면 폴백 카운터도 증가)"""
+        character = self.character_label(character)
+        self.request_duration.observe(time.perf_counter() - started, endpoint=endpoint, character=character, provider=provider, outcome=outcome)
+        if outcome == 'fallback':
+            self.fallback_counter.inc(endpoint=endpoint, character=character)
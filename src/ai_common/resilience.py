@@ -0,0 +1,254 @@
+"""업스트림 장애 대응: 서킷 브레이커, 재시도 예산, 동시 실행 제한, 오류 분류
+
+stats()는 snake_case 키를 반환합니다 (camelCase 응답이 필요하면 camel_case_keys()로 변환).
+"""
+
+import asyncio
+import logging
+import re
+import sys
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 재시도하면 성공할 수 있는 상태 코드와 전송 오류
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+class UpstreamError(Exception):
+    """업스트림(제공자)이 200이 아닌 상태 코드로 응답함"""
+    
+    def __init__(self, status_code: int, retry_after: Optional[float] = None, provider: str = 'Upstream'):
+        super().__init__(f"{provider} API error: {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """서킷 브레이커가 열려 있어 업스트림을 호출하지 않음"""
+
+
+class CircuitBreaker:
+    """제공자별 서킷 브레이커 (closed → open → half_open → closed)
+    
+    연속 실패가 failure_threshold에 도달하거나 429 Retry-After를 받으면 열리고,
+    recovery_timeout(또는 Retry-After) 뒤에 half_open 상태에서 시험 요청 하나만 통과시킵니다.
+    
+    allow()는 거절하면 None, 통과시키면 그 호출이 시험 요청인지 나타내는 값(PROBE / PASS)을 반환하며,
+    결과 없이 끝난 호출은 이 값을 release()에 넘겨 자신이 잡은 시험 슬롯만 반환합니다.
+    """
+    
+    PASS = 'pass'
+    PROBE = 'probe'
+    
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self.open_count = 0
+        self._probe_in_flight = False
+    
+    def allow(self) -> Optional[str]:
+        if self.state == 'open':
+            if time.monotonic() < self.opened_until:
+                return None
+            self.state = 'half_open'
+            self._probe_in_flight = False
+        
+        if self.state == 'half_open':
+            if self._probe_in_flight:
+                return None
+            self._probe_in_flight = True
+            return self.PROBE
+        return self.PASS
+    
+    def record_success(self) -> None:
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self, open_for: Optional[float] = None) -> None:
+        self.consecutive_failures += 1
+        if open_for or self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+            self._open(open_for or self.recovery_timeout)
+    
+    def release(self, permit: Optional[str]) -> None:
+        """결과 없이 끝난(취소된) 호출이 시험 요청이었으면 half_open 시험 슬롯 반환"""
+        if permit == self.PROBE and self.state == 'half_open':
+            self._probe_in_flight = False
+    
+    def _open(self, duration: float) -> None:
+        if self.state != 'open':
+            self.open_count += 1
+            logger.warning(f"🔌 Circuit breaker '{self.name}' opened for {duration:.1f}s")
+        self.state = 'open'
+        self.opened_until = max(self.opened_until, time.monotonic() + duration)
+        self._probe_in_flight = False
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'open_count': self.open_count,
+            'retry_in_seconds': max(0.0, round(self.opened_until - time.monotonic(), 1)) if self.state == 'open' else 0.0
+        }
+
+
+class RetryBudget:
+    """전체 재시도 예산: 요청마다 ratio만큼 적립하고 재시도마다 1씩 사용
+    
+    장애 중 재시도가 업스트림 부하를 증폭하지 않도록 재시도 비율을 요청 수의 ratio 이하로 제한합니다.
+    """
+    
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.retries = 0
+        self.rejected = 0
+    
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+    
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            self.rejected += 1
+            return False
+        self.tokens -= 1
+        self.retries += 1
+        return True
+    
+    def stats(self) -> Dict[str, Any]:
+        return {'tokens': round(self.tokens, 2), 'retries': self.retries, 'rejected': self.rejected}
+
+
+class OverloadedError(Exception):
+    """동시 실행 한도와 대기열이 모두 차서 요청을 받지 않음"""
+    
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"'{name}' is overloaded")
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """동시 실행 수 제한 + 길이가 제한된 대기열
+    
+    limit개까지 바로 실행하고, 나머지는 max_queue개까지 queue_timeout 동안 기다립니다.
+    대기열이 가득 찼거나 대기 시간이 지나면 OverloadedError로 즉시 거절합니다 (모두 함께 타임아웃되는 대신 빨리 실패).
+    """
+    
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+    
+    async def acquire(self) -> None:
+        if self._semaphore is None:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        
+        if not self._semaphore.locked():
+            # 빈 슬롯이 있으면 기다리지 않고 바로 획득
+            await self._semaphore.acquire()
+        elif self.queued >= self.max_queue:
+            self._reject()
+        else:
+            started = time.monotonic()
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject()
+            finally:
+                self.queued -= 1
+            
+            waited = time.monotonic() - started
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        
+        self.in_flight += 1
+        self.admitted += 1
+    
+    def release(self) -> None:
+        self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+    
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+    
+    def _reject(self) -> None:
+        self.rejected += 1
+        raise OverloadedError(self.name, retry_after=max(1.0, self.queue_timeout))
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self.wait_total / self.admitted * 1000, 1) if self.admitted else 0.0,
+            'max_wait_ms': round(self.wait_max * 1000, 1)
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 헤더(초 또는 HTTP 날짜)를 초 단위로 변환"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """업스트림 장애로 볼 오류인지 - 상태 코드 응답, 전송 오류, 타임아웃만 해당
+    
+    스트림 청크 JSON 파싱 실패나 프롬프트 변수 누락 같은 로컬 오류는 브레이커에 반영하지 않음
+    (OpenAI SDK 예외는 status_code 속성 또는 APIConnectionError로 판별)
+    """
+    if isinstance(error, (UpstreamError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if getattr(error, 'status_code', None) is not None:
+        return True
+    # OpenAI SDK가 아직 import되지 않았다면 그 예외일 수도 없음 (오류 분류 때문에 SDK를 불러오지 않도록)
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(error, openai.APIConnectionError)
+
+
+def camel_case_keys(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """stats()의 snake_case 키를 camelCase로 변환 (camelCase JSON을 쓰는 응답용)"""
+    return {
+        re.sub(r'_([a-z])', lambda match: match.group(1).upper(), key): value
+        for key, value in stats.items()
+    }
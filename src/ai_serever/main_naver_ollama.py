@@ -1,29 +1,214 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Literal
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import TYPE_CHECKING, Callable, List, Optional, Dict, Literal, Tuple
 import os
 from dotenv import load_dotenv
 import random
 import logging
 import json
+import re
+import asyncio
+import hashlib
+import math
+import httpx
+import sys
+import time
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 
-# LangChain imports
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain.memory import ConversationBufferWindowMemory
-from langchain_core.runnables import RunnablePassthrough
+from types import SimpleNamespace
+
+# 두 서버가 함께 쓰는 인프라 모듈 (src/ai_common)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_common.keywords import KeywordMatcher  # noqa: E402
+from ai_common.logging_setup import RequestContextMiddleware, setup_logging  # noqa: E402
+from ai_common.metrics import RequestMetrics  # noqa: E402
+from ai_common.resilience import (  # noqa: E402
+    RETRYABLE_STATUS_CODES,
+    RETRYABLE_TRANSPORT_ERRORS,
+    AdmissionLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    OverloadedError,
+    RetryBudget,
+    UpstreamError,
+    is_upstream_failure,
+    parse_retry_after,
+)
+
+# LangChain/OpenAI SDK는 import에 수 초가 걸리므로 langchain_modules()에서 처음 쓸 때(또는 워밍업 때) import
+if TYPE_CHECKING:
+    from langchain.memory import ConversationBufferWindowMemory
+    from langchain_core.messages import BaseMessage
+    from langchain_openai import ChatOpenAI
 
 # 환경 변수 로드
 load_dotenv()
 
-# 로깅 설정
-logging.basicConfig(level=logging.INFO)
+# ==================== 로깅 ====================
+
+# 레벨, 포맷(json/text), 요청별 상세 로그 샘플링 비율, 큐 길이
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+log_handler = setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Wave AI Service", version="1.0.0")
+
+# ==================== 지연 import / 워밍업 ====================
+
+# 시작 직후 백그라운드에서 LangChain import와 체인 생성을 미리 해 둘지 (false면 첫 요청 때 로드)
+WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', 'true').lower() == 'true'
+
+_langchain: Optional[SimpleNamespace] = None
+_langchain_lock = threading.Lock()
+
+
+def langchain_modules() -> SimpleNamespace:
+    """LangChain/OpenAI SDK 클래스 모음 - 처음 호출할 때 한 번만 import (워밍업 스레드와 요청이 겹쳐도 안전)"""
+    global _langchain
+    if _langchain is None:
+        with _langchain_lock:
+            if _langchain is None:
+                started = time.perf_counter()
+                from langchain_openai import ChatOpenAI
+                from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+                from langchain_core.output_parsers import StrOutputParser
+                from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+                from langchain_core.chat_history import BaseChatMessageHistory
+                from langchain.memory import ConversationBufferWindowMemory
+                
+                _langchain = SimpleNamespace(
+                    ChatOpenAI=ChatOpenAI,
+                    ChatPromptTemplate=ChatPromptTemplate,
+                    MessagesPlaceholder=MessagesPlaceholder,
+                    StrOutputParser=StrOutputParser,
+                    HumanMessage=HumanMessage,
+                    AIMessage=AIMessage,
+                    SystemMessage=SystemMessage,
+                    BaseChatMessageHistory=BaseChatMessageHistory,
+                    ConversationBufferWindowMemory=ConversationBufferWindowMemory,
+                )
+                logger.info(f"Loaded LangChain modules in {time.perf_counter() - started:.2f}s")
+    return _langchain
+
+
+async def load_langchain() -> SimpleNamespace:
+    """요청 경로용 langchain_modules() - 아직 import 전이면 스레드에서 기다려 이벤트 루프를 막지 않음
+    
+    워밍업 스레드가 import 중이면 _langchain_lock을 기다리게 되는데, 이를 루프에서 하면
+    /health, /ready를 포함한 모든 요청이 import가 끝날 때까지 멈춥니다.
+    """
+    if _langchain is not None:
+        return _langchain
+    return await asyncio.to_thread(langchain_modules)
+
+
+# /ready 응답 - 워밍업이 끝나면 ready가 True로 바뀜
+readiness: Dict = {"ready": False, "warmup_seconds": None, "steps": {}, "error": None}
+
+
+def warm_up() -> None:
+    """LangChain import, 메모리 클래스 초기화, 제공자 체인 생성을 미리 수행 (단계별 소요 시간 기록)"""
+    def step(name: str, fn) -> None:
+        started = time.perf_counter()
+        fn()
+        readiness["steps"][name] = round(time.perf_counter() - started, 3)
+    
+    started = time.perf_counter()
+    step("langchain_import", langchain_modules)
+    # 첫 인스턴스 생성 때 pydantic 검증기가 만들어지므로 버리는 메모리 하나를 미리 생성
+    step("memory_class", lambda: langchain_modules().ConversationBufferWindowMemory(
+        k=1, return_messages=True, memory_key="chat_history"
+    ))
+    if ai_service.ollama.is_available():
+        step("ollama_chains", lambda: [ai_service.ollama.get_chain(template) for template in CHAIN_TEMPLATES])
+    readiness["warmup_seconds"] = round(time.perf_counter() - started, 3)
+
+
+async def run_warm_up() -> None:
+    """이벤트 루프를 막지 않도록 워밍업을 스레드에서 실행하고, 끝나면 ready로 전환"""
+    try:
+        await asyncio.to_thread(warm_up)
+        logger.info(f"Warm-up finished in {readiness['warmup_seconds']}s: {readiness['steps']}")
+    except Exception as e:
+        # 워밍업 실패는 치명적이지 않음 - 남은 초기화는 첫 사용 때 다시 시도
+        readiness["error"] = str(e)
+        logger.error(f"Warm-up failed: {e}")
+    readiness["ready"] = True
+
+
+def import_time_report(top: int = 15) -> int:
+    """새 프로세스에서 -X importtime으로 이 모듈 import(콜드 스타트)와 warm_up()을 실행하고
+    단계별로 최상위 패키지의 import 시간(self 합계)을 출력"""
+    import subprocess
+    
+    code = (
+        "import sys, main_naver_ollama as service\n"
+        "sys.stderr.write('--- warm-up ---\\n')\n"
+        "service.warm_up()\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        return result.returncode
+    
+    pattern = re.compile(r"import time:\s+(\d+) \|\s+\d+ \|\s+(\S+)")
+    phases: Dict[str, Dict[str, int]] = {"startup": {}, "warm-up": {}}
+    phase = "startup"
+    for line in result.stderr.splitlines():
+        if line.startswith("--- warm-up"):
+            phase = "warm-up"
+            continue
+        match = pattern.match(line)
+        if match:
+            package = match.group(2).split(".")[0]
+            phases[phase][package] = phases[phase].get(package, 0) + int(match.group(1))
+    
+    for phase, packages in phases.items():
+        total = sum(packages.values())
+        print(f"\n{phase}: {total / 1e6:.3f}s in imports")
+        for package, micros in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+            print(f"  {package:<32} {micros / 1e6:>8.3f}s  {micros / total:>6.1%}" if total else f"  {package}")
+    return 0
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """일기 작업 워커와 백그라운드 워밍업 시작, 종료 시 워커와 HTTP 클라이언트 정리 후
+    세션 저장소의 대기 중인 쓰기를 모두 반영"""
+    diary_jobs.start()
+    if WARMUP_ON_STARTUP:
+        warmup_task = asyncio.create_task(run_warm_up())
+    else:
+        warmup_task = None
+        readiness["ready"] = True
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await diary_jobs.stop()
+    await ai_service.hyperclova.aclose()
+    memory_store.close()
+
+
+app = FastAPI(title="Wave AI Service", version="1.0.0", lifespan=lifespan)
+
+app.add_middleware(RequestContextMiddleware, sample_rate=LOG_SAMPLE_RATE)
 
 # CORS 설정
 app.add_middleware(
@@ -46,12 +231,20 @@ class ChatRequest(BaseModel):
     messages: List[Message]
     profile: Dict[str, Optional[str]]
     provider: Literal["hyperclova", "ollama", "auto"] = "auto"  # 제공자 선택
-    use_memory: bool = True  # 메모리 사용 여부
+    use_memory: bool = Field(
+        True,
+        description="대화 메모리 사용 여부. user_id와 X-User-Id 헤더가 모두 없으면 무시되고 메모리 없이 생성됩니다 (응답의 memory_used=false)"
+    )
+    user_id: Optional[str] = Field(
+        None,
+        description="메모리 세션 키. 없으면 X-User-Id 헤더를 사용하고, 둘 다 없으면 메모리를 쓰지 않습니다"
+    )
 
 class ChatResponse(BaseModel):
     content: str
     model_used: str
     memory_used: bool = False
+    hedge_wait_ms: Optional[float] = None  # 헤지 요청을 보내기 전까지 기다린 시간 (보내지 않았으면 None)
 
 class DiaryGenerateRequest(BaseModel):
     messages: List[str]
@@ -61,6 +254,16 @@ class DiaryDraft(BaseModel):
     title: str
     emotion: str
     content: str
+    fallback: bool = False  # 제공자 호출이 모두 실패해 키워드 기반으로 만든 초안
+
+class DiaryJob(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created_at: float
+    finished_at: Optional[float] = None
+    draft: Optional[DiaryDraft] = None  # status가 succeeded일 때만
+    fallback: bool = False  # 폴백 초안으로 끝남 (같은 요청을 다시 제출하면 새 작업으로 재시도)
+    error: Optional[str] = None  # status가 failed일 때만
 
 # ==================== 캐릭터 프롬프트 ====================
 
@@ -72,6 +275,14 @@ CHARACTER_PROMPTS = {
     'char_3': """당신은 '노바'입니다. 침착하고 체계적인 친구로, 사용자의 일정과 계획을 함께 관리하며 실용적인 조언을 제공합니다. 차분하고 논리적인 말투를 사용하세요."""
 }
 
+CHAT_GUIDELINES = """대화할 때:
+1. 짧고 자연스러운 답변을 하세요 (2-3문장)
+2. 사용자의 감정을 인정하고 공감하세요
+3. 필요시 질문으로 대화를 이어가세요
+4. 전문가가 아닌 친구처럼 대화하세요
+5. 사용자의 언어로 응답하세요
+6. 이전 대화 내용을 참고하여 맥락있는 대화를 이어가세요"""
+
 # ==================== 폴백 응답 ====================
 
 FALLBACK_RESPONSES = {
@@ -98,21 +309,675 @@ FALLBACK_RESPONSES = {
     ]
 }
 
+# ==================== 폴백 일기 감정 키워드 ====================
+
+# (감정, 제목, 키워드) - 여러 감정이 감지되면 앞선 감정 우선
+DIARY_EMOTIONS = [
+    ('happy', '기분 좋은 하루', ['좋', '행복', '기쁨', '즐거']),
+    ('sad', '힘들었던 하루', ['힘들', '슬프', '우울', '속상']),
+    ('anxious', '불안했던 하루', ['불안', '걱정', '긴장']),
+    ('calm', '평온한 하루', ['평온', '편안', '차분']),
+    ('excited', '설레는 하루', ['설레', '기대', '신나']),
+    ('tired', '피곤한 하루', ['피곤', '지침', '힘', '졸려']),
+]
+
+DIARY_EMOTION_MATCHER = KeywordMatcher({emotion: keywords for emotion, _, keywords in DIARY_EMOTIONS})
+
 # ==================== 메모리 저장소 ====================
 
-# 사용자별, 캐릭터별 메모리 저장
-memory_store: Dict[str, ConversationBufferWindowMemory] = {}
+class SessionStore(ABC):
+    """get_memory 뒤에 놓이는 세션 저장소 인터페이스 (MEMORY_BACKEND로 선택)"""
+    
+    @staticmethod
+    def make_key(user_id: str, character_id: str) -> str:
+        return f"{user_id}:{character_id}"
+    
+    @abstractmethod
+    def get(self, user_id: str, character_id: str, window_size: int = 10) -> "ConversationBufferWindowMemory":
+        """메모리 가져오기 (없으면 생성)"""
+    
+    @abstractmethod
+    def clear(self, key: str) -> bool:
+        """특정 세션 삭제"""
+    
+    @abstractmethod
+    def items(self) -> List[Tuple[str, "ConversationBufferWindowMemory"]]:
+        """(세션 키, 메모리) 목록"""
+    
+    @abstractmethod
+    def __len__(self) -> int:
+        """세션 수"""
+    
+    @abstractmethod
+    def stats(self) -> Dict:
+        """/health에 표시할 저장소 상태"""
+    
+    def close(self) -> None:
+        """종료 시 정리 (필요한 백엔드만 구현)"""
+
 
-def get_memory(user_id: str, character_id: str, window_size: int = 10) -> ConversationBufferWindowMemory:
-    """사용자와 캐릭터별 메모리 가져오기"""
-    key = f"{user_id}:{character_id}"
-    if key not in memory_store:
-        memory_store[key] = ConversationBufferWindowMemory(
+_memory_history_class = None
+
+
+def memory_chat_message_history(store: "SessionMemoryStore", key: str, entry: list):
+    """메모리 세션용 대화 히스토리 생성 (BaseChatMessageHistory를 상속하므로 클래스는 LangChain import 후 한 번만 정의)"""
+    global _memory_history_class
+    if _memory_history_class is None:
+        class SessionChatMessageHistory(langchain_modules().BaseChatMessageHistory):
+            """프로세스 메모리의 대화 히스토리, 메시지가 추가되면 저장소에 세션 사용을 알림"""
+            
+            def __init__(self, store: "SessionMemoryStore", key: str, entry: list):
+                self.store = store
+                self.key = key
+                self.entry = entry
+                self.messages = []
+            
+            def add_message(self, message: "BaseMessage") -> None:
+                self.messages.append(message)
+                self.store.touch(self.key, self.entry)
+            
+            def clear(self) -> None:
+                self.messages = []
+        
+        _memory_history_class = SessionChatMessageHistory
+    return _memory_history_class(store, key, entry)
+
+
+class SessionMemoryStore(SessionStore):
+    """프로세스 메모리 기반 세션 저장소
+    
+    최대 세션 수, 유휴 TTL, 대략적인 메모리 바이트 예산을 넘으면 가장 오래 사용하지 않은
+    세션부터 제거합니다 (방금 요청된 세션은 제외). 세션 크기는 접근하거나 메시지가 추가될 때마다
+    다시 측정하므로 예산은 근사치입니다. 진행 중인 요청이 쓰던 세션이 그 사이에 제거되었으면
+    저장할 때 다시 등록하므로 그 턴이 사라지지 않습니다 (clear()로 지운 세션은 제외).
+    """
+    
+    # 메시지/세션 객체 자체의 대략적인 오버헤드 (바이트)
+    MESSAGE_OVERHEAD = 400
+    SESSION_OVERHEAD = 2048
+    
+    def __init__(self, max_sessions: int, idle_ttl: float, max_bytes: int):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        # key → [memory, 마지막 접근 시각, 추정 바이트, clear()로 삭제됨], 오래된 접근 순으로 정렬
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+        self._total_bytes = 0
+        self.evictions = {"lru": 0, "ttl": 0, "bytes": 0}
+        self.restored = 0
+    
+    def get(self, user_id: str, character_id: str, window_size: int = 10) -> "ConversationBufferWindowMemory":
+        """메모리 가져오기 (없으면 생성) 및 제한 적용"""
+        key = self.make_key(user_id, character_id)
+        now = time.monotonic()
+        self._evict_expired(now)
+        
+        entry = self._sessions.get(key)
+        if entry is None:
+            entry = [None, now, 0, False]
+            entry[0] = langchain_modules().ConversationBufferWindowMemory(
+                chat_memory=memory_chat_message_history(self, key, entry),
+                k=window_size,
+                return_messages=True,
+                memory_key="chat_history"
+            )
+            self._sessions[key] = entry
+        else:
+            entry[1] = now
+            self._sessions.move_to_end(key)
+        
+        self._remeasure(entry)
+        self._enforce_limits(keep=key)
+        return entry[0]
+    
+    def touch(self, key: str, entry: list) -> None:
+        """메시지가 추가된 세션을 최근 사용으로 표시하고 재측정
+        
+        요청 도중 LRU/TTL/바이트 예산으로 제거되었으면 다시 등록하고, clear()로 지워졌으면 무시합니다.
+        """
+        if self._sessions.get(key) is not entry:
+            if entry[3]:
+                # 사용자가 지운 세션은 진행 중이던 턴이 저장되어도 되살리지 않음
+                return
+            if key in self._sessions:
+                # 제거된 뒤 같은 키로 새 세션이 생겼으면 그 세션을 유지
+                logger.warning(f"Memory session {key} was replaced while in use; dropping the older turn")
+                return
+            logger.info(f"Restored evicted memory session {key}")
+            self._sessions[key] = entry
+            entry[2] = 0  # 제거될 때 _total_bytes에서 이미 뺐음
+            self.restored += 1
+        
+        entry[1] = time.monotonic()
+        self._sessions.move_to_end(key)
+        self._remeasure(entry)
+        self._enforce_limits(keep=key)
+    
+    def _remeasure(self, entry: list) -> None:
+        """윈도우 밖의 오래된 메시지를 버리고 세션 크기 재측정"""
+        memory = entry[0]
+        messages = memory.chat_memory.messages
+        # ConversationBufferWindowMemory는 최근 k턴만 읽으므로 그 이전 메시지는 보관할 필요가 없음
+        if len(messages) > memory.k * 2:
+            del messages[:len(messages) - memory.k * 2]
+        
+        size = self.SESSION_OVERHEAD + sum(
+            sys.getsizeof(message.content) + self.MESSAGE_OVERHEAD for message in messages
+        )
+        self._total_bytes += size - entry[2]
+        entry[2] = size
+    
+    def _evict_expired(self, now: float) -> None:
+        while self._sessions:
+            key, entry = next(iter(self._sessions.items()))
+            if now - entry[1] < self.idle_ttl:
+                break
+            self._evict(key, "ttl")
+    
+    def _enforce_limits(self, keep: str) -> None:
+        """요청된 세션(keep)을 제외하고 가장 오래 사용하지 않은 세션부터 제거"""
+        while len(self._sessions) > self.max_sessions:
+            oldest = next((key for key in self._sessions if key != keep), None)
+            if oldest is None:
+                break
+            self._evict(oldest, "lru")
+        while self._total_bytes > self.max_bytes:
+            oldest = next((key for key in self._sessions if key != keep), None)
+            if oldest is None:
+                break
+            self._evict(oldest, "bytes")
+    
+    def _evict(self, key: str, reason: str) -> None:
+        entry = self._sessions.pop(key)
+        self._total_bytes -= entry[2]
+        self.evictions[reason] += 1
+        logger.info(f"Evicted memory session {key} ({reason})")
+    
+    def clear(self, key: str) -> bool:
+        entry = self._sessions.pop(key, None)
+        if entry is None:
+            return False
+        entry[3] = True
+        self._total_bytes -= entry[2]
+        return True
+    
+    def items(self):
+        return [(key, entry[0]) for key, entry in self._sessions.items()]
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def stats(self) -> Dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "approx_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": dict(self.evictions),
+            "restored": self.restored
+        }
+
+
+_sqlite_history_class = None
+
+
+def sqlite_chat_message_history(store: "SQLiteSessionStore", key: str, messages: List["BaseMessage"]):
+    """SQLite 세션용 대화 히스토리 생성 (BaseChatMessageHistory를 상속하므로 클래스는 LangChain import 후 한 번만 정의)"""
+    global _sqlite_history_class
+    if _sqlite_history_class is None:
+        class SQLiteChatMessageHistory(langchain_modules().BaseChatMessageHistory):
+            """SQLite에서 읽어온 대화 히스토리, 새 메시지는 저장소의 쓰기 큐로 전달"""
+            
+            def __init__(self, store: "SQLiteSessionStore", key: str, messages: List["BaseMessage"]):
+                self.store = store
+                self.key = key
+                self.messages = messages
+            
+            def add_message(self, message: "BaseMessage") -> None:
+                self.messages.append(message)
+                self.store.enqueue(self.key, message)
+            
+            def clear(self) -> None:
+                self.messages = []
+                self.store.clear(self.key)
+        
+        _sqlite_history_class = SQLiteChatMessageHistory
+    return _sqlite_history_class(store, key, messages)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite(WAL) 기반 세션 저장소
+    
+    같은 노드의 여러 uvicorn 워커가 하나의 DB 파일을 공유하고 재시작 후에도 대화가 유지됩니다.
+    save_context와 clear는 작업을 큐에 넣기만 하고, 백그라운드 스레드가 FLUSH_INTERVAL마다
+    (또는 BATCH_SIZE가 차면) 한 트랜잭션으로 묶어 기록합니다. 같은 프로세스에서는 아직
+    기록되지 않은 작업도 읽기에 반영되며, 다른 워커에는 최대 FLUSH_INTERVAL 뒤에 보입니다.
+    
+    다른 워커가 쓰는 동안 BEGIN IMMEDIATE는 busy_timeout까지 기다릴 수 있으므로, 쓰기 스레드는
+    트랜잭션을 락 밖에서 진행하고 COMMIT과 기록 중인 배치(_inflight) 정리만 락 안에서 합니다.
+    이벤트 루프 쪽(get/enqueue/clear)은 WAL 읽기와 리스트 조작만 하므로 쓰기 대기에 묶이지 않습니다.
+    
+    배치 기록이 실패하면(다른 워커가 busy_timeout보다 오래 쓰기 잠금을 잡는 등) 배치를 대기 작업 앞에
+    되돌려 다음 주기에 다시 기록하고, max_write_retries번 연속 실패하면 그 배치를 버리고 dropped_writes에 셉니다.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        idle_ttl: float,
+        keep_messages: int = 40,
+        flush_interval: float = 0.05,
+        batch_size: int = 256,
+        max_write_retries: int = 5
+    ):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.keep_messages = keep_messages
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_write_retries = max_write_retries
+        self.evictions = {"ttl": 0}
+        self.flushed_batches = 0
+        self.write_failures = 0
+        self.dropped_writes = 0
+        self._consecutive_failures = 0
+        
+        self._lock = threading.Lock()
+        # (세션 키, role, content, 시각) - role이 None이면 그 세션 삭제 표시
+        self._pending: List[Tuple[str, Optional[str], str, float]] = []
+        self._inflight: List[Tuple[str, Optional[str], str, float]] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+        
+        self._conn = self._connect()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_key TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_key, id);
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_key TEXT PRIMARY KEY,
+                last_active REAL NOT NULL
+            );
+        """)
+        
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-session-writer", daemon=True)
+        self._writer.start()
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+    
+    def get(self, user_id: str, character_id: str, window_size: int = 10) -> "ConversationBufferWindowMemory":
+        key = self.make_key(user_id, character_id)
+        history = sqlite_chat_message_history(self, key, self._load(key, window_size * 2))
+        return langchain_modules().ConversationBufferWindowMemory(
+            chat_memory=history,
             k=window_size,
             return_messages=True,
             memory_key="chat_history"
         )
-    return memory_store[key]
+    
+    def _load(self, key: str, limit: int) -> List["BaseMessage"]:
+        # COMMIT과 _inflight 정리가 같은 락 안에서 일어나므로, 락 안에서 읽은 DB와
+        # 기록 중/대기 중 작업은 중복이나 누락 없이 이어짐
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session_key = ? ORDER BY id DESC LIMIT ?",
+                (key, limit)
+            ).fetchall()
+            queued = [item for item in self._inflight + self._pending if item[0] == key]
+        
+        rows = rows[::-1]
+        for _, role, content, _ in queued:
+            if role is None:
+                rows = []
+            else:
+                rows.append((role, content))
+        lc = langchain_modules()
+        message_types = {"human": lc.HumanMessage, "ai": lc.AIMessage, "system": lc.SystemMessage}
+        return [message_types.get(role, lc.HumanMessage)(content=content) for role, content in rows[-limit:]]
+    
+    def enqueue(self, key: str, message: "BaseMessage") -> None:
+        with self._lock:
+            self._pending.append((key, message.type, message.content, time.time()))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+    
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self._flush(conn)
+            # 종료 시에는 남은 작업이 모두 기록되거나 재시도 한도로 버려질 때까지 반복
+            while True:
+                failed = self._flush(conn)
+                with self._lock:
+                    if not self._pending:
+                        break
+                if failed:
+                    time.sleep(self.flush_interval)
+        finally:
+            conn.close()
+    
+    def _flush(self, conn: sqlite3.Connection) -> bool:
+        """대기 작업 기록 - 배치 기록에 실패했으면 True"""
+        try:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._inflight = batch
+            if batch:
+                try:
+                    self._write_batch(conn, batch)
+                except sqlite3.Error as e:
+                    self._requeue(batch, e)
+                    return True
+                finally:
+                    with self._lock:
+                        self._inflight = []
+                self._consecutive_failures = 0
+                self.flushed_batches += 1
+            
+            now = time.time()
+            if now - self._last_purge >= 60:
+                self._last_purge = now
+                self._purge_expired(conn, now)
+        except sqlite3.Error as e:
+            logger.error(f"SQLite session store purge failed: {e}")
+        return False
+    
+    def _requeue(self, batch: List[Tuple[str, Optional[str], str, float]], error: sqlite3.Error) -> None:
+        """기록에 실패한 배치를 대기 작업 앞에 되돌림 (연속 실패가 max_write_retries를 넘으면 버림)"""
+        self.write_failures += 1
+        self._consecutive_failures += 1
+        if self._consecutive_failures > self.max_write_retries:
+            self._consecutive_failures = 0
+            self.dropped_writes += len(batch)
+            logger.error(f"SQLite session store dropped {len(batch)} writes after repeated failures: {error}")
+            return
+        
+        logger.warning(
+            f"SQLite session store flush failed, retrying "
+            f"({self._consecutive_failures}/{self.max_write_retries}): {error}"
+        )
+        # _inflight 정리와 같은 락 안에서 되돌려 읽기가 배치를 놓치거나 두 번 보지 않도록
+        with self._lock:
+            self._pending = batch + self._pending
+            self._inflight = []
+    
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple[str, Optional[str], str, float]]) -> None:
+        touched: Dict[str, float] = {}
+        inserts: List[Tuple[str, str, str]] = []
+        
+        # 다른 프로세스가 쓰는 중이면 여기서 busy_timeout까지 대기 (락 밖)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, role, content, created_at in batch:
+                if role is not None:
+                    inserts.append((key, role, content))
+                    touched[key] = max(created_at, touched.get(key, 0.0))
+                    continue
+                # 삭제 표시: 앞서 모은 삽입을 먼저 반영한 뒤 세션 삭제
+                conn.executemany("INSERT INTO messages (session_key, role, content) VALUES (?, ?, ?)", inserts)
+                inserts = []
+                touched.pop(key, None)
+                conn.execute("DELETE FROM messages WHERE session_key = ?", (key,))
+                conn.execute("DELETE FROM sessions WHERE session_key = ?", (key,))
+            conn.executemany("INSERT INTO messages (session_key, role, content) VALUES (?, ?, ?)", inserts)
+            conn.executemany(
+                "INSERT INTO sessions (session_key, last_active) VALUES (?, ?) "
+                "ON CONFLICT(session_key) DO UPDATE SET last_active = MAX(last_active, excluded.last_active)",
+                list(touched.items())
+            )
+            # 윈도우 밖의 오래된 메시지 정리
+            conn.executemany(
+                "DELETE FROM messages WHERE session_key = ? AND id <= ("
+                "SELECT id FROM messages WHERE session_key = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                [(key, key, self.keep_messages) for key in touched]
+            )
+            # 쓰기 잠금을 이미 잡고 있어 COMMIT은 기다리지 않음 - 읽기가 배치를 두 번 보지 않도록 락 안에서
+            with self._lock:
+                conn.execute("COMMIT")
+                self._inflight = []
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def _purge_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        cutoff = now - self.idle_ttl
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM messages WHERE session_key IN (SELECT session_key FROM sessions WHERE last_active < ?)",
+                (cutoff,)
+            )
+            expired = conn.execute("DELETE FROM sessions WHERE last_active < ?", (cutoff,)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.evictions["ttl"] += max(expired, 0)
+    
+    def clear(self, key: str) -> bool:
+        """삭제도 쓰기 큐를 거침 (이벤트 루프에서 DB 쓰기 잠금을 기다리지 않도록)"""
+        existed = bool(self._load(key, 1))
+        with self._lock:
+            self._pending = [item for item in self._pending if item[0] != key]
+            self._pending.append((key, None, "", time.time()))
+        self._wake.set()
+        return existed
+    
+    def _keys(self) -> List[str]:
+        with self._lock:
+            keys = {row[0]: True for row in self._conn.execute("SELECT session_key FROM sessions ORDER BY last_active")}
+            for key, role, _, _ in self._inflight + self._pending:
+                keys.pop(key, None)
+                if role is not None:
+                    keys[key] = True
+        return list(keys)
+    
+    def items(self) -> List[Tuple[str, "ConversationBufferWindowMemory"]]:
+        return [(key, self.get(*key.split(":", 1))) for key in self._keys()]
+    
+    def __len__(self) -> int:
+        return len(self._keys())
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending) + len(self._inflight)
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": len(self),
+            "idle_ttl_seconds": self.idle_ttl,
+            "keep_messages": self.keep_messages,
+            "pending_writes": pending,
+            "flushed_batches": self.flushed_batches,
+            "write_failures": self.write_failures,
+            "dropped_writes": self.dropped_writes,
+            "evictions": dict(self.evictions)
+        }
+    
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._writer.join(timeout=5.0)
+        self._conn.close()
+
+
+def create_session_store() -> SessionStore:
+    """MEMORY_BACKEND 환경 변수에 따라 세션 저장소 생성 (memory | sqlite)"""
+    idle_ttl = float(os.getenv('MEMORY_IDLE_TTL', 3600))
+    backend = os.getenv('MEMORY_BACKEND', 'memory').lower()
+    
+    if backend == 'sqlite':
+        return SQLiteSessionStore(
+            path=os.getenv('MEMORY_SQLITE_PATH', 'wave_memory.db'),
+            idle_ttl=idle_ttl,
+            keep_messages=int(os.getenv('MEMORY_SQLITE_KEEP_MESSAGES', 40)),
+            flush_interval=float(os.getenv('MEMORY_SQLITE_FLUSH_INTERVAL', 0.05))
+        )
+    
+    return SessionMemoryStore(
+        max_sessions=int(os.getenv('MEMORY_MAX_SESSIONS', 1000)),
+        idle_ttl=idle_ttl,
+        max_bytes=int(os.getenv('MEMORY_MAX_BYTES', 64 * 1024 * 1024))
+    )
+
+
+memory_store = create_session_store()
+
+def get_memory(user_id: str, character_id: str, window_size: int = 10) -> "ConversationBufferWindowMemory":
+    """사용자와 캐릭터별 메모리 가져오기"""
+    return memory_store.get(user_id, character_id, window_size)
+
+
+class KeyedLock:
+    """키별 asyncio.Lock (대기/보유 중인 키만 보관)"""
+    
+    def __init__(self):
+        self._locks: Dict[str, list] = {}  # key → [lock, 대기+보유 중인 요청 수]
+    
+    @asynccontextmanager
+    async def hold(self, key: str):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+# 같은 세션의 load → generate → save 순서가 섞이지 않도록 세션별로 직렬화
+session_locks = KeyedLock()
+
+# ==================== 제공자 장애 대응 ====================
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv('BREAKER_RECOVERY_TIMEOUT', 30.0))
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 0.2))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 5.0))
+RETRY_BUDGET_RATIO = float(os.getenv('RETRY_BUDGET_RATIO', 0.2))
+RETRY_BUDGET_MAX = float(os.getenv('RETRY_BUDGET_MAX', 10.0))
+
+# 부하 제어: 동시에 처리할 요청 수 / 제공자별 호출 수와 대기열 길이 (0 이하면 제한 없음)
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 64))
+MAX_QUEUED_REQUESTS = int(os.getenv('MAX_QUEUED_REQUESTS', 128))
+HYPERCLOVA_MAX_CONCURRENCY = int(os.getenv('HYPERCLOVA_MAX_CONCURRENCY', 16))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv('OLLAMA_MAX_CONCURRENCY', 16))
+PROVIDER_MAX_QUEUE = int(os.getenv('PROVIDER_MAX_QUEUE', 32))
+QUEUE_TIMEOUT = float(os.getenv('QUEUE_TIMEOUT', 5.0))
+
+retry_budget = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+
+
+# 엔드포인트 진입(요청 단위) 제한 - 제공자별 호출 제한은 각 제공자의 limiter가 담당
+request_limiter = AdmissionLimiter("requests", MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT)
+
+
+def classify_error(error: Exception) -> Tuple[Optional[int], Optional[float], bool]:
+    """(상태 코드, Retry-After 초, 연결 오류 여부) 추출 - httpx와 OpenAI SDK 예외 모두 처리"""
+    status_code = getattr(error, "status_code", None)
+    retry_after = getattr(error, "retry_after", None)
+    response = getattr(error, "response", None)
+    if retry_after is None and response is not None:
+        retry_after = parse_retry_after(response.headers.get("retry-after"))
+    
+    # OpenAI SDK가 아직 import되지 않았다면 그 예외일 수도 없음 (오류 분류 때문에 SDK를 불러오지 않도록)
+    openai = sys.modules.get("openai")
+    connection_error = isinstance(error, RETRYABLE_TRANSPORT_ERRORS) or (
+        openai is not None
+        and isinstance(error, openai.APIConnectionError)
+        and not isinstance(error, openai.APITimeoutError)
+    )
+    return status_code, retry_after, connection_error
+
+
+async def call_with_resilience(breaker: CircuitBreaker, limiter: AdmissionLimiter, attempt):
+    """호출 슬롯과 서킷 브레이커 확인 후 attempt()를 호출하고, 일시적 오류면 지터 백오프로 재시도
+    
+    호출 슬롯은 시도마다 잡고, 슬롯을 얻지 못하면 OverloadedError로 바로 실패합니다.
+    429 Retry-After는 RETRY_MAX_DELAY 이하일 때만 기다렸다 재시도하고, 브레이커는 그 시간 동안 엽니다.
+    재시도는 전체 retry_budget 안에서만 허용됩니다.
+    """
+    retry_budget.deposit()
+    attempt_number = 0
+    
+    while True:
+        await limiter.acquire()
+        permit = breaker.allow()
+        if not permit:
+            limiter.release()
+            raise CircuitOpenError(f"Circuit breaker '{breaker.name}' is open")
+        
+        attempt_number += 1
+        try:
+            result = await attempt()
+        except Exception as e:
+            limiter.release()
+            status_code, retry_after, connection_error = classify_error(e)
+            if not is_upstream_failure(e):
+                breaker.release(permit)
+                raise
+            if status_code is not None and status_code not in RETRYABLE_STATUS_CODES:
+                # 요청 자체의 문제(4xx)는 제공자 장애가 아님
+                breaker.record_success()
+                raise
+            breaker.record_failure(open_for=retry_after if status_code == 429 else None)
+            
+            if status_code in RETRYABLE_STATUS_CODES:
+                if retry_after is not None:
+                    delay = retry_after if retry_after <= RETRY_MAX_DELAY else None
+                else:
+                    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt_number - 1))))
+            elif connection_error:
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt_number - 1))))
+            else:
+                delay = None
+            
+            if delay is None or attempt_number >= RETRY_MAX_ATTEMPTS or not retry_budget.withdraw():
+                raise
+            
+            logger.info(f"Retrying {breaker.name} in {delay:.2f}s (attempt {attempt_number + 1}/{RETRY_MAX_ATTEMPTS})")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            limiter.release()
+            breaker.release(permit)
+            raise
+        
+        limiter.release()
+        breaker.record_success()
+        return result
+
+# ==================== 메트릭 ====================
+
+# 요청/단계 지연 시간과 폴백 메트릭 - character 라벨은 CHARACTER_PROMPTS의 캐릭터 ID만 그대로 사용
+# 라벨: stage = prompt_build / upstream_generation / diary_generation
+#       provider = hyperclova / ollama / fallback / auto, outcome = success / fallback / error
+request_metrics = RequestMetrics(CHARACTER_PROMPTS)
+observe_stage = request_metrics.observe_stage
+observe_request = request_metrics.observe_request
+metrics_registry = request_metrics.metrics
 
 # ==================== LangChain AI 제공자 ====================
 
@@ -123,19 +988,59 @@ class HyperCLOVALangChain:
         self.api_key = os.getenv('NAVER_CLOVA_API_KEY')
         self.apigw_key = os.getenv('NAVER_CLOVA_APIGW_KEY')
         self.endpoint = 'https://clovastudio.stream.ntruss.com/testapp/v1/chat-completions/HCX-003'
+        self.breaker = CircuitBreaker("hyperclova", BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT)
+        self.limiter = AdmissionLimiter("hyperclova", HYPERCLOVA_MAX_CONCURRENCY, PROVIDER_MAX_QUEUE, QUEUE_TIMEOUT)
+        self._client: Optional[httpx.AsyncClient] = None
     
     def is_available(self) -> bool:
         return bool(self.api_key and self.apigw_key)
     
+    def client(self) -> httpx.AsyncClient:
+        """호출마다 새로 연결하지 않도록 처음 사용할 때 만든 클라이언트를 재사용 (lifespan 종료 시 aclose)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30.0)
+        return self._client
+    
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def post(self, payload: Dict) -> Dict:
+        """Chat Completions 호출 (동시 호출 제한 + 서킷 브레이커 + 재시도), 응답 JSON 반환"""
+        async def attempt() -> Dict:
+            response = await self.client().post(
+                self.endpoint,
+                headers={
+                    'X-NCP-CLOVASTUDIO-API-KEY': self.api_key,
+                    'X-NCP-APIGW-API-KEY': self.apigw_key,
+                    'Content-Type': 'application/json',
+                },
+                json=payload
+            )
+            
+            if response.status_code != 200:
+                error_text = await response.aread()
+                logger.error(f"HyperCLOVA API error: {response.status_code} - {error_text}")
+                raise UpstreamError(
+                    response.status_code,
+                    parse_retry_after(response.headers.get('Retry-After')),
+                    provider="HyperCLOVA"
+                )
+            
+            return response.json()
+        
+        return await call_with_resilience(self.breaker, self.limiter, attempt)
+    
     async def generate_with_memory(
         self,
         system_prompt: str,
+        user_context: str,
         user_message: str,
-        memory: ConversationBufferWindowMemory
+        memory: "ConversationBufferWindowMemory",
+        save_memory: bool = True
     ) -> str:
-        """메모리를 활용한 대화 생성"""
-        import httpx
-        
+        """메모리를 활용한 대화 생성 (save_memory=False면 읽기만 하고 저장은 호출자가 담당)"""
         if not self.is_available():
             raise ValueError("HyperCLOVA credentials not configured")
         
@@ -143,53 +1048,65 @@ class HyperCLOVALangChain:
         chat_history = memory.load_memory_variables({}).get("chat_history", [])
         
         # 메시지 구성
-        messages = [{"role": "system", "content": system_prompt}]
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": user_context}
+        ]
         
         # 이전 대화 추가
         for msg in chat_history:
-            if isinstance(msg, HumanMessage):
+            if msg.type == "human":
                 messages.append({"role": "user", "content": msg.content})
-            elif isinstance(msg, AIMessage):
+            elif msg.type == "ai":
                 messages.append({"role": "assistant", "content": msg.content})
         
         # 현재 사용자 메시지 추가
         messages.append({"role": "user", "content": user_message})
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                self.endpoint,
-                headers={
-                    'X-NCP-CLOVASTUDIO-API-KEY': self.api_key,
-                    'X-NCP-APIGW-API-KEY': self.apigw_key,
-                    'Content-Type': 'application/json',
-                },
-                json={
-                    'messages': messages,
-                    'topP': 0.8,
-                    'topK': 0,
-                    'maxTokens': 256,
-                    'temperature': 0.7,
-                    'repeatPenalty': 5.0,
-                    'stopBefore': [],
-                    'includeAiFilters': True
-                }
-            )
-            
-            if response.status_code != 200:
-                error_text = await response.aread()
-                logger.error(f"HyperCLOVA API error: {response.status_code} - {error_text}")
-                raise Exception(f"HyperCLOVA API error: {response.status_code}")
-            
-            data = response.json()
-            ai_response = data.get('result', {}).get('message', {}).get('content', '')
-            
-            # 메모리에 대화 저장
+        data = await self.post({
+            'messages': messages,
+            'topP': 0.8,
+            'topK': 0,
+            'maxTokens': 256,
+            'temperature': 0.7,
+            'repeatPenalty': 5.0,
+            'stopBefore': [],
+            'includeAiFilters': True
+        })
+        ai_response = data.get('result', {}).get('message', {}).get('content', '')
+        
+        # 메모리에 대화 저장
+        if save_memory:
             memory.save_context(
                 {"input": user_message},
                 {"output": ai_response}
             )
-            
-            return ai_response
+        
+        return ai_response
+
+
+# 시스템 프롬프트는 변수로 넘겨서 템플릿과 체인을 재사용
+# (프롬프트 안의 JSON 중괄호가 템플릿 변수로 해석되지 않는 효과도 있음)
+# 캐릭터별 고정 프롬프트 뒤에 사용자 정보를 별도 메시지로 두어 접두어가 사용자 간에 동일하게 유지됨
+# 문자열 항목은 같은 이름의 MessagesPlaceholder (LangChain을 import하기 전에도 정의할 수 있도록)
+CHAIN_TEMPLATES = {
+    "memory": [
+        ("system", "{system_prompt}"),
+        ("system", "{user_context}"),
+        "chat_history",
+        ("human", "{input}")
+    ],
+    "simple": [
+        ("system", "{system_prompt}"),
+        ("system", "{user_context}"),
+        ("human", "{input}")
+    ],
+    # 일기 생성은 사용자 프로필 컨텍스트 없이 대화 내용만 사용
+    "diary": [
+        ("system", "{system_prompt}"),
+        ("human", "{input}")
+    ],
+}
 
 
 class OllamaLangChain:
@@ -199,85 +1116,140 @@ class OllamaLangChain:
         self.api_key = os.getenv('OLLAMA_CLOUD_API_KEY')
         self.base_url = os.getenv('OLLAMA_CLOUD_BASE_URL', 'https://api.ollama.ai/v1')
         self.model_name = os.getenv('OLLAMA_MODEL', 'llama3.1')
+        self.breaker = CircuitBreaker("ollama", BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT)
+        self.limiter = AdmissionLimiter("ollama", OLLAMA_MAX_CONCURRENCY, PROVIDER_MAX_QUEUE, QUEUE_TIMEOUT)
+        self._llms: Dict[Tuple, "ChatOpenAI"] = {}
+        self._chains: Dict[str, object] = {}
     
     def is_available(self) -> bool:
         return bool(self.api_key)
     
-    def get_llm(self):
-        """LangChain ChatOpenAI 인스턴스 생성 (Ollama 호환)"""
-        return ChatOpenAI(
-            model=self.model_name,
-            temperature=0.8,
-            max_tokens=150,
-            openai_api_key=self.api_key,
-            openai_api_base=self.base_url
-        )
+    def get_llm(self, temperature: float = 0.8, max_tokens: int = 150):
+        """LangChain ChatOpenAI 인스턴스 반환 (Ollama 호환, 모델/생성 파라미터별로 재사용)"""
+        key = (self.model_name, temperature, max_tokens)
+        llm = self._llms.get(key)
+        if llm is None:
+            llm = langchain_modules().ChatOpenAI(
+                model=self.model_name,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                openai_api_key=self.api_key,
+                openai_api_base=self.base_url,
+                max_retries=0  # 재시도는 call_with_resilience가 재시도 예산 안에서 담당
+            )
+            self._llms[key] = llm
+        return llm
+    
+    def get_chain(self, template: str):
+        """CHAIN_TEMPLATES의 템플릿으로 만든 prompt | llm | parser 체인 반환 (템플릿별로 재사용)"""
+        chain = self._chains.get(template)
+        if chain is None:
+            lc = langchain_modules()
+            prompt = lc.ChatPromptTemplate.from_messages([
+                lc.MessagesPlaceholder(variable_name=message) if isinstance(message, str) else message
+                for message in CHAIN_TEMPLATES[template]
+            ])
+            chain = prompt | self.get_llm() | lc.StrOutputParser()
+            self._chains[template] = chain
+        return chain
+    
+    async def invoke(self, chain, inputs: Dict) -> str:
+        """체인 실행 (동시 호출 제한 + 서킷 브레이커 + 재시도)"""
+        return await call_with_resilience(self.breaker, self.limiter, lambda: chain.ainvoke(inputs))
     
     async def generate_with_memory(
         self,
         system_prompt: str,
+        user_context: str,
         user_message: str,
-        memory: ConversationBufferWindowMemory
+        memory: "ConversationBufferWindowMemory",
+        save_memory: bool = True
     ) -> str:
-        """LangChain 체인을 사용한 메모리 기반 대화"""
+        """LangChain 체인을 사용한 메모리 기반 대화 (save_memory=False면 저장은 호출자가 담당)"""
         if not self.is_available():
             raise ValueError("Ollama credentials not configured")
         
-        llm = self.get_llm()
-        
-        # 프롬프트 템플릿 구성
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}")
-        ])
-        
-        # 체인 구성
-        chain = (
-            RunnablePassthrough.assign(
-                chat_history=lambda x: memory.load_memory_variables({})["chat_history"]
-            )
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
-        
         # 응답 생성
-        response = await chain.ainvoke({"input": user_message})
+        response = await self.invoke(self.get_chain("memory"), {
+            "system_prompt": system_prompt,
+            "user_context": user_context,
+            "chat_history": memory.load_memory_variables({})["chat_history"],
+            "input": user_message
+        })
         
         # 메모리에 저장
-        memory.save_context(
-            {"input": user_message},
-            {"output": response}
-        )
+        if save_memory:
+            memory.save_context(
+                {"input": user_message},
+                {"output": response}
+            )
         
         return response
 
 
+class LatencyTracker:
+    """최근 응답 시간(초) 기록 및 백분위 계산"""
+    
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+    
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+    
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+# auto 모드 헤지 설정: 1차 제공자가 p95 지연 안에 응답하지 않으면 2차 제공자에도 요청
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'true').lower() == 'true'
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', 3.0))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 0.5))
+HEDGE_MAX_DELAY = float(os.getenv('HEDGE_MAX_DELAY', 10.0))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 20))
+
+
 class AIService:
     """AI 서비스 통합 클래스"""
     
     def __init__(self):
         self.hyperclova = HyperCLOVALangChain()
         self.ollama = OllamaLangChain()
+        self.primary_latency = LatencyTracker()
+        self.hedge_stats = {"requests": 0, "hedged": 0, "wins": {"hyperclova": 0, "ollama": 0}}
+        self._system_prompts: Dict[str, str] = {}
+    
+    def hedge_delay(self) -> float:
+        """1차 제공자(HyperCLOVA) 최근 응답 시간의 p95, 표본이 적으면 기본값"""
+        p95 = self.primary_latency.percentile(0.95) if len(self.primary_latency) >= HEDGE_MIN_SAMPLES else None
+        delay = p95 if p95 is not None else HEDGE_DEFAULT_DELAY
+        return min(max(delay, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
     
-    def build_system_prompt(self, character_id: str, profile: Dict) -> str:
-        base_prompt = CHARACTER_PROMPTS.get(character_id, CHARACTER_PROMPTS['char_1'])
+    def build_system_prompt(self, character_id: str) -> str:
+        """캐릭터 프롬프트 + 대화 지침 (캐릭터별로 한 번만 생성)
         
-        return f"""{base_prompt}
-
-사용자 정보:
+        사용자 정보는 넣지 않으므로 모든 사용자의 요청이 같은 접두어로 시작하고,
+        제공자의 프롬프트 접두어(KV) 캐시가 적중할 수 있습니다.
+        """
+        if character_id not in CHARACTER_PROMPTS:
+            character_id = 'char_1'
+        prompt = self._system_prompts.get(character_id)
+        if prompt is None:
+            prompt = f"{CHARACTER_PROMPTS[character_id]}\n\n{CHAT_GUIDELINES}"
+            self._system_prompts[character_id] = prompt
+        return prompt
+    
+    def build_user_context(self, profile: Dict) -> str:
+        """요청마다 달라지는 사용자 정보 메시지 (고정 시스템 프롬프트 뒤에 별도로 전달)"""
+        return f"""사용자 정보:
 - 닉네임: {profile.get('nickname', '익명')}
 - AI가 알면 좋은 정보: {profile.get('aiInfo', '없음')}
-- 언어: {profile.get('locale', 'ko-KR')}
-
-대화할 때:
-1. 짧고 자연스러운 답변을 하세요 (2-3문장)
-2. 사용자의 감정을 인정하고 공감하세요
-3. 필요시 질문으로 대화를 이어가세요
-4. 전문가가 아닌 친구처럼 대화하세요
-5. 사용자의 언어로 응답하세요
-6. 이전 대화 내용을 참고하여 맥락있는 대화를 이어가세요"""
+- 언어: {profile.get('locale', 'ko-KR')}"""
     
     async def generate_response(
         self,
@@ -286,11 +1258,40 @@ class AIService:
         profile: Dict,
         provider: str = "auto",
         use_memory: bool = True,
-        user_id: str = "default"
+        user_id: Optional[str] = None
     ) -> ChatResponse:
-        """AI 응답 생성 (제공자 선택 가능)"""
+        """AI 응답 생성 (제공자 선택 가능)
         
-        system_prompt = self.build_system_prompt(character_id, profile)
+        메모리를 사용하면 같은 (user_id, character_id) 세션의 요청은 하나씩 처리됩니다.
+        user_id가 없으면 다른 사용자와 메모리가 섞이지 않도록 메모리 없이 생성합니다.
+        """
+        if use_memory and not user_id:
+            logger.warning(
+                "No user_id or X-User-Id header provided, generating without memory",
+                extra={"character": character_id}
+            )
+            use_memory = False
+        
+        if not use_memory:
+            return await self._generate(character_id, messages, profile, provider, False, None)
+        
+        async with session_locks.hold(SessionStore.make_key(user_id, character_id)):
+            return await self._generate(character_id, messages, profile, provider, True, user_id)
+    
+    async def _generate(
+        self,
+        character_id: str,
+        messages: List[Message],
+        profile: Dict,
+        provider: str,
+        use_memory: bool,
+        user_id: Optional[str]
+    ) -> ChatResponse:
+        """메모리 로드 → 제공자 호출 → 메모리 저장"""
+        started = time.perf_counter()
+        system_prompt = self.build_system_prompt(character_id)
+        user_context = self.build_user_context(profile)
+        observe_stage("prompt_build", started, character_id, provider)
         
         # 마지막 사용자 메시지 추출
         user_message = ""
@@ -316,67 +1317,141 @@ class AIService:
         
         # 제공자별 처리
         if provider == "hyperclova":
-            return await self._try_hyperclova(system_prompt, user_message, memory, use_memory)
+            return await self._try_hyperclova(system_prompt, user_context, user_message, memory, use_memory, character_id=character_id)
         elif provider == "ollama":
-            return await self._try_ollama(system_prompt, user_message, memory, use_memory)
+            return await self._try_ollama(system_prompt, user_context, user_message, memory, use_memory, character_id=character_id)
         else:  # auto
+            # 두 제공자 모두 사용 가능하면 헤지 요청
+            if HEDGE_ENABLED and self.hyperclova.is_available() and self.ollama.is_available():
+                try:
+                    return await self._generate_hedged(system_prompt, user_context, user_message, memory, use_memory, character_id)
+                except Exception as e:
+                    logger.error(f"Hedged generation failed: {e}")
+                return self._get_fallback_response(character_id)
+            
             # HyperCLOVA 먼저 시도
             if self.hyperclova.is_available():
                 try:
-                    return await self._try_hyperclova(system_prompt, user_message, memory, use_memory)
+                    return await self._try_hyperclova(system_prompt, user_context, user_message, memory, use_memory, character_id=character_id)
                 except Exception as e:
                     logger.error(f"HyperCLOVA failed: {e}")
             
             # Ollama 시도
             if self.ollama.is_available():
                 try:
-                    return await self._try_ollama(system_prompt, user_message, memory, use_memory)
+                    return await self._try_ollama(system_prompt, user_context, user_message, memory, use_memory, character_id=character_id)
                 except Exception as e:
                     logger.error(f"Ollama failed: {e}")
             
             # 폴백
             return self._get_fallback_response(character_id)
     
+    async def _generate_hedged(
+        self,
+        system_prompt: str,
+        user_context: str,
+        user_message: str,
+        memory: Optional["ConversationBufferWindowMemory"],
+        use_memory: bool,
+        character_id: str
+    ) -> ChatResponse:
+        """HyperCLOVA에 먼저 요청하고, hedge_delay() 안에 응답이 없거나 실패하면 Ollama에도 요청
+        
+        먼저 성공한 응답을 반환하고 나머지 요청은 취소합니다. 두 요청이 같은 메모리에
+        중복 저장하지 않도록 제공자는 읽기만 하고, 저장은 승자 응답으로 한 번만 합니다.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        delay = self.hedge_delay()
+        self.hedge_stats["requests"] += 1
+        
+        async def timed_primary() -> ChatResponse:
+            response = await self._try_hyperclova(
+                system_prompt, user_context, user_message, memory, use_memory, save_memory=False, character_id=character_id
+            )
+            self.primary_latency.record(loop.time() - started)
+            return response
+        
+        primary = asyncio.create_task(timed_primary())
+        tasks = {primary: "hyperclova"}
+        hedge_wait_ms = None
+        
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done or primary.exception() is not None:
+                hedge_wait_ms = round((loop.time() - started) * 1000, 1)
+                logger.info(f"Hedging to Ollama after {hedge_wait_ms}ms")
+                self.hedge_stats["hedged"] += 1
+                secondary = asyncio.create_task(
+                    self._try_ollama(system_prompt, user_context, user_message, memory, use_memory, save_memory=False, character_id=character_id)
+                )
+                tasks[secondary] = "ollama"
+            
+            errors = []
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(f"{tasks[task]}: {task.exception()}")
+                        continue
+                    
+                    response = task.result()
+                    response.hedge_wait_ms = hedge_wait_ms
+                    self.hedge_stats["wins"][tasks[task]] += 1
+                    if use_memory and memory:
+                        memory.save_context({"input": user_message}, {"output": response.content})
+                    return response
+            
+            raise Exception("All hedged providers failed: " + "; ".join(errors))
+        finally:
+            # 취소되는 1차 요청은 지금까지의 경과 시간을 하한값으로 기록 (p95가 낮게 치우치지 않도록)
+            if not primary.done():
+                self.primary_latency.record(loop.time() - started)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
     async def _try_hyperclova(
         self,
         system_prompt: str,
+        user_context: str,
         user_message: str,
-        memory: Optional[ConversationBufferWindowMemory],
-        use_memory: bool
+        memory: Optional["ConversationBufferWindowMemory"],
+        use_memory: bool,
+        save_memory: bool = True,
+        character_id: str = "none"
     ) -> ChatResponse:
         """HyperCLOVA 시도"""
-        logger.info("Trying HyperCLOVA...")
+        logger.info("Trying HyperCLOVA...", extra={"verbose": True})
+        started = time.perf_counter()
         
-        if use_memory and memory:
-            content = await self.hyperclova.generate_with_memory(
-                system_prompt, user_message, memory
-            )
-        else:
-            # 메모리 없이 단순 생성
-            import httpx
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.hyperclova.endpoint,
-                    headers={
-                        'X-NCP-CLOVASTUDIO-API-KEY': self.hyperclova.api_key,
-                        'X-NCP-APIGW-API-KEY': self.hyperclova.apigw_key,
-                        'Content-Type': 'application/json',
-                    },
-                    json={
-                        'messages': [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_message}
-                        ],
-                        'topP': 0.8,
-                        'maxTokens': 256,
-                        'temperature': 0.7
-                    }
+        try:
+            if use_memory and memory:
+                content = await self.hyperclova.generate_with_memory(
+                    system_prompt, user_context, user_message, memory, save_memory
                 )
-                data = response.json()
+            else:
+                # 메모리 없이 단순 생성
+                data = await self.hyperclova.post({
+                    'messages': [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "system", "content": user_context},
+                        {"role": "user", "content": user_message}
+                    ],
+                    'topP': 0.8,
+                    'maxTokens': 256,
+                    'temperature': 0.7
+                })
                 content = data.get('result', {}).get('message', {}).get('content', '')
+        except Exception:
+            observe_stage("upstream_generation", started, character_id, "hyperclova", "error")
+            raise
         
-        if content and content.strip():
-            logger.info("HyperCLOVA response successful")
+        succeeded = bool(content and content.strip())
+        observe_stage("upstream_generation", started, character_id, "hyperclova", "success" if succeeded else "error")
+        if succeeded:
+            logger.info("HyperCLOVA response successful", extra={"verbose": True})
             return ChatResponse(
                 content=content.strip(),
                 model_used="hyperclova",
@@ -387,29 +1462,37 @@ class AIService:
     async def _try_ollama(
         self,
         system_prompt: str,
+        user_context: str,
         user_message: str,
-        memory: Optional[ConversationBufferWindowMemory],
-        use_memory: bool
+        memory: Optional["ConversationBufferWindowMemory"],
+        use_memory: bool,
+        save_memory: bool = True,
+        character_id: str = "none"
     ) -> ChatResponse:
         """Ollama 시도"""
-        logger.info("Trying Ollama Cloud...")
+        logger.info("Trying Ollama Cloud...", extra={"verbose": True})
+        started = time.perf_counter()
         
-        if use_memory and memory:
-            content = await self.ollama.generate_with_memory(
-                system_prompt, user_message, memory
-            )
-        else:
-            # 메모리 없이 단순 생성
-            llm = self.ollama.get_llm()
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", system_prompt),
-                ("human", "{input}")
-            ])
-            chain = prompt | llm | StrOutputParser()
-            content = await chain.ainvoke({"input": user_message})
+        try:
+            if use_memory and memory:
+                content = await self.ollama.generate_with_memory(
+                    system_prompt, user_context, user_message, memory, save_memory
+                )
+            else:
+                # 메모리 없이 단순 생성
+                content = await self.ollama.invoke(self.ollama.get_chain("simple"), {
+                    "system_prompt": system_prompt,
+                    "user_context": user_context,
+                    "input": user_message
+                })
+        except Exception:
+            observe_stage("upstream_generation", started, character_id, "ollama", "error")
+            raise
         
-        if content and content.strip():
-            logger.info("Ollama response successful")
+        succeeded = bool(content and content.strip())
+        observe_stage("upstream_generation", started, character_id, "ollama", "success" if succeeded else "error")
+        if succeeded:
+            logger.info("Ollama response successful", extra={"verbose": True})
             return ChatResponse(
                 content=content.strip(),
                 model_used="ollama",
@@ -433,7 +1516,7 @@ class AIService:
         messages: List[str],
         provider: str = "auto"
     ) -> DiaryDraft:
-        """일기 초안 생성"""
+        """일기 초안 생성 (provider를 직접 지정했는데 호출 대기열이 가득 차면 OverloadedError)"""
         if not messages:
             return DiaryDraft(
                 title="오늘의 하루",
@@ -453,102 +1536,283 @@ class AIService:
         
         # 제공자별 처리
         if provider == "hyperclova" or (provider == "auto" and self.hyperclova.is_available()):
+            started = time.perf_counter()
             try:
                 draft = await self._generate_diary_hyperclova(system_prompt, user_content)
                 if draft:
+                    observe_stage("diary_generation", started, provider="hyperclova")
                     return draft
+            except OverloadedError:
+                # 제공자를 직접 지정했으면 폴백 대신 429로 재시도를 유도
+                if provider != "auto":
+                    raise
+                logger.warning("HyperCLOVA diary generation skipped: call queue is full")
             except Exception as e:
                 logger.error(f"HyperCLOVA diary generation failed: {e}")
+            observe_stage("diary_generation", started, provider="hyperclova", outcome="error")
         
         if provider == "ollama" or (provider == "auto" and self.ollama.is_available()):
+            started = time.perf_counter()
             try:
                 draft = await self._generate_diary_ollama(system_prompt, user_content)
                 if draft:
+                    observe_stage("diary_generation", started, provider="ollama")
                     return draft
+            except OverloadedError:
+                # 제공자를 직접 지정했으면 폴백 대신 429로 재시도를 유도
+                if provider != "auto":
+                    raise
+                logger.warning("Ollama diary generation skipped: call queue is full")
             except Exception as e:
                 logger.error(f"Ollama diary generation failed: {e}")
+            observe_stage("diary_generation", started, provider="ollama", outcome="error")
         
         # 폴백
+        request_metrics.fallback_counter.inc(endpoint="/diary/generate", character="none")
         return self._generate_fallback_diary(messages)
     
     async def _generate_diary_hyperclova(self, system_prompt: str, user_content: str) -> Optional[DiaryDraft]:
         """HyperCLOVA로 일기 생성"""
-        import httpx
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                self.hyperclova.endpoint,
-                headers={
-                    'X-NCP-CLOVASTUDIO-API-KEY': self.hyperclova.api_key,
-                    'X-NCP-APIGW-API-KEY': self.hyperclova.apigw_key,
-                    'Content-Type': 'application/json',
-                },
-                json={
-                    'messages': [
-                        {'role': 'system', 'content': system_prompt},
-                        {'role': 'user', 'content': user_content}
-                    ],
-                    'topP': 0.8,
-                    'maxTokens': 512,
-                    'temperature': 0.7
-                }
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                content = data.get('result', {}).get('message', {}).get('content', '')
-                draft_data = json.loads(content)
-                return DiaryDraft(**draft_data)
-        return None
+        data = await self.hyperclova.post({
+            'messages': [
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': user_content}
+            ],
+            'topP': 0.8,
+            'maxTokens': 512,
+            'temperature': 0.7
+        })
+        content = data.get('result', {}).get('message', {}).get('content', '')
+        draft_data = json.loads(content)
+        return DiaryDraft(**draft_data)
     
     async def _generate_diary_ollama(self, system_prompt: str, user_content: str) -> Optional[DiaryDraft]:
         """Ollama로 일기 생성"""
-        llm = self.ollama.get_llm()
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", "{input}")
-        ])
-        chain = prompt | llm | StrOutputParser()
-        result = await chain.ainvoke({"input": user_content})
+        result = await self.ollama.invoke(self.ollama.get_chain("diary"), {
+            "system_prompt": system_prompt,
+            "input": user_content
+        })
         draft_data = json.loads(result)
         return DiaryDraft(**draft_data)
     
     def _generate_fallback_diary(self, messages: List[str]) -> DiaryDraft:
         """폴백 일기 생성"""
-        all_text = ' '.join(messages).lower()
+        all_text = ' '.join(messages)
         
         emotion = 'neutral'
         title = '오늘의 하루'
         
-        if any(word in all_text for word in ['좋', '행복', '기쁨', '즐거']):
-            emotion = 'happy'
-            title = '기분 좋은 하루'
-        elif any(word in all_text for word in ['힘들', '슬프', '우울', '속상']):
-            emotion = 'sad'
-            title = '힘들었던 하루'
-        elif any(word in all_text for word in ['불안', '걱정', '긴장']):
-            emotion = 'anxious'
-            title = '불안했던 하루'
-        elif any(word in all_text for word in ['평온', '편안', '차분']):
-            emotion = 'calm'
-            title = '평온한 하루'
-        elif any(word in all_text for word in ['설레', '기대', '신나']):
-            emotion = 'excited'
-            title = '설레는 하루'
-        elif any(word in all_text for word in ['피곤', '지침', '힘', '졸려']):
-            emotion = 'tired'
-            title = '피곤한 하루'
+        hits = DIARY_EMOTION_MATCHER.count(all_text)
+        for candidate, candidate_title, _ in DIARY_EMOTIONS:
+            if hits[candidate]:
+                emotion = candidate
+                title = candidate_title
+                break
         
         content = ' '.join(messages[:3])[:150]
         if len(' '.join(messages)) > 150:
             content += '...'
         
-        return DiaryDraft(title=title, emotion=emotion, content=content)
+        return DiaryDraft(title=title, emotion=emotion, content=content, fallback=True)
 
 
 # AI 서비스 인스턴스
 ai_service = AIService()
 
+# ==================== 일기 요청 병합 ====================
+
+class SingleFlight:
+    """같은 키의 동시 요청은 한 번의 실행을 공유하고, 성공한 결과는 result_ttl 동안 재사용
+    
+    cacheable이 False를 돌려주는 결과(폴백 등)는 동시 호출자끼리만 공유하고 저장하지 않음
+    """
+    
+    def __init__(self, result_ttl: float, max_results: int, cacheable: Optional[Callable[[object], bool]] = None):
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.cacheable = cacheable
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._results: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self.stats_counts = {"executed": 0, "coalesced": 0, "cache_hits": 0, "not_cached": 0}
+    
+    async def do(self, key: str, fn):
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._results.move_to_end(key)
+                self.stats_counts["cache_hits"] += 1
+                return cached[1]
+            del self._results[key]
+        
+        task = self._in_flight.get(key)
+        if task is None:
+            self.stats_counts["executed"] += 1
+            task = asyncio.create_task(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        else:
+            self.stats_counts["coalesced"] += 1
+        
+        # 한 호출자가 취소되어도 다른 호출자가 기다리는 실행은 계속되도록 shield
+        return await asyncio.shield(task)
+    
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or self.result_ttl <= 0:
+            return
+        if self.cacheable is not None and not self.cacheable(task.result()):
+            self.stats_counts["not_cached"] += 1
+            return
+        self._results[key] = (time.monotonic() + self.result_ttl, task.result())
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+    
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "cached_results": len(self._results),
+            "result_ttl_seconds": self.result_ttl,
+            **self.stats_counts
+        }
+
+
+def diary_request_key(messages: List[str], provider: str) -> str:
+    """(메시지, 제공자) 해시 - 같은 내용의 일기 요청을 식별"""
+    payload = json.dumps([messages, provider], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# 중복 탭과 Supabase 함수 재시도가 같은 일기를 여러 번 생성하지 않도록 병합
+# (폴백 초안은 재시도 때 제공자를 다시 시도하도록 캐시하지 않음)
+diary_flights = SingleFlight(
+    result_ttl=float(os.getenv('DIARY_RESULT_TTL', 60)),
+    max_results=int(os.getenv('DIARY_RESULT_CACHE_SIZE', 256)),
+    cacheable=lambda draft: not draft.fallback
+)
+
+# ==================== 일기 생성 작업 ====================
+
+class DiaryJobQueue:
+    """비동기 일기 생성 작업 - 제한된 수의 워커가 대기열의 작업을 처리
+    
+    같은 (메시지, 제공자)의 작업이 대기 중이거나 완료되어 보관 중이면 새 작업 대신 기존 작업을 반환합니다
+    (실패했거나 폴백 초안으로 끝난 작업은 제외).
+    대기열이 가득 차면 OverloadedError를 발생시킵니다. 완료된 작업은 result_ttl 동안 조회할 수 있습니다.
+    실제 생성은 diary_flights를 거치므로 /diary/generate의 같은 요청과도 한 번만 실행됩니다.
+    """
+    
+    def __init__(self, workers: int, max_queue: int, result_ttl: float, max_jobs: int, retry_after: float):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.max_jobs = max_jobs
+        self.retry_after = retry_after
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: "OrderedDict[str, DiaryJob]" = OrderedDict()
+        self._job_keys: Dict[str, str] = {}  # 작업 ID → 요청 키
+        self._by_key: Dict[str, str] = {}  # 요청 키 → 작업 ID
+        self.running = 0
+        self.stats_counts = {"submitted": 0, "deduplicated": 0, "rejected": 0, "succeeded": 0, "fallback": 0, "failed": 0}
+    
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def submit(self, request: DiaryGenerateRequest) -> DiaryJob:
+        self._expire()
+        key = diary_request_key(request.messages, request.provider)
+        existing = self._jobs.get(self._by_key.get(key, ""))
+        if existing is not None and existing.status != "failed" and not existing.fallback:
+            self.stats_counts["deduplicated"] += 1
+            return existing
+        
+        if self._queue is None or self._queue.full():
+            self.stats_counts["rejected"] += 1
+            raise OverloadedError("diary_jobs", self.retry_after)
+        
+        job = DiaryJob(job_id=uuid.uuid4().hex, status="queued", created_at=time.time())
+        self._jobs[job.job_id] = job
+        self._job_keys[job.job_id] = key
+        self._by_key[key] = job.job_id
+        self._queue.put_nowait((job, key, request))
+        self.stats_counts["submitted"] += 1
+        return job
+    
+    def get(self, job_id: str) -> Optional[DiaryJob]:
+        self._expire()
+        return self._jobs.get(job_id)
+    
+    async def _worker(self) -> None:
+        while True:
+            job, key, request = await self._queue.get()
+            job.status = "running"
+            self.running += 1
+            try:
+                await load_langchain()
+                job.draft = await diary_flights.do(
+                    key,
+                    lambda: ai_service.generate_diary_draft(request.messages, provider=request.provider)
+                )
+                job.fallback = job.draft.fallback
+                job.status = "succeeded"
+                self.stats_counts["succeeded"] += 1
+                if job.fallback:
+                    self.stats_counts["fallback"] += 1
+            except Exception as e:
+                logger.error(f"Diary job {job.job_id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+                self.stats_counts["failed"] += 1
+            finally:
+                job.finished_at = time.time()
+                self.running -= 1
+                self._queue.task_done()
+    
+    def _expire(self) -> None:
+        """보관 기간이 지났거나 보관 한도를 넘은 완료 작업 정리 (대기/실행 중인 작업은 유지)"""
+        cutoff = time.time() - self.result_ttl
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None
+        ]
+        overflow = len(self._jobs) - self.max_jobs
+        for job_id in finished:
+            job = self._jobs[job_id]
+            if job.finished_at >= cutoff and overflow <= 0:
+                continue
+            del self._jobs[job_id]
+            key = self._job_keys.pop(job_id, None)
+            if key is not None and self._by_key.get(key) == job_id:
+                del self._by_key[key]
+            overflow -= 1
+    
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "retained_jobs": len(self._jobs),
+            **self.stats_counts
+        }
+
+
+# 야간 일기 백필이 대화 요청을 밀어내지 않도록 일기 생성은 DIARY_JOB_WORKERS개까지만 동시에 실행
+diary_jobs = DiaryJobQueue(
+    workers=int(os.getenv('DIARY_JOB_WORKERS', 2)),
+    max_queue=int(os.getenv('DIARY_JOB_MAX_QUEUE', 100)),
+    result_ttl=float(os.getenv('DIARY_JOB_RESULT_TTL', 3600)),
+    max_jobs=int(os.getenv('DIARY_JOB_MAX_RETAINED', 1000)),
+    retry_after=float(os.getenv('DIARY_JOB_RETRY_AFTER', 30))
+)
+
 # ==================== API 엔드포인트 ====================
 
 @app.get("/")
@@ -560,10 +1824,19 @@ async def root():
         "features": ["langchain", "memory", "multi-provider"]
     }
 
+@app.get("/ready")
+async def ready_check():
+    """워밍업(LangChain import, 체인 생성)이 끝났는지 - 로드 밸런서/오케스트레이터의 readiness probe용"""
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content=readiness)
+    return readiness
+
+
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
+        "ready": readiness["ready"],
         "providers": {
             "hyperclova": {
                 "available": ai_service.hyperclova.is_available(),
@@ -574,33 +1847,99 @@ async def health_check():
                 "configured": bool(os.getenv('OLLAMA_CLOUD_API_KEY'))
             }
         },
-        "memory_sessions": len(memory_store)
+        "memory_sessions": len(memory_store),
+        "memory": memory_store.stats(),
+        "active_session_locks": len(session_locks),
+        "circuit_breakers": {
+            "hyperclova": ai_service.hyperclova.breaker.stats(),
+            "ollama": ai_service.ollama.breaker.stats()
+        },
+        "retry_budget": retry_budget.stats(),
+        "logging": {
+            "level": LOG_LEVEL,
+            "sample_rate": LOG_SAMPLE_RATE,
+            "queued": log_handler.queue.qsize(),
+            "dropped": log_handler.dropped
+        },
+        "admission": {
+            "requests": request_limiter.stats(),
+            "hyperclova": ai_service.hyperclova.limiter.stats(),
+            "ollama": ai_service.ollama.limiter.stats()
+        },
+        "diary_coalescing": diary_flights.stats(),
+        "diary_jobs": diary_jobs.stats(),
+        "hedging": {
+            "enabled": HEDGE_ENABLED,
+            "delay_seconds": ai_service.hedge_delay(),
+            "primary_samples": len(ai_service.primary_latency),
+            **ai_service.hedge_stats
+        }
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 메트릭 (텍스트 포맷 0.0.4)"""
+    lines = [line for metric in metrics_registry for line in metric.render()]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def overloaded_exception(error: OverloadedError) -> HTTPException:
+    """요청 또는 제공자 호출 대기열이 가득 찼을 때 보낼 429 응답"""
+    logger.warning(f"Rejecting request: {error}")
+    return HTTPException(
+        status_code=429,
+        detail="AI service is busy, please retry later",
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
+
+@asynccontextmanager
+async def admit_request(endpoint: str, character: str = "none"):
+    """요청 슬롯 확보 - 동시 요청 한도와 대기열이 모두 차 있으면 429 + Retry-After"""
+    try:
+        await request_limiter.acquire()
+    except OverloadedError as e:
+        observe_request(endpoint, time.perf_counter(), character, "none", "error")
+        raise overloaded_exception(e)
+    try:
+        await load_langchain()
+        yield
+    finally:
+        request_limiter.release()
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, x_user_id: Optional[str] = Header(None)):
     """채팅 응답 생성
     
     Args:
         provider: "hyperclova", "ollama", "auto" (기본값)
         use_memory: 메모리 사용 여부 (기본값: True)
+        user_id: 메모리 세션을 구분할 사용자 ID (본문 또는 X-User-Id 헤더)
+    
+    요청 대기열이나 (provider를 직접 지정한 경우) 제공자 호출 대기열이 가득 차면 429 + Retry-After.
     """
-    try:
-        # user_id는 실제로는 인증 토큰에서 추출해야 하지만, 여기서는 character_id 조합으로 사용
-        user_id = f"user_{request.character_id}"
-        
-        response = await ai_service.generate_response(
-            request.character_id,
-            request.messages,
-            request.profile,
-            provider=request.provider,
-            use_memory=request.use_memory,
-            user_id=user_id
-        )
-        return response
-    except Exception as e:
-        logger.error(f"Chat error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    async with admit_request("/chat", request.character_id):
+        started = time.perf_counter()
+        try:
+            user_id = request.user_id or x_user_id
+            
+            response = await ai_service.generate_response(
+                request.character_id,
+                request.messages,
+                request.profile,
+                provider=request.provider,
+                use_memory=request.use_memory,
+                user_id=user_id
+            )
+            outcome = "fallback" if response.model_used == "fallback" else "success"
+            observe_request("/chat", started, request.character_id, response.model_used, outcome)
+            return response
+        except OverloadedError as e:
+            # provider를 직접 지정해 폴백 없이 제공자 호출 슬롯을 얻지 못한 경우
+            observe_request("/chat", started, request.character_id, request.provider, "error")
+            raise overloaded_exception(e)
+        except Exception as e:
+            logger.error(f"Chat error: {e}")
+            observe_request("/chat", started, request.character_id, request.provider, "error")
+            raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/diary/generate", response_model=DiaryDraft)
 async def generate_diary(request: DiaryGenerateRequest):
@@ -608,29 +1947,63 @@ async def generate_diary(request: DiaryGenerateRequest):
     
     Args:
         provider: "hyperclova", "ollama", "auto" (기본값)
+    
+    요청 대기열이나 (provider를 직접 지정한 경우) 제공자 호출 대기열이 가득 차면 429 + Retry-After.
+    """
+    async with admit_request("/diary/generate"):
+        started = time.perf_counter()
+        try:
+            draft = await diary_flights.do(
+                diary_request_key(request.messages, request.provider),
+                lambda: ai_service.generate_diary_draft(request.messages, provider=request.provider)
+            )
+            observe_request("/diary/generate", started, "none", request.provider, "success")
+            return draft
+        except OverloadedError as e:
+            observe_request("/diary/generate", started, "none", request.provider, "error")
+            raise overloaded_exception(e)
+        except Exception as e:
+            logger.error(f"Diary generation error: {e}")
+            observe_request("/diary/generate", started, "none", request.provider, "error")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/diary/jobs", response_model=DiaryJob, status_code=202)
+async def submit_diary_job(request: DiaryGenerateRequest):
+    """일기 초안 생성 작업 등록 - 작업 ID를 바로 반환하고 GET /diary/jobs/{job_id}로 결과 조회
+    
+    같은 내용의 작업이 이미 있으면 그 작업을 반환합니다. 대기열이 가득 차면 429 + Retry-After.
     """
     try:
-        draft = await ai_service.generate_diary_draft(
-            request.messages,
-            provider=request.provider
+        return diary_jobs.submit(request)
+    except OverloadedError as e:
+        logger.warning(f"Rejecting diary job: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail="Diary job queue is full, please retry later",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
         )
-        return draft
-    except Exception as e:
-        logger.error(f"Diary generation error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/diary/jobs/{job_id}", response_model=DiaryJob)
+async def get_diary_job(job_id: str):
+    """일기 생성 작업 상태 조회 (succeeded면 draft 포함)"""
+    job = diary_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Diary job {job_id} not found")
+    return job
 
 @app.post("/memory/clear/{user_id}/{character_id}")
 async def clear_memory(user_id: str, character_id: str):
     """특정 사용자-캐릭터의 메모리 초기화"""
-    key = f"{user_id}:{character_id}"
-    if key in memory_store:
-        del memory_store[key]
+    key = SessionMemoryStore.make_key(user_id, character_id)
+    await load_langchain()
+    if memory_store.clear(key):
         return {"status": "success", "message": f"Memory cleared for {key}"}
     return {"status": "not_found", "message": f"No memory found for {key}"}
 
 @app.get("/memory/stats")
 async def memory_stats():
     """메모리 통계"""
+    await load_langchain()
     stats = {}
     for key, memory in memory_store.items():
         history = memory.load_memory_variables({}).get("chat_history", [])
@@ -638,9 +2011,19 @@ async def memory_stats():
             "message_count": len(history),
             "window_size": memory.k
         }
-    return {"total_sessions": len(memory_store), "sessions": stats}
+    return {"total_sessions": len(memory_store), "sessions": stats, "limits": memory_store.stats()}
 
 if __name__ == "__main__":
-    import uvicorn
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="AI 채팅 서버")
+    parser.add_argument("--import-report", action="store_true", help="서버를 띄우지 않고 시작/워밍업 import 시간 보고서만 출력")
+    parser.add_argument("--top", type=int, default=15, help="보고서에 표시할 패키지 수 (기본 15)")
+    args = parser.parse_args()
+    
+    if args.import_report:
+        sys.exit(import_time_report(args.top))
+    else:
+        import uvicorn
+        port = int(os.getenv("PORT", 8000))
+        uvicorn.run(app, host="0.0.0.0", port=port)
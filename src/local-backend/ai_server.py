@@ -11,16 +11,183 @@ Supabase Functions와 분리하여 Ollama API를 안전하게 사용할 수 있
 import os
 import re
 import json
+import asyncio
+import bisect
+import hashlib
+import logging
+import math
 import random
-from typing import Dict, List, Optional, Any
-from fastapi import FastAPI, HTTPException
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import httpx
 import uvicorn
 
+# 두 서버가 함께 쓰는 인프라 모듈 (src/ai_common)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_common.keywords import KeywordMatcher  # noqa: E402
+from ai_common.logging_setup import RequestContextMiddleware, setup_logging  # noqa: E402
+from ai_common.metrics import MetricCounter, RequestMetrics  # noqa: E402
+from ai_common.resilience import (  # noqa: E402
+    RETRYABLE_STATUS_CODES,
+    RETRYABLE_TRANSPORT_ERRORS,
+    AdmissionLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    OverloadedError,
+    RetryBudget,
+    UpstreamError,
+    camel_case_keys,
+    is_upstream_failure,
+    parse_retry_after,
+)
+
+# 환경 변수
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'https://api.ollama.ai/v1')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'gpt-oss:120b-cloud')
+OLLAMA_API_KEY = os.getenv('OLLAMA_API_KEY')
+PORT = int(os.getenv('AI_SERVER_PORT', 8001))
+
+# 업스트림 HTTP 클라이언트 설정
+HTTP_MAX_CONNECTIONS = int(os.getenv('AI_HTTP_MAX_CONNECTIONS', 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv('AI_HTTP_MAX_KEEPALIVE', 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('AI_HTTP_KEEPALIVE_EXPIRY', 30.0))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('AI_HTTP_CONNECT_TIMEOUT', 5.0))
+HTTP_POOL_TIMEOUT = float(os.getenv('AI_HTTP_POOL_TIMEOUT', 5.0))
+HTTP2_ENABLED = os.getenv('AI_HTTP2', 'true').lower() == 'true'
+ROUTING_TIMEOUT = float(os.getenv('AI_ROUTING_TIMEOUT', 30.0))
+CHAT_TIMEOUT = float(os.getenv('AI_CHAT_TIMEOUT', 60.0))
+
+# 그룹 라우팅 설정: 키워드 점수 차이가 이 값 이상이면 LLM 라우터 생략
+ROUTING_MARGIN_THRESHOLD = int(os.getenv('AI_ROUTING_MARGIN_THRESHOLD', 2))
+
+# LLM 라우팅 결과 캐시 설정
+ROUTING_CACHE_SIZE = int(os.getenv('AI_ROUTING_CACHE_SIZE', 1024))
+ROUTING_CACHE_TTL = float(os.getenv('AI_ROUTING_CACHE_TTL', 600.0))
+
+# 그룹 라우팅 로컬 분류기: train_routing_model.py로 학습한 모델 파일, 이 확률 이상일 때만 LLM 라우터 생략
+ROUTING_MODEL_PATH = os.getenv(
+    'AI_ROUTING_MODEL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'routing_model.json')
+)
+ROUTING_MODEL_THRESHOLD = float(os.getenv('AI_ROUTING_MODEL_THRESHOLD', 0.75))
+
+# 재시도된 채팅 요청 중복 제거: Idempotency-Key 헤더(없으면 요청 내용 해시)별 응답 캐시
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('AI_IDEMPOTENCY_CACHE_SIZE', 1024))
+IDEMPOTENCY_TTL = float(os.getenv('AI_IDEMPOTENCY_TTL', 120.0))
+IDEMPOTENCY_DERIVE_KEYS = os.getenv('AI_IDEMPOTENCY_DERIVE_KEYS', 'true').lower() == 'true'
+IDEMPOTENCY_HISTORY_TAIL = int(os.getenv('AI_IDEMPOTENCY_HISTORY_TAIL', 4))
+
+# 대화 히스토리 토큰 예산 (시스템 프롬프트와 현재 메시지 포함)
+CONTEXT_TOKEN_BUDGET = int(os.getenv('AI_CONTEXT_TOKEN_BUDGET', 3000))
+TOKEN_CACHE_SIZE = int(os.getenv('AI_TOKEN_CACHE_SIZE', 4096))
+
+# 리브(char_4) 캘린더 컨텍스트: 현재 시각 기준 포함할 범위와 최대 일정 수, 일정 목록별 캐시 크기
+CALENDAR_MAX_EVENTS = int(os.getenv('AI_CALENDAR_MAX_EVENTS', 10))
+CALENDAR_LOOKBACK_HOURS = float(os.getenv('AI_CALENDAR_LOOKBACK_HOURS', 24))
+CALENDAR_LOOKAHEAD_DAYS = float(os.getenv('AI_CALENDAR_LOOKAHEAD_DAYS', 14))
+CALENDAR_CACHE_SIZE = int(os.getenv('AI_CALENDAR_CACHE_SIZE', 256))
+
+# 업스트림 장애 대응: 서킷 브레이커와 재시도
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('AI_BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv('AI_BREAKER_RECOVERY_TIMEOUT', 30.0))
+RETRY_MAX_ATTEMPTS = int(os.getenv('AI_RETRY_MAX_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.getenv('AI_RETRY_BASE_DELAY', 0.2))
+RETRY_MAX_DELAY = float(os.getenv('AI_RETRY_MAX_DELAY', 5.0))
+RETRY_BUDGET_RATIO = float(os.getenv('AI_RETRY_BUDGET_RATIO', 0.2))
+RETRY_BUDGET_MAX = float(os.getenv('AI_RETRY_BUDGET_MAX', 10.0))
+
+# 배치 채팅: 동시에 처리할 항목 수 (모든 배치 요청이 공유)와 배치당 최대 항목 수
+BATCH_CONCURRENCY = int(os.getenv('AI_BATCH_CONCURRENCY', 8))
+BATCH_MAX_ITEMS = int(os.getenv('AI_BATCH_MAX_ITEMS', 500))
+
+# 부하 제어: 동시에 처리할 요청 수 / 업스트림 호출 수와 대기열 길이 (0 이하면 제한 없음)
+MAX_CONCURRENT_REQUESTS = int(os.getenv('AI_MAX_CONCURRENT_REQUESTS', 64))
+MAX_QUEUED_REQUESTS = int(os.getenv('AI_MAX_QUEUED_REQUESTS', 128))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv('AI_OLLAMA_MAX_CONCURRENCY', 32))
+OLLAMA_MAX_QUEUE = int(os.getenv('AI_OLLAMA_MAX_QUEUE', 64))
+QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT', 5.0))
+
+# 로깅: 레벨, 포맷(json/text), 요청별 상세 로그 샘플링 비율, 메시지 본문 기록 여부, 큐 길이
+LOG_LEVEL = os.getenv('AI_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('AI_LOG_FORMAT', 'json').lower()
+LOG_SAMPLE_RATE = float(os.getenv('AI_LOG_SAMPLE_RATE', 1.0))
+LOG_MESSAGE_BODIES = os.getenv('AI_LOG_MESSAGE_BODIES', 'false').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.getenv('AI_LOG_QUEUE_SIZE', 10000))
+
+logger = logging.getLogger('ai_server')
+# ai_common 모듈의 로그(서킷 브레이커 등)도 같은 큐 핸들러로 출력
+log_handler = setup_logging(
+    LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE,
+    request_id_key='requestId',
+    logger_names=('ai_server', 'ai_common')
+)
+
+
+def log_text(text: str) -> str:
+    """사용자 메시지 본문은 AI_LOG_MESSAGE_BODIES=true일 때만 그대로 기록"""
+    return text if LOG_MESSAGE_BODIES else f'<redacted {len(text)} chars>'
+
+
+# 앱 전체에서 공유하는 업스트림 클라이언트 (lifespan에서 생성)
+http_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """keep-alive 커넥션 풀을 사용하는 업스트림 클라이언트 생성"""
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401  # httpx[http2] 설치 시에만 HTTP/2 사용
+        except ImportError:
+            logger.warning('⚠️ h2 package not installed, falling back to HTTP/1.1')
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(CHAT_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT),
+        headers={'Content-Type': 'application/json'},
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """공유 업스트림 클라이언트 반환 (lifespan 밖에서 호출되면 지연 생성)"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = create_http_client()
+    return http_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """앱 수명 동안 업스트림 커넥션 풀 유지"""
+    global http_client
+    http_client = create_http_client()
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        http_client = None
+
+
 # FastAPI 앱 초기화
-app = FastAPI(title="AI Server", description="Ollama API 기반 AI 응답 생성 서버")
+app = FastAPI(title="AI Server", description="Ollama API 기반 AI 응답 생성 서버", lifespan=lifespan)
+
+app.add_middleware(RequestContextMiddleware, sample_rate=LOG_SAMPLE_RATE)
 
 # CORS 설정
 app.add_middleware(
@@ -31,12 +198,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 환경 변수
-OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'https://api.ollama.ai/v1')
-OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'gpt-oss:120b-cloud')
-OLLAMA_API_KEY = os.getenv('OLLAMA_API_KEY')
-PORT = int(os.getenv('AI_SERVER_PORT', 8001))
-
 # Pydantic 모델
 class Message(BaseModel):
     role: str
@@ -60,6 +221,505 @@ class ChatResponse(BaseModel):
     respondingCharacter: Optional[CharacterInfo] = None
     fallback: Optional[bool] = False
 
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest]
+    concurrency: Optional[int] = None  # AI_BATCH_CONCURRENCY 이하로 제한
+
+class BatchChatResponse(BaseModel):
+    results: List[ChatResponse]  # requests와 같은 순서
+    fallbackCount: int
+    rejectedCount: int = 0  # 서버가 바빠 처리하지 못한 항목 수 (fallbackCount에 포함, 재시도 대상)
+
+
+class RoutingCache:
+    """정규화된 메시지 → LLM 라우팅 결과 캐시 (LRU + TTL)"""
+    
+    _MENTION_PATTERN = re.compile(r'@\S+')
+    _PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+    _WHITESPACE_PATTERN = re.compile(r'\s+')
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, CharacterInfo]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @classmethod
+    def normalize(cls, message: str) -> str:
+        """멘션 제거, 구두점 제거, 공백 정리 후 소문자화"""
+        text = cls._MENTION_PATTERN.sub(' ', message.lower())
+        text = cls._PUNCTUATION_PATTERN.sub(' ', text)
+        return cls._WHITESPACE_PATTERN.sub(' ', text).strip()
+    
+    def get(self, message: str) -> Optional[CharacterInfo]:
+        key = self.normalize(message)
+        entry = self._entries.get(key) if key else None
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(self, message: str, character: CharacterInfo) -> None:
+        key = self.normalize(message)
+        if not key or self.max_size <= 0:
+            return
+        
+        self._entries[key] = (time.monotonic() + self.ttl, character)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxSize': self.max_size,
+            'ttlSeconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRate': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+routing_cache = RoutingCache(ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL)
+
+
+class TokenCounter:
+    """메시지별 토큰 수 추정 (내용 해시 기준 LRU 캐시)
+    
+    토크나이저 없이 근사합니다: ASCII는 4글자당 1토큰, 한글 등 비ASCII 문자는 1글자당 1토큰,
+    메시지마다 역할/구분자 오버헤드 4토큰.
+    """
+    
+    MESSAGE_OVERHEAD = 4
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._counts: 'OrderedDict[bytes, int]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @classmethod
+    def estimate(cls, content: str) -> int:
+        encoded_length = len(content.encode('utf-8'))
+        # ASCII는 1바이트, 한글(BMP)은 3바이트이므로 바이트 수 차이로 비ASCII 글자 수를 근사
+        non_ascii = (encoded_length - len(content)) // 2
+        ascii_chars = len(content) - non_ascii
+        return cls.MESSAGE_OVERHEAD + non_ascii + (ascii_chars + 3) // 4
+    
+    def count(self, content: str) -> int:
+        key = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+        tokens = self._counts.get(key)
+        if tokens is not None:
+            self._counts.move_to_end(key)
+            self.hits += 1
+            return tokens
+        
+        self.misses += 1
+        tokens = self.estimate(content)
+        if self.max_size > 0:
+            self._counts[key] = tokens
+            if len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+        return tokens
+    
+    def stats(self) -> Dict[str, Any]:
+        return {'size': len(self._counts), 'maxSize': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+token_counter = TokenCounter(TOKEN_CACHE_SIZE)
+
+
+class CalendarContextBuilder:
+    """리브(char_4)용 캘린더 컨텍스트 블록 생성
+    
+    일정 목록마다 시작 시각을 한 번만 파싱해 시간순 인덱스를 만들고, 현재 시각 기준 범위
+    (lookback 전 ~ lookahead 후)에서 가까운 순으로 max_events개를 고릅니다.
+    범위 안에 일정이 없으면 범위와 관계없이 현재 시각과 가까운 일정을 고릅니다.
+    인덱스와 완성된 블록은 일정 목록 시그니처(제목, 시작, 장소)로 캐시하므로
+    같은 세션의 반복 턴은 다시 파싱하거나 포맷하지 않습니다.
+    """
+    
+    HEADER = "\n\n📅 **구글 캘린더 일정:**\n"
+    FOOTER = "\n💡 위 일정을 참고하여 사용자의 하루 리듬을 분석하고, 일정 관리에 대한 피드백을 제공하세요."
+    MAX_BLOCKS_PER_INDEX = 8
+    
+    def __init__(self, max_events: int, lookback: float, lookahead: float, cache_size: int):
+        self.max_events = max_events
+        self.lookback = lookback
+        self.lookahead = lookahead
+        self.cache_size = cache_size
+        # 시그니처 → (시작 시각 목록, 일정 줄 목록, 시간 미정 줄 목록, {선택 범위: 블록})
+        self._indexes: "OrderedDict[Tuple, Tuple[List[float], List[str], List[str], Dict[Tuple[int, int, int], str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def signature(events: List[Dict[str, Any]]) -> Tuple:
+        """일정 목록의 캐시 키 (JSON 직렬화보다 훨씬 저렴)"""
+        result = []
+        for event in events:
+            start = event.get('start') or {}
+            result.append((
+                event.get('summary', '제목 없음'),
+                start.get('dateTime') or start.get('date', '시간 미정'),
+                event.get('location', '')
+            ))
+        return tuple(result)
+    
+    @staticmethod
+    def parse_start(start_time: str) -> Tuple[Optional[float], str]:
+        """(정렬용 타임스탬프, 표시용 시간) - 파싱할 수 없으면 (None, 원문)"""
+        try:
+            if 'T' in start_time:
+                dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+                return dt.timestamp(), dt.strftime('%m월 %d일 %H:%M')
+            dt = datetime.fromisoformat(start_time)
+            return dt.timestamp(), dt.strftime('%m월 %d일 (종일)')
+        except (TypeError, ValueError, AttributeError):
+            return None, str(start_time)
+    
+    def _index(self, signature: Tuple):
+        entry = self._indexes.get(signature)
+        if entry is not None:
+            self._indexes.move_to_end(signature)
+            self.hits += 1
+            return entry
+        
+        self.misses += 1
+        dated: List[Tuple[float, str]] = []
+        undated: List[str] = []
+        for summary, start_time, location in signature:
+            timestamp, formatted_time = self.parse_start(start_time)
+            location_str = f" 📍 {location}" if location else ""
+            line = f"{summary} - {formatted_time}{location_str}"
+            if timestamp is None:
+                undated.append(line)
+            else:
+                dated.append((timestamp, line))
+        dated.sort(key=lambda item: item[0])
+        
+        entry = ([timestamp for timestamp, _ in dated], [line for _, line in dated], undated, {})
+        self._indexes[signature] = entry
+        while len(self._indexes) > self.cache_size:
+            self._indexes.popitem(last=False)
+        return entry
+    
+    def _nearest(self, starts: List[float], now: float, lower: int, upper: int) -> Tuple[int, int]:
+        """starts[lower:upper]에서 now와 가까운 일정 max_events개의 연속 구간 [lo, hi)
+        
+        now 위치부터 양쪽으로 넓혀 가며 더 가까운 쪽을 고름 (같은 거리면 다가오는 일정 우선)
+        """
+        lo = hi = min(max(bisect.bisect_left(starts, now), lower), upper)
+        while hi - lo < self.max_events and (lo > lower or hi < upper):
+            if hi < upper and (lo == lower or starts[hi] - now <= now - starts[lo - 1]):
+                hi += 1
+            else:
+                lo -= 1
+        return lo, hi
+    
+    def build(self, events: List[Dict[str, Any]], now: Optional[float] = None) -> str:
+        if not events:
+            return ""
+        starts, lines, undated, blocks = self._index(self.signature(events))
+        now = time.time() if now is None else now
+        
+        # 범위(lookback 전 ~ lookahead 후) 안에서 가까운 일정, 범위 안에 없으면 전체에서 가까운 일정
+        window_lo = bisect.bisect_left(starts, now - self.lookback)
+        window_hi = bisect.bisect_right(starts, now + self.lookahead)
+        if window_lo == window_hi:
+            window_lo, window_hi = 0, len(starts)
+        lo, hi = self._nearest(starts, now, window_lo, window_hi)
+        undated_count = max(0, min(len(undated), self.max_events - (hi - lo)))
+        if lo == hi and not undated_count:
+            return ""
+        
+        key = (lo, hi, undated_count)
+        block = blocks.get(key)
+        if block is None:
+            selected = lines[lo:hi] + undated[:undated_count]
+            block = self.HEADER + ''.join(f"{i}. {line}\n" for i, line in enumerate(selected, 1)) + self.FOOTER
+            if len(blocks) >= self.MAX_BLOCKS_PER_INDEX:
+                blocks.clear()
+            blocks[key] = block
+        return block
+    
+    def stats(self) -> Dict[str, Any]:
+        return {'size': len(self._indexes), 'maxSize': self.cache_size, 'hits': self.hits, 'misses': self.misses}
+
+
+calendar_context_builder = CalendarContextBuilder(
+    CALENDAR_MAX_EVENTS,
+    CALENDAR_LOOKBACK_HOURS * 3600,
+    CALENDAR_LOOKAHEAD_DAYS * 86400,
+    CALENDAR_CACHE_SIZE
+)
+
+
+class IdempotencyCache:
+    """멱등성 키 → 채팅 응답 캐시 (LRU + TTL) + 진행 중인 요청 합치기
+    
+    같은 키의 요청이 다시 오면 저장된 응답을 그대로 반환하고, 첫 요청이 아직 처리 중이면
+    새로 생성하지 않고 그 결과를 기다립니다. 생성은 별도 태스크에서 실행되므로 첫 요청의
+    연결이 끊겨도 계속 진행되어 재시도 요청이 결과를 받습니다. 폴백 응답은 저장하지 않습니다.
+    클라이언트가 준 키는 요청 본문 해시(fingerprint)와 함께 저장해, 같은 키로 다른 본문이 오면
+    IdempotencyKeyConflict를 발생시킵니다.
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Optional[str], ChatResponse]]' = OrderedDict()
+        self._in_flight: Dict[str, Tuple[asyncio.Task, Optional[str]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.conflicts = 0
+    
+    @staticmethod
+    def _digest(payload: Any) -> str:
+        data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+    
+    @staticmethod
+    def make_key(request: 'ChatRequest', header_key: Optional[str]) -> Optional[str]:
+        """Idempotency-Key 헤더가 있으면 그대로, 없으면 (캐릭터, 프로필, 메시지, 최근 히스토리, 캘린더) 해시"""
+        if header_key:
+            return f"key:{header_key}"
+        if not IDEMPOTENCY_DERIVE_KEYS:
+            return None
+        
+        tail = (request.chatHistory or [])[-IDEMPOTENCY_HISTORY_TAIL:] if IDEMPOTENCY_HISTORY_TAIL > 0 else []
+        return 'hash:' + IdempotencyCache._digest([
+            request.characterId,
+            request.profile,
+            request.message,
+            [(msg.role, msg.content) for msg in tail],
+            # 리브(char_4)의 답변은 일정에 따라 달라지므로 일정이 바뀌면 다른 요청
+            CalendarContextBuilder.signature(request.calendarEvents or [])
+        ])
+    
+    @staticmethod
+    def fingerprint(request: 'ChatRequest') -> str:
+        """클라이언트 키와 함께 저장할 요청 본문 전체 해시"""
+        return IdempotencyCache._digest([
+            request.characterId,
+            request.profile,
+            request.message,
+            [(msg.role, msg.content) for msg in request.chatHistory or []],
+            request.calendarEvents
+        ])
+    
+    def _check(self, key: str, stored: Optional[str], fingerprint: Optional[str]) -> None:
+        if fingerprint is not None and stored is not None and stored != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyKeyConflict(key)
+    
+    def get(self, key: str, fingerprint: Optional[str] = None) -> Optional['ChatResponse']:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            return None
+        
+        self._check(key, entry[1], fingerprint)
+        self._entries.move_to_end(key)
+        return entry[2]
+    
+    def set(self, key: str, response: 'ChatResponse', fingerprint: Optional[str] = None) -> None:
+        if self.max_size <= 0:
+            return
+        
+        self._entries[key] = (time.monotonic() + self.ttl, fingerprint, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    async def run(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable['ChatResponse']],
+        fingerprint: Optional[str] = None
+    ) -> 'ChatResponse':
+        """저장된 응답 → 진행 중인 요청 → 새로 생성 순으로 응답 반환
+        
+        fingerprint가 주어지면 같은 키로 저장/진행 중인 요청의 본문과 다를 때 IdempotencyKeyConflict
+        """
+        cached = self.get(key, fingerprint)
+        if cached is not None:
+            self.hits += 1
+            logger.info('♻️ Replaying stored response for repeated request', extra={'verbose': True})
+            return cached
+        
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            self.misses += 1
+            task = asyncio.create_task(self._generate(key, generate, fingerprint))
+            self._in_flight[key] = (task, fingerprint)
+        else:
+            task, stored = in_flight
+            self._check(key, stored, fingerprint)
+            self.coalesced += 1
+            logger.info('⏳ Waiting for in-flight duplicate request', extra={'verbose': True})
+        # 기다리던 요청이 취소되어도 생성 태스크는 취소하지 않음
+        return await asyncio.shield(task)
+    
+    async def _generate(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable['ChatResponse']],
+        fingerprint: Optional[str]
+    ) -> 'ChatResponse':
+        try:
+            response = await generate()
+            if not response.fallback:
+                self.set(key, response, fingerprint)
+            return response
+        finally:
+            self._in_flight.pop(key, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._entries),
+            'maxSize': self.max_size,
+            'ttlSeconds': self.ttl,
+            'inFlight': len(self._in_flight),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'conflicts': self.conflicts,
+            'hitRate': round((self.hits + self.coalesced) / total, 4) if total else 0.0
+        }
+
+
+class IdempotencyKeyConflict(Exception):
+    """같은 Idempotency-Key로 다른 요청 본문이 들어옴"""
+
+
+idempotency_cache = IdempotencyCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL)
+
+
+ollama_breaker = CircuitBreaker('ollama', BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT)
+retry_budget = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+# 엔드포인트 진입(요청 단위)과 Ollama 호출(업스트림 단위)을 따로 제한
+request_limiter = AdmissionLimiter('requests', MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT)
+ollama_limiter = AdmissionLimiter('ollama', OLLAMA_MAX_CONCURRENCY, OLLAMA_MAX_QUEUE, QUEUE_TIMEOUT)
+
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """재시도까지 기다릴 시간 (재시도하지 않으면 None)"""
+    if isinstance(error, UpstreamError):
+        if error.status_code not in RETRYABLE_STATUS_CODES:
+            return None
+        if error.retry_after is not None:
+            # 너무 오래 기다려야 하면 재시도하지 않고 폴백 (브레이커가 그동안 호출을 막음)
+            return error.retry_after if error.retry_after <= RETRY_MAX_DELAY else None
+    elif not isinstance(error, RETRYABLE_TRANSPORT_ERRORS):
+        return None
+    
+    # full jitter 지수 백오프
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1))))
+
+
+def record_upstream_failure(breaker: CircuitBreaker, permit: Optional[str], error: Exception) -> None:
+    """업스트림 장애로 볼 수 있는 오류만 브레이커 실패로 기록 (그 밖의 오류는 시험 요청 슬롯만 반환)"""
+    if not is_upstream_failure(error):
+        breaker.release(permit)
+    elif isinstance(error, UpstreamError) and error.status_code not in RETRYABLE_STATUS_CODES:
+        # 요청 자체의 문제(4xx)는 업스트림 장애가 아님
+        breaker.record_success()
+    elif isinstance(error, UpstreamError) and error.status_code == 429 and error.retry_after:
+        breaker.record_failure(open_for=error.retry_after)
+    else:
+        breaker.record_failure()
+
+
+async def post_ollama(payload: Dict[str, Any], timeout: Optional[httpx.Timeout] = None) -> httpx.Response:
+    """Ollama /chat/completions 호출 (동시 호출 제한 + 서킷 브레이커 + 지터 백오프 재시도 + 재시도 예산)
+    
+    호출 슬롯은 시도마다 잡으므로 재시도 대기 중에는 다른 요청이 슬롯을 쓸 수 있습니다.
+    """
+    retry_budget.deposit()
+    attempt = 0
+    
+    while True:
+        async with ollama_limiter.slot():
+            permit = ollama_breaker.allow()
+            if not permit:
+                raise CircuitOpenError(f"Circuit breaker '{ollama_breaker.name}' is open")
+            
+            attempt += 1
+            try:
+                response = await get_http_client().post(
+                    f"{OLLAMA_BASE_URL}/chat/completions",
+                    headers={'Authorization': f'Bearer {OLLAMA_API_KEY}'},
+                    json=payload,
+                    timeout=timeout or httpx.USE_CLIENT_DEFAULT
+                )
+            except httpx.TransportError as e:
+                error: Exception = e
+            except BaseException:
+                ollama_breaker.release(permit)
+                raise
+            else:
+                if response.status_code == 200:
+                    ollama_breaker.record_success()
+                    return response
+                
+                logger.error(f"❌ Ollama API error: {response.status_code}", extra={'body': response.text[:500]})
+                error = UpstreamError(
+                    response.status_code,
+                    retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                )
+        
+        record_upstream_failure(ollama_breaker, permit, error)
+        
+        delay = retry_delay(error, attempt)
+        if delay is None or attempt >= RETRY_MAX_ATTEMPTS or not retry_budget.withdraw():
+            raise error
+        
+        logger.info(f"🔁 Retrying Ollama call in {delay:.2f}s (attempt {attempt + 1}/{RETRY_MAX_ATTEMPTS})")
+        await asyncio.sleep(delay)
+
+
+def fit_history_to_budget(
+    system_prompts: List[str],
+    history: List['Message'],
+    user_message: str,
+    budget: int
+) -> List[Dict[str, str]]:
+    """시스템 프롬프트들과 현재 메시지를 제외한 예산 안에서 가장 최근 턴부터 히스토리를 채움"""
+    remaining = budget - sum(token_counter.count(prompt) for prompt in system_prompts) - token_counter.count(user_message)
+    kept: List[Dict[str, str]] = []
+    for msg in reversed(history):
+        tokens = token_counter.count(msg.content)
+        if tokens > remaining:
+            break
+        remaining -= tokens
+        kept.append({'role': msg.role, 'content': msg.content})
+    
+    kept.reverse()
+    if len(kept) < len(history):
+        logger.info(
+            f"✂️ Trimmed chat history to {len(kept)}/{len(history)} messages (budget {budget} tokens)",
+            extra={'verbose': True}
+        )
+    return kept
+
+# 그룹 라우팅 경로별 처리 횟수 (mention / keyword / model / llm / fallback)
+routing_stats: Dict[str, int] = {'mention': 0, 'keyword': 0, 'model': 0, 'llm': 0, 'fallback': 0}
+
+
 # Fallback 응답
 FALLBACK_RESPONSES: Dict[str, List[str]] = {
     'char_1': [
@@ -83,6 +743,18 @@ FALLBACK_RESPONSES: Dict[str, List[str]] = {
     ]
 }
 
+# 요청/단계 지연 시간과 폴백 메트릭 - character 라벨은 FALLBACK_RESPONSES의 캐릭터 ID만 그대로 사용
+# 라벨: stage = mention_routing / keyword_routing / model_routing / llm_routing / prompt_build / upstream_generation
+#       provider = ollama / none, outcome = success / fallback / error
+request_metrics = RequestMetrics(FALLBACK_RESPONSES)
+observe_stage = request_metrics.observe_stage
+observe_request = request_metrics.observe_request
+routing_counter = MetricCounter(
+    'ai_routing_decisions_total', 'Group chat routing decisions by path',
+    ('path', 'character')
+)
+metrics_registry = [*request_metrics.metrics, routing_counter]
+
 # 캐릭터 프롬프트
 CHARACTER_PROMPTS: Dict[str, str] = {
     'char_1': """You are 루미, an empathetic emotional supporter who helps users feel safe and accepted.
@@ -125,18 +797,49 @@ Your voice should feel calm, deep, and slightly poetic — like talking to a wis
 }
 
 
-def select_character_by_mention(message: str) -> Optional[CharacterInfo]:
-    """멘션으로 캐릭터 선택"""
-    mentions = [
-        {'pattern': r'@루미|@lumi', 'charId': 'char_1', 'charName': '루미', 'charEmoji': '💡'},
-        {'pattern': r'@카이|@kai', 'charId': 'char_2', 'charName': '카이', 'charEmoji': '🌊'},
-        {'pattern': r'@레오|@리오|@leo', 'charId': 'char_3', 'charName': '레오', 'charEmoji': '🌙'},
-        {'pattern': r'@리브|@rib', 'charId': 'char_4', 'charName': '리브', 'charEmoji': '🎵'}
-    ]
+# 멘션 라우팅 대상 (여러 캐릭터가 멘션되면 앞선 캐릭터 우선)
+MENTION_CHARACTERS: List[Dict[str, Any]] = [
+    {'charId': 'char_1', 'charName': '루미', 'charEmoji': '💡', 'mentions': ['@루미', '@lumi']},
+    {'charId': 'char_2', 'charName': '카이', 'charEmoji': '🌊', 'mentions': ['@카이', '@kai']},
+    {'charId': 'char_3', 'charName': '레오', 'charEmoji': '🌙', 'mentions': ['@레오', '@리오', '@leo']},
+    {'charId': 'char_4', 'charName': '리브', 'charEmoji': '🎵', 'mentions': ['@리브', '@rib']},
+]
+
+# 키워드 라우팅 대상 (동점이면 앞선 캐릭터 우선)
+KEYWORD_CHARACTERS: List[Dict[str, Any]] = [
+    {
+        'charId': 'char_1', 'charName': '루미', 'charEmoji': '💡', 'reason': '감정적 지원 키워드 감지',
+        'keywords': ['힘들', '우울', '외로', '슬프', '불안', '걱정', '두려', '무서', '위로', '공감',
+                     '마음', '감정', '아프', '괴롭', '지쳐', '힘들어', '막막'],
+    },
+    {
+        'charId': 'char_2', 'charName': '카이', 'charEmoji': '🌊', 'reason': '실용적 조언 키워드 감지',
+        'keywords': ['어떻게', '방법', '해결', '계획', '루틴', '습관', '시작', '정리', '관리',
+                     '조언', '문제', '전략', '돈', '커리어', '취업', '목표'],
+    },
+    {
+        'charId': 'char_3', 'charName': '레오', 'charEmoji': '🌙', 'reason': '성찰 키워드 감지',
+        'keywords': ['왜', '이유', '생각', '의미', '나는', '스스로', '성찰', '이해', '원인',
+                     '진짜', '본질', '느낌'],
+    },
+]
+
+
+# 멘션('@char_N')과 키워드('char_N') 그룹을 한 번에 매칭하는 매처 (import 시 1회 컴파일)
+ROUTING_MATCHER = KeywordMatcher({
+    **{f"@{character['charId']}": character['mentions'] for character in MENTION_CHARACTERS},
+    **{character['charId']: character['keywords'] for character in KEYWORD_CHARACTERS},
+})
+
+
+def select_character_by_mention(message: str, hits: Optional[Dict[str, int]] = None) -> Optional[CharacterInfo]:
+    """멘션으로 캐릭터 선택 (hits: 이미 계산한 ROUTING_MATCHER 결과)"""
+    if hits is None:
+        hits = ROUTING_MATCHER.count(message)
     
-    for mention in mentions:
-        if re.search(mention['pattern'], message, re.IGNORECASE):
-            print(f"✨ Mention detected: {mention['charName']}")
+    for mention in MENTION_CHARACTERS:
+        if hits[f"@{mention['charId']}"]:
+            logger.info(f"✨ Mention detected: {mention['charName']}", extra={'verbose': True})
             return CharacterInfo(
                 charId=mention['charId'],
                 charName=mention['charName'],
@@ -147,40 +850,333 @@ def select_character_by_mention(message: str) -> Optional[CharacterInfo]:
     return None
 
 
+def score_character_keywords(message: str, hits: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """캐릭터별 키워드 매칭 점수 계산 (매칭된 서로 다른 키워드 수)"""
+    if hits is None:
+        hits = ROUTING_MATCHER.count(message)
+    return {character['charId']: hits[character['charId']] for character in KEYWORD_CHARACTERS}
+
+
+def select_character_by_scores(scores: Dict[str, int]) -> CharacterInfo:
+    """키워드 점수로 캐릭터 선택 (점수가 모두 0이면 루미)"""
+    best = max(KEYWORD_CHARACTERS, key=lambda character: scores[character['charId']])
+    if scores[best['charId']] > 0:
+        return CharacterInfo(
+            charId=best['charId'],
+            charName=best['charName'],
+            charEmoji=best['charEmoji'],
+            reason=best['reason']
+        )
+    
+    # 기본값: 루미
+    logger.info('No clear keyword match, defaulting to 루미', extra={'verbose': True})
+    return CharacterInfo(charId='char_1', charName='루미', charEmoji='💡', reason='기본 선택 (감정 지원)')
+
+
 def select_character_by_keywords(message: str) -> CharacterInfo:
     """키워드 기반 캐릭터 선택"""
-    lower_message = message.lower()
+    scores = score_character_keywords(message)
+    logger.info('Keyword scores', extra={'verbose': True, 'scores': scores})
+    return select_character_by_scores(scores)
+
+
+def keyword_margin(scores: Dict[str, int]) -> int:
+    """1위와 2위 캐릭터의 키워드 점수 차이"""
+    top, runner_up = sorted(scores.values(), reverse=True)[:2]
+    return top - runner_up
+
+
+class RoutingClassifier:
+    """그룹 채팅 라우팅용 로컬 분류기 (문자 n-gram TF-IDF + 선형 소프트맥스 모델)
     
-    lumi_keywords = ['힘들', '우울', '외로', '슬프', '불안', '걱정', '두려', '무서', '위로', '공감', 
-                     '마음', '감정', '아프', '괴롭', '지쳐', '힘들어', '막막']
-    kai_keywords = ['어떻게', '방법', '해결', '계획', '루틴', '습관', '시작', '정리', '관리', 
-                    '조언', '문제', '전략', '돈', '커리어', '취업', '목표']
-    leo_keywords = ['왜', '이유', '생각', '의미', '나는', '스스로', '성찰', '이해', '원인', 
-                    '진짜', '본질', '느낌']
+    LLM 라우터가 고른 (메시지, 캐릭터) 기록으로 train_routing_model.py에서 학습한 JSON 모델을 읽어
+    네트워크 없이 마이크로초 단위로 캐릭터와 확률을 예측합니다. 학습과 예측이 같은 특징 추출을
+    쓰도록 n-gram/TF-IDF 계산은 이 클래스에 둡니다.
+    """
     
-    lumi_score = sum(1 for keyword in lumi_keywords if keyword in lower_message)
-    kai_score = sum(1 for keyword in kai_keywords if keyword in lower_message)
-    leo_score = sum(1 for keyword in leo_keywords if keyword in lower_message)
+    VERSION = 1
+    # 라우팅은 메시지 앞부분으로 충분히 결정되므로 긴 메시지는 앞쪽만 사용 (학습/예측 동일)
+    MAX_CHARS = 300
     
-    print(f"Keyword scores - 루미: {lumi_score}, 카이: {kai_score}, 레오: {leo_score}")
+    def __init__(
+        self,
+        classes: List[str],
+        ngram_range: Tuple[int, int],
+        idf: Dict[str, float],
+        weights: Dict[str, List[float]],
+        bias: List[float],
+        meta: Optional[Dict[str, Any]] = None
+    ):
+        self.classes = classes
+        self.ngram_range = ngram_range
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.meta = meta or {}
+        # 예측 시 n-gram마다 한 번만 조회하도록 (idf, 클래스별 가중치)를 묶어 둠
+        self._table: Dict[str, Tuple[float, List[float]]] = {
+            gram: (idf[gram], weights[gram]) for gram in weights if gram in idf
+        }
     
-    if lumi_score >= kai_score and lumi_score >= leo_score and lumi_score > 0:
-        return CharacterInfo(charId='char_1', charName='루미', charEmoji='💡', reason='감정적 지원 키워드 감지')
-    elif kai_score >= leo_score and kai_score > 0:
-        return CharacterInfo(charId='char_2', charName='카이', charEmoji='🌊', reason='실용적 조언 키워드 감지')
-    elif leo_score > 0:
-        return CharacterInfo(charId='char_3', charName='레오', charEmoji='🌙', reason='성찰 키워드 감지')
+    @staticmethod
+    def count_ngrams(text: str, ngram_range: Tuple[int, int]) -> Dict[str, int]:
+        """정규화한 메시지(앞뒤 공백 포함)의 문자 n-gram 빈도"""
+        normalized = f" {RoutingCache.normalize(text[:RoutingClassifier.MAX_CHARS * 2])[:RoutingClassifier.MAX_CHARS]} "
+        counts: Dict[str, int] = {}
+        low, high = ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(normalized) - n + 1):
+                gram = normalized[i:i + n]
+                counts[gram] = counts.get(gram, 0) + 1
+        return counts
     
-    # 기본값: 루미
-    print('No clear keyword match, defaulting to 루미')
-    return CharacterInfo(charId='char_1', charName='루미', charEmoji='💡', reason='기본 선택 (감정 지원)')
+    @staticmethod
+    def weigh(counts: Dict[str, int], idf: Dict[str, float]) -> Dict[str, float]:
+        """(1 + log tf) × idf 가중치를 L2 정규화 (어휘에 없는 n-gram은 제외)"""
+        features = {
+            gram: (1.0 + math.log(count)) * idf[gram]
+            for gram, count in counts.items() if gram in idf
+        }
+        norm = math.sqrt(sum(value * value for value in features.values()))
+        if norm:
+            for gram in features:
+                features[gram] /= norm
+        return features
+    
+    def features(self, text: str) -> Dict[str, float]:
+        return self.weigh(self.count_ngrams(text, self.ngram_range), self.idf)
+    
+    def predict_proba(self, text: str) -> Optional[List[float]]:
+        """클래스별 확률 (알려진 n-gram이 하나도 없으면 None)
+        
+        features()와 같은 값을 계산하지만, 가중치가 있는 n-gram만 세고 한 번에 점수를 더합니다.
+        """
+        table = self._table
+        normalized = f" {RoutingCache.normalize(text[:self.MAX_CHARS * 2])[:self.MAX_CHARS]} "
+        counts: Dict[str, int] = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(normalized) - n + 1):
+                gram = normalized[i:i + n]
+                if gram in table:
+                    counts[gram] = counts.get(gram, 0) + 1
+        if not counts:
+            return None
+        
+        # L2 정규화는 어휘의 모든 n-gram 기준이지만, 가지치기된 n-gram은 가중치가 ~0이라 무시해도 됨
+        weighted = []
+        norm = 0.0
+        for gram, count in counts.items():
+            idf, weights = table[gram]
+            value = idf if count == 1 else (1.0 + math.log(count)) * idf
+            norm += value * value
+            weighted.append((value, weights))
+        norm = math.sqrt(norm)
+        
+        scores = list(self.bias)
+        classes = range(len(scores))
+        for value, weights in weighted:
+            value /= norm
+            for i in classes:
+                scores[i] += weights[i] * value
+        
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [value / total for value in exps]
+    
+    def predict(self, text: str) -> Optional[Tuple[str, float]]:
+        """(캐릭터 ID, 확률) - 예측할 수 없으면 None"""
+        probabilities = self.predict_proba(text)
+        if probabilities is None:
+            return None
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.classes[best], probabilities[best]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': self.VERSION,
+            'classes': self.classes,
+            'ngramRange': list(self.ngram_range),
+            'idf': self.idf,
+            'weights': self.weights,
+            'bias': self.bias,
+            'meta': self.meta
+        }
+    
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+    
+    @classmethod
+    def load(cls, path: str) -> 'RoutingClassifier':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != cls.VERSION:
+            raise ValueError(f"Unsupported routing model version: {data.get('version')}")
+        return cls(
+            classes=data['classes'],
+            ngram_range=tuple(data['ngramRange']),
+            idf=data['idf'],
+            weights=data['weights'],
+            bias=data['bias'],
+            meta=data.get('meta')
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'classes': self.classes,
+            'features': len(self.weights),
+            **{key: self.meta[key] for key in ('trainedAt', 'samples', 'holdoutAccuracy') if key in self.meta}
+        }
+
+
+def load_routing_classifier(path: str) -> Optional[RoutingClassifier]:
+    """시작 시 라우팅 모델 로드 (파일이 없거나 읽을 수 없으면 분류기 없이 동작)"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        classifier = RoutingClassifier.load(path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"⚠️ Failed to load routing model from {path}: {e}")
+        return None
+    logger.info(f"🧠 Loaded routing model from {path} ({len(classifier.weights)} features, classes {classifier.classes})")
+    return classifier
+
+
+routing_classifier = load_routing_classifier(ROUTING_MODEL_PATH)
+
+
+def select_character_by_model(message: str) -> Optional[CharacterInfo]:
+    """로컬 분류기의 확률이 ROUTING_MODEL_THRESHOLD 이상일 때만 캐릭터 선택"""
+    if routing_classifier is None:
+        return None
+    
+    prediction = routing_classifier.predict(message)
+    if prediction is None:
+        return None
+    
+    char_id, probability = prediction
+    logger.info('Routing model prediction', extra={'verbose': True, 'character': char_id, 'probability': round(probability, 4)})
+    character = next((c for c in MENTION_CHARACTERS if c['charId'] == char_id), None)
+    if character is None or probability < ROUTING_MODEL_THRESHOLD:
+        return None
+    return CharacterInfo(
+        charId=character['charId'],
+        charName=character['charName'],
+        charEmoji=character['charEmoji'],
+        reason=f'학습된 라우팅 모델 선택 (확률 {probability:.2f})'
+    )
+
+
+def parse_routing_content(content: str) -> Dict[str, Any]:
+    """라우터 응답에서 JSON 추출 (```json 블록 → 본문 중 {...} → 전체 순서로 시도)"""
+    json_block_match = re.search(r'```json\s*([\s\S]*?)\s*```', content)
+    if json_block_match:
+        return json.loads(json_block_match.group(1))
+    
+    json_match = re.search(r'\{[\s\S]*\}', content)
+    if json_match:
+        return json.loads(json_match.group(0))
+    return json.loads(content)
 
 
-async def select_character_with_llm(message: str) -> CharacterInfo:
-    """LLM 기반 캐릭터 선택"""
-    if not OLLAMA_API_KEY:
-        print('Ollama API key not configured, using keyword-based selection')
-        return select_character_by_keywords(message)
+class RoutingStreamParser:
+    """스트리밍 라우터 응답에서 "character"/"reason" 값을 점진적으로 추출
+    
+    필드마다 검색 위치를 기억해 토큰을 받을 때마다 새로 들어온 부분(아직 닫히지 않은 값이 있으면
+    그 키부터)만 검사하며, "character" 문자열 값이 닫히는 순간 결정이 끝난 것으로 봅니다.
+    "reason"은 그때까지 완성된 경우에만 채워집니다.
+    """
+    
+    _FIELDS = {
+        'character': re.compile(r'"character"\s*:\s*"((?:[^"\\]|\\.)*)"'),
+        'reason': re.compile(r'"reason"\s*:\s*"((?:[^"\\]|\\.)*)"'),
+    }
+    
+    def __init__(self):
+        self._buffer = ''
+        self._positions = {field: 0 for field in self._FIELDS}
+        self.values: Dict[str, str] = {}
+    
+    @property
+    def text(self) -> str:
+        return self._buffer
+    
+    @property
+    def character(self) -> Optional[str]:
+        return self.values.get('character')
+    
+    @property
+    def reason(self) -> Optional[str]:
+        return self.values.get('reason')
+    
+    @staticmethod
+    def _decode(raw: str) -> str:
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw
+    
+    def feed(self, token: str) -> bool:
+        """토큰 추가 후 캐릭터가 결정되었는지 반환"""
+        self._buffer += token
+        for field, pattern in self._FIELDS.items():
+            if field in self.values:
+                continue
+            
+            position = self._positions[field]
+            match = pattern.search(self._buffer, position)
+            if match:
+                self.values[field] = self._decode(match.group(1))
+                continue
+            
+            # 키가 이미 나왔으면 그 위치부터, 아니면 키가 토큰 경계에 걸칠 수 있는 만큼만 남기고 다음에 검사
+            key = f'"{field}"'
+            key_at = self._buffer.find(key, position)
+            self._positions[field] = key_at if key_at >= 0 else max(position, len(self._buffer) - len(key) + 1)
+        return 'character' in self.values
+
+
+# 스트리밍 라우터가 "character"를 받자마자 연결을 끊은 횟수 / 끝까지 읽은 횟수
+router_stream_stats: Dict[str, int] = {'earlyStops': 0, 'fullReads': 0}
+
+
+async def stream_routing_decision(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    """라우터 응답을 스트리밍으로 읽다가 "character" 값이 나오면 바로 업스트림 스트림을 닫음
+    
+    끝까지 읽어도 점진 파싱으로 찾지 못한 경우(코드 블록, 잘린 JSON 등)에는 전체 텍스트를
+    parse_routing_content로 다시 파싱합니다.
+    """
+    parser = RoutingStreamParser()
+    tokens = stream_ollama_completion(
+        messages,
+        options={'max_tokens': 300, 'temperature': 0.1, 'response_format': {'type': 'json_object'}},
+        timeout=httpx.Timeout(ROUTING_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+    )
+    try:
+        async for token in tokens:
+            if parser.feed(token):
+                router_stream_stats['earlyStops'] += 1
+                result: Dict[str, Any] = {'character': parser.character}
+                if parser.reason is not None:
+                    result['reason'] = parser.reason
+                return result
+    finally:
+        await tokens.aclose()
+    
+    router_stream_stats['fullReads'] += 1
+    if not parser.text:
+        raise Exception('No content in routing response')
+    return parse_routing_content(parser.text)
+
+
+async def route_with_llm(message: str) -> CharacterInfo:
+    """LLM 라우터 호출 (실패 시 예외 발생, 성공한 결과는 routing_cache에 저장)"""
+    cached = routing_cache.get(message)
+    if cached:
+        logger.info(f"♻️ Routing cache hit: {cached.charName}", extra={'verbose': True})
+        return cached
     
     routing_prompt = f"""당신은 사용자의 메시지를 분석하여 가장 적합한 AI 캐릭터를 선택하는 라우터입니다.
 
@@ -210,66 +1206,88 @@ async def select_character_with_llm(message: str) -> CharacterInfo:
   "reason": "선택 이유 짤게 답변"
 }}"""
     
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/chat/completions",
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {OLLAMA_API_KEY}'
-                },
-                json={
-                    'model': OLLAMA_MODEL,
-                    'messages': [
-                        {'role': 'system', 'content': '당신은 JSON만 출력하는 라우터입니다. 설명 없이 JSON만 반환하세요.'},
-                        {'role': 'user', 'content': routing_prompt}
-                    ],
-                    'max_tokens': 300,
-                    'temperature': 0.1,
-                    'stream': False,
-                    'response_format': {'type': 'json_object'}
-                }
-            )
-        
-        if response.status_code != 200:
-            raise Exception(f"Routing API error: {response.status_code}")
-        
-        data = response.json()
-        content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
+    routing_result = await stream_routing_decision([
+        {'role': 'system', 'content': '당신은 JSON만 출력하는 라우터입니다. 설명 없이 JSON만 반환하세요.'},
+        {'role': 'user', 'content': routing_prompt}
+    ])
+    
+    character_map = {
+        'char_1': {'charId': 'char_1', 'charName': '루미', 'charEmoji': '💡'},
+        'char_2': {'charId': 'char_2', 'charName': '카이', 'charEmoji': '🌊'},
+        'char_3': {'charId': 'char_3', 'charName': '레오', 'charEmoji': '🌙'}
+    }
+    
+    selected_char = character_map.get(routing_result.get('character'))
+    
+    if not selected_char:
+        raise Exception('Invalid character in routing response')
+    
+    character = CharacterInfo(
+        **selected_char,
+        reason=routing_result.get('reason', 'LLM 선택')
+    )
+    routing_cache.set(message, character)
+    # 라우팅 모델 학습 데이터 (AI_LOG_MESSAGE_BODIES=true일 때만 본문 포함, 샘플링과 무관하게 기록)
+    logger.info(
+        '🧭 LLM routing decision',
+        extra={'routingSample': True, 'text': log_text(message), 'character': character.charId}
+    )
+    return character
+
+
+async def select_group_character(message: str) -> Tuple[CharacterInfo, str]:
+    """그룹 채팅 라우팅: 멘션 → 키워드(확실할 때) → 로컬 분류기(확실할 때) → LLM → 키워드 폴백
+    
+    키워드 점수 1, 2위 차이가 ROUTING_MARGIN_THRESHOLD 이상이거나 로컬 분류기의 확률이
+    ROUTING_MODEL_THRESHOLD 이상이면 LLM 라우터를 건너뜁니다.
+    반환값은 (선택된 캐릭터, 라우팅 경로)이며 경로별 횟수는 routing_stats에 누적됩니다.
+    """
+    started = time.perf_counter()
+    hits = ROUTING_MATCHER.count(message)
+    
+    # 1순위: 멘션 확인
+    mentioned_character = select_character_by_mention(message, hits)
+    observe_stage('mention_routing', started, mentioned_character.charId if mentioned_character else 'none')
+    if mentioned_character:
+        path, character = 'mention', mentioned_character
+    else:
+        # 2순위: 키워드 점수 차이가 충분하면 바로 결정
+        started = time.perf_counter()
+        scores = score_character_keywords(message, hits)
+        margin = keyword_margin(scores)
+        logger.info('Keyword scores', extra={'verbose': True, 'scores': scores, 'margin': margin})
+        decided = max(scores.values()) > 0 and margin >= ROUTING_MARGIN_THRESHOLD
+        keyword_character = select_character_by_scores(scores) if decided else None
+        observe_stage('keyword_routing', started, keyword_character.charId if keyword_character else 'none')
         
-        if not content:
-            raise Exception('No content in routing response')
+        # 3순위: 로컬 분류기가 확신할 때
+        model_character = None
+        if not keyword_character and routing_classifier is not None:
+            started = time.perf_counter()
+            model_character = select_character_by_model(message)
+            observe_stage('model_routing', started, model_character.charId if model_character else 'none')
         
-        # JSON 파싱
-        json_block_match = re.search(r'```json\s*([\s\S]*?)\s*```', content)
-        if json_block_match:
-            routing_result = json.loads(json_block_match.group(1))
+        if keyword_character:
+            path, character = 'keyword', keyword_character
+        elif model_character:
+            path, character = 'model', model_character
+        elif not OLLAMA_API_KEY:
+            logger.warning('Ollama API key not configured, using keyword-based selection')
+            path, character = 'fallback', select_character_by_scores(scores)
         else:
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                routing_result = json.loads(json_match.group(0))
-            else:
-                routing_result = json.loads(content)
-        
-        character_map = {
-            'char_1': {'charId': 'char_1', 'charName': '루미', 'charEmoji': '💡'},
-            'char_2': {'charId': 'char_2', 'charName': '카이', 'charEmoji': '🌊'},
-            'char_3': {'charId': 'char_3', 'charName': '레오', 'charEmoji': '🌙'}
-        }
-        
-        selected_char = character_map.get(routing_result.get('character'))
-        
-        if not selected_char:
-            raise Exception('Invalid character in routing response')
-        
-        return CharacterInfo(
-            **selected_char,
-            reason=routing_result.get('reason', 'LLM 선택')
-        )
+            # 4순위: LLM 기반 라우팅
+            started = time.perf_counter()
+            try:
+                path, character = 'llm', await route_with_llm(message)
+                observe_stage('llm_routing', started, character.charId, 'ollama')
+            except Exception as e:
+                observe_stage('llm_routing', started, provider='ollama', outcome='error')
+                logger.warning(f'LLM routing failed, falling back to keyword-based: {e}')
+                path, character = 'fallback', select_character_by_scores(scores)
     
-    except Exception as e:
-        print(f'LLM routing failed, falling back to keyword-based: {e}')
-        return select_character_by_keywords(message)
+    routing_stats[path] += 1
+    routing_counter.inc(path=path, character=character.charId)
+    return character, path
 
 
 @app.get('/health')
@@ -278,130 +1296,301 @@ async def health_check():
     return {
         'status': 'ok',
         'service': 'AI Server (Python)',
-        'ollamaConfigured': bool(OLLAMA_API_KEY)
+        'ollamaConfigured': bool(OLLAMA_API_KEY),
+        'routing': {
+            'marginThreshold': ROUTING_MARGIN_THRESHOLD,
+            'paths': routing_stats,
+            'model': routing_classifier.stats() if routing_classifier else None,
+            'modelThreshold': ROUTING_MODEL_THRESHOLD,
+            'stream': router_stream_stats,
+            'cache': routing_cache.stats()
+        },
+        'context': {
+            'tokenBudget': CONTEXT_TOKEN_BUDGET,
+            'tokenCache': token_counter.stats(),
+            'calendarCache': calendar_context_builder.stats()
+        },
+        'idempotency': idempotency_cache.stats(),
+        'circuitBreakers': {
+            ollama_breaker.name: camel_case_keys(ollama_breaker.stats())
+        },
+        'retryBudget': retry_budget.stats(),
+        'admission': {
+            request_limiter.name: camel_case_keys(request_limiter.stats()),
+            ollama_limiter.name: camel_case_keys(ollama_limiter.stats())
+        },
+        'logging': {
+            'level': LOG_LEVEL,
+            'sampleRate': LOG_SAMPLE_RATE,
+            'queued': log_handler.queue.qsize(),
+            'dropped': log_handler.dropped
+        }
     }
 
 
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 메트릭 (텍스트 포맷 0.0.4)"""
+    lines = [line for metric in metrics_registry for line in metric.render()]
+    return PlainTextResponse('\n'.join(lines) + '\n', media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def get_fallback_content(char_id: str) -> str:
+    """캐릭터별 폴백 응답 선택"""
+    responses = FALLBACK_RESPONSES.get(char_id, FALLBACK_RESPONSES['char_1'])
+    return random.choice(responses)
+
+
+async def resolve_responding_character(request: ChatRequest) -> Tuple[str, Optional[CharacterInfo]]:
+    """그룹 채팅이면 응답할 캐릭터를 선택하고 (실제 캐릭터 ID, 캐릭터 정보) 반환"""
+    if request.characterId != 'char_group':
+        return request.characterId, None
+
+    logger.info('=== Group Chat: Starting character selection ===', extra={'verbose': True})
+
+    responding_character, path = await select_group_character(request.message)
+    logger.info(f"🎯 Routing ({path}): {responding_character.charName}", extra={'path': path, 'character': responding_character.charId})
+    return responding_character.charId, responding_character
+
+
+CHAT_GUIDELINES = """대화할 때:
+1. 짧고 자연스러운 답변을 하세요 (2-3문장)
+2. 사용자의 감정을 인정하고 공감하세요
+3. 필요시 질문으로 대화를 이어가세요
+4. 전문가가 아닌 친구처럼 대화하세요
+5. 캐릭터의 고유한 스타일을 유지하세요
+6. 이전 대화 내용을 참고하여 맥락있는 답변을 하세요"""
+
+# 캐릭터별 고정 시스템 프롬프트 (사용자와 무관하게 항상 같은 문자열)
+_system_prompt_cache: Dict[str, str] = {}
+
+
+def build_system_prompt(char_id: str) -> str:
+    """캐릭터 프롬프트 + 대화 지침 (캐릭터별로 한 번만 생성)
+    
+    사용자 정보나 일정은 넣지 않으므로 모든 사용자의 요청이 같은 접두어로 시작하고,
+    업스트림의 프롬프트 접두어(KV) 캐시가 적중할 수 있습니다.
+    """
+    if char_id not in CHARACTER_PROMPTS:
+        char_id = 'char_1'
+    prompt = _system_prompt_cache.get(char_id)
+    if prompt is None:
+        prompt = f"{CHARACTER_PROMPTS[char_id]}\n\n{CHAT_GUIDELINES}"
+        _system_prompt_cache[char_id] = prompt
+    return prompt
+
+
+def build_user_context(profile: Dict[str, Any], calendar_context: str = "") -> str:
+    """요청마다 달라지는 사용자 정보(+ 리브의 캘린더 일정) 메시지"""
+    return f"""사용자 정보:
+- 닉네임: {profile.get('nickname', '익명')}
+- AI가 알면 좋은 정보: {profile.get('aiInfo', '없음')}{calendar_context}"""
+
+
+def build_chat_messages(request: ChatRequest, actual_char_id: str) -> List[Dict[str, str]]:
+    """고정 시스템 프롬프트 + 사용자 정보 + 대화 히스토리 + 현재 메시지로 업스트림 메시지 구성"""
+    started = time.perf_counter()
+    calendar_context = ""
+    if actual_char_id == 'char_4' and request.calendarEvents:
+        # 리브: 지금과 가까운 일정만 골라 캐시된 블록으로 포함
+        logger.info(f"📅 Including {len(request.calendarEvents)} calendar events in AI context", extra={'verbose': True})
+        calendar_context = calendar_context_builder.build(request.calendarEvents)
+    
+    system_prompt = build_system_prompt(actual_char_id)
+    user_context = build_user_context(request.profile or {}, calendar_context)
+    
+    messages = [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'system', 'content': user_context},
+        *fit_history_to_budget([system_prompt, user_context], request.chatHistory or [], request.message, CONTEXT_TOKEN_BUDGET),
+        {'role': 'user', 'content': request.message}
+    ]
+    observe_stage('prompt_build', started, actual_char_id, 'ollama')
+    return messages
+
+
+async def stream_ollama_completion(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]] = None,
+    timeout: Optional[httpx.Timeout] = None
+) -> AsyncIterator[str]:
+    """Ollama 스트리밍 응답에서 토큰(delta content)을 순서대로 반환
+    
+    동시 호출 제한과 서킷 브레이커는 적용하지만, 이미 토큰을 보냈을 수 있으므로 재시도하지 않습니다.
+    options는 기본 생성 파라미터(max_tokens, temperature 등)를 덮어씁니다.
+    호출자가 중간에 aclose()하면 업스트림 연결도 바로 닫습니다.
+    """
+    async with ollama_limiter.slot():
+        tokens = _stream_ollama_tokens(messages, options or {}, timeout)
+        try:
+            async for token in tokens:
+                yield token
+        finally:
+            await tokens.aclose()
+
+
+async def _stream_ollama_tokens(
+    messages: List[Dict[str, str]],
+    options: Dict[str, Any],
+    timeout: Optional[httpx.Timeout]
+) -> AsyncIterator[str]:
+    permit = ollama_breaker.allow()
+    if not permit:
+        raise CircuitOpenError(f"Circuit breaker '{ollama_breaker.name}' is open")
+    
+    try:
+        async with get_http_client().stream(
+            'POST',
+            f"{OLLAMA_BASE_URL}/chat/completions",
+            headers={'Authorization': f'Bearer {OLLAMA_API_KEY}'},
+            json={
+                'model': OLLAMA_MODEL,
+                'messages': messages,
+                'max_tokens': 1024,
+                'temperature': 0.7,
+                **options,
+                'stream': True
+            },
+            timeout=timeout or httpx.USE_CLIENT_DEFAULT
+        ) as response:
+            if response.status_code != 200:
+                error_text = (await response.aread()).decode('utf-8', errors='replace')
+                logger.error(f"❌ Ollama API error: {response.status_code}", extra={'body': error_text[:500]})
+                raise UpstreamError(
+                    response.status_code,
+                    retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                )
+            
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                payload = line[len('data:'):].strip()
+                if payload == '[DONE]':
+                    break
+                
+                chunk = json.loads(payload)
+                token = (chunk.get('choices') or [{}])[0].get('delta', {}).get('content')
+                if token:
+                    yield token
+    except Exception as e:
+        record_upstream_failure(ollama_breaker, permit, e)
+        raise
+    except GeneratorExit:
+        # 호출자가 필요한 토큰을 받고 스트림을 먼저 닫음 - 업스트림은 정상 응답 중이었음
+        ollama_breaker.record_success()
+        raise
+    except BaseException:
+        ollama_breaker.release(permit)
+        raise
+    
+    ollama_breaker.record_success()
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Events 프레임 생성"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def overloaded_exception(error: OverloadedError) -> HTTPException:
+    """요청 대기열이 가득 찼을 때 보낼 429 응답"""
+    logger.warning(f"🚦 Rejecting request: {error}")
+    return HTTPException(
+        status_code=429,
+        detail='AI server is busy, please retry later',
+        headers={'Retry-After': str(math.ceil(error.retry_after))}
+    )
+
+
 @app.post('/ai/chat', response_model=ChatResponse)
-async def ai_chat(request: ChatRequest):
-    """AI 응답 생성 엔드포인트"""
+async def ai_chat(
+    request: ChatRequest,
+    idempotency_key: Optional[str] = Header(None, alias='Idempotency-Key')
+):
+    """AI 응답 생성 엔드포인트
+    
+    같은 Idempotency-Key(없으면 같은 캐릭터·프로필·메시지·최근 히스토리·캘린더)의 재시도는
+    저장된 응답을 반환하거나 진행 중인 첫 요청의 결과를 기다립니다.
+    같은 Idempotency-Key를 다른 본문에 다시 쓰면 422를 반환합니다.
+    동시 요청 한도와 대기열이 모두 차 있으면 기다리지 않고 429 + Retry-After를 반환합니다.
+    """
+    key = idempotency_cache.make_key(request, idempotency_key)
+    if key is None:
+        return await admit_chat_request(request)
+    fingerprint = IdempotencyCache.fingerprint(request) if idempotency_key else None
+    try:
+        return await idempotency_cache.run(key, lambda: admit_chat_request(request), fingerprint)
+    except IdempotencyKeyConflict:
+        raise HTTPException(status_code=422, detail='Idempotency-Key was already used with a different request body')
+
+
+async def admit_chat_request(request: ChatRequest) -> ChatResponse:
+    """요청 슬롯을 얻은 뒤 채팅 응답 생성 (대기열이 가득 차면 429)"""
+    try:
+        await request_limiter.acquire()
+    except OverloadedError as e:
+        observe_request('/ai/chat', time.perf_counter(), request.characterId, 'none', 'error')
+        raise overloaded_exception(e)
+    
+    try:
+        return await generate_chat_response(request)
+    finally:
+        request_limiter.release()
+
+
+async def generate_chat_response(request: ChatRequest, endpoint: str = '/ai/chat') -> ChatResponse:
+    """채팅 응답 생성 (실패하면 폴백 응답)
+    
+    Ollama 호출 슬롯을 AI_QUEUE_TIMEOUT 안에 얻지 못하거나 대기열이 가득 차 있으면 OverloadedError로 실패하여 폴백 응답이 됩니다.
+    """
+    started = time.perf_counter()
     try:
         if not request.message:
             raise HTTPException(status_code=400, detail='Message is required')
         
-        print(f"\n📥 Received chat request for character: {request.characterId}")
-        print(f"📝 Message: {request.message}")
-        print(f"📜 Chat history length: {len(request.chatHistory)} messages")
-        
-        actual_char_id = request.characterId
-        responding_character = None
+        logger.info(
+            f"📥 Received chat request for character: {request.characterId}",
+            extra={'verbose': True, 'text': log_text(request.message), 'historyLength': len(request.chatHistory or [])}
+        )
         
         # 그룹 채팅인 경우 캐릭터 선택
-        if request.characterId == 'char_group':
-            print('=== Group Chat: Starting character selection ===')
-            
-            # 1순위: 멘션 확인
-            mentioned_character = select_character_by_mention(request.message)
-            if mentioned_character:
-                responding_character = mentioned_character
-                actual_char_id = responding_character.charId
-                print(f"🎯 Priority: Mention - {responding_character.charName}")
-            else:
-                # 2순위: LLM 기반 라우팅
-                responding_character = await select_character_with_llm(request.message)
-                actual_char_id = responding_character.charId
-                print(f"🤖 LLM routing: {responding_character.charName}")
+        actual_char_id, responding_character = await resolve_responding_character(request)
         
         # Ollama API 호출
         if not OLLAMA_API_KEY:
-            print('Ollama API key not configured, using fallback response')
-            responses = FALLBACK_RESPONSES.get(actual_char_id, FALLBACK_RESPONSES['char_1'])
+            logger.warning('Ollama API key not configured, using fallback response')
+            observe_request(endpoint, started, actual_char_id, 'none', 'fallback')
             return ChatResponse(
-                content=random.choice(responses),
+                content=get_fallback_content(actual_char_id),
                 respondingCharacter=responding_character,
                 fallback=True
             )
         
-        # 시스템 프롬프트 생성
-        calendar_context = ""
-        if actual_char_id == 'char_4' and request.calendarEvents:
-            # Format calendar events for Rive character
-            print(f"📅 Including {len(request.calendarEvents)} calendar events in AI context")
-            calendar_context = "\n\n📅 **구글 캘린더 일정:**\n"
-            for i, event in enumerate(request.calendarEvents[:10], 1):  # Limit to 10 events
-                summary = event.get('summary', '제목 없음')
-                start = event.get('start', {})
-                start_time = start.get('dateTime') or start.get('date', '시간 미정')
-                
-                # Parse and format time
-                try:
-                    from datetime import datetime
-                    if 'T' in start_time:
-                        dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-                        formatted_time = dt.strftime('%m월 %d일 %H:%M')
-                    else:
-                        dt = datetime.fromisoformat(start_time)
-                        formatted_time = dt.strftime('%m월 %d일 (종일)')
-                except:
-                    formatted_time = start_time
-                
-                location = event.get('location', '')
-                location_str = f" 📍 {location}" if location else ""
-                
-                calendar_context += f"{i}. {summary} - {formatted_time}{location_str}\n"
-            
-            calendar_context += "\n💡 위 일정을 참고하여 사용자의 하루 리듬을 분석하고, 일정 관리에 대한 피드백을 제공하세요."
+        messages = build_chat_messages(request, actual_char_id)
         
-        system_prompt = f"""{CHARACTER_PROMPTS.get(actual_char_id, CHARACTER_PROMPTS['char_1'])}
-
-사용자 정보:
-- 닉네임: {request.profile.get('nickname', '익명')}
-- AI가 알면 좋은 정보: {request.profile.get('aiInfo', '없음')}{calendar_context}
-
-대화할 때:
-1. 짧고 자연스러운 답변을 하세요 (2-3문장)
-2. 사용자의 감정을 인정하고 공감하세요
-3. 필요시 질문으로 대화를 이어가세요
-4. 전문가가 아닌 친구처럼 대화하세요
-5. 캐릭터의 고유한 스타일을 유지하세요
-6. 이전 대화 내용을 참고하여 맥락있는 답변을 하세요"""
+        logger.info(f"🔮 Calling Ollama API for {actual_char_id}...", extra={'verbose': True})
         
-        messages = [
-            {'role': 'system', 'content': system_prompt},
-            *[{'role': msg.role, 'content': msg.content} for msg in request.chatHistory],
-            {'role': 'user', 'content': request.message}
-        ]
-        
-        print(f"🔮 Calling Ollama API for {actual_char_id}...")
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/chat/completions",
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {OLLAMA_API_KEY}'
-                },
-                json={
-                    'model': OLLAMA_MODEL,
-                    'messages': messages,
-                    'max_tokens': 1024,
-                    'temperature': 0.7,
-                    'stream': False
-                }
-            )
-        
-        if response.status_code != 200:
-            error_text = response.text
-            print(f"❌ Ollama API error: {response.status_code} - {error_text}")
-            raise Exception(f"Ollama API error: {response.status_code}")
-        
-        data = response.json()
-        ai_content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
-        
-        if not ai_content:
-            raise Exception('No content in Ollama response')
+        upstream_started = time.perf_counter()
+        try:
+            response = await post_ollama({
+                'model': OLLAMA_MODEL,
+                'messages': messages,
+                'max_tokens': 1024,
+                'temperature': 0.7,
+                'stream': False
+            })
+            
+            data = response.json()
+            ai_content = data.get('choices', [{}])[0].get('message', {}).get('content', '')
+            
+            if not ai_content:
+                raise Exception('No content in Ollama response')
+        except Exception:
+            observe_stage('upstream_generation', upstream_started, actual_char_id, 'ollama', 'error')
+            raise
+        observe_stage('upstream_generation', upstream_started, actual_char_id, 'ollama')
         
-        print('✅ Ollama response successful')
+        logger.info('✅ Ollama response successful', extra={'verbose': True})
+        observe_request(endpoint, started, actual_char_id, 'ollama', 'success')
         
         return ChatResponse(
             content=ai_content,
@@ -409,23 +1598,182 @@ async def ai_chat(request: ChatRequest):
         )
     
     except Exception as e:
-        print(f'❌ AI chat error: {e}')
+        logger.error(f'❌ AI chat error: {e}')
         
         # Fallback response
         actual_char_id = request.characterId if request.characterId != 'char_group' else 'char_1'
-        responses = FALLBACK_RESPONSES.get(actual_char_id, FALLBACK_RESPONSES['char_1'])
+        observe_request(endpoint, started, actual_char_id, 'ollama', 'fallback')
         
         return ChatResponse(
-            content=random.choice(responses),
+            content=get_fallback_content(actual_char_id),
             respondingCharacter=None,
             fallback=True
         )
 
 
+# 배치 항목은 요청이 여러 개 들어와도 합쳐서 BATCH_CONCURRENCY개까지만 동시에 처리
+batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+
+@app.post('/ai/chat/batch', response_model=BatchChatResponse)
+async def ai_chat_batch(batch: BatchChatRequest):
+    """여러 채팅 요청을 동시성 제한 안에서 처리 (야간 인사말 재생성, 일기 제안 백필 등)
+    
+    각 항목은 /ai/chat과 같은 로직으로 처리되며, 실패한 항목은 fallback=True인 폴백 응답이 됩니다.
+    항목마다 /ai/chat과 같은 요청 슬롯을 얻으므로 배치도 전역 동시 요청 한도와 대기열을 함께 씁니다.
+    슬롯을 얻지 못한 항목이 생기면 남은 항목은 시작하지 않고 rejectedCount로 알려주며,
+    한 항목도 처리하지 못했으면 429 + Retry-After를 반환합니다.
+    """
+    if len(batch.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f'Batch size exceeds {BATCH_MAX_ITEMS} items')
+    
+    # 요청별 동시성은 전역 세마포어 안에서 추가로 제한
+    concurrency = min(batch.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    local_semaphore = asyncio.Semaphore(max(1, concurrency))
+    overloaded: Optional[OverloadedError] = None
+    
+    async def run(item: ChatRequest) -> Optional[ChatResponse]:
+        nonlocal overloaded
+        async with local_semaphore, batch_semaphore:
+            if overloaded is not None:
+                return None
+            try:
+                await request_limiter.acquire()
+            except OverloadedError as e:
+                overloaded = overloaded or e
+                return None
+            try:
+                return await generate_chat_response(item, endpoint='/ai/chat/batch')
+            finally:
+                request_limiter.release()
+    
+    logger.info(f"📦 Received batch of {len(batch.requests)} chat requests (concurrency {concurrency})")
+    outcomes = await asyncio.gather(*(run(item) for item in batch.requests))
+    
+    rejected = [item for item, outcome in zip(batch.requests, outcomes) if outcome is None]
+    for item in rejected:
+        observe_request('/ai/chat/batch', time.perf_counter(), item.characterId, 'none', 'error')
+    if rejected and len(rejected) == len(outcomes):
+        raise overloaded_exception(overloaded)
+    if rejected:
+        logger.warning(f"🚦 Batch ran {len(outcomes) - len(rejected)} of {len(outcomes)} items; the rest were rejected")
+    
+    results = [
+        outcome if outcome is not None else ChatResponse(
+            content=get_fallback_content(item.characterId if item.characterId != 'char_group' else 'char_1'),
+            fallback=True
+        )
+        for item, outcome in zip(batch.requests, outcomes)
+    ]
+    return BatchChatResponse(
+        results=results,
+        fallbackCount=sum(1 for result in results if result.fallback),
+        rejectedCount=len(rejected)
+    )
+
+
+@app.post('/ai/chat/stream')
+async def ai_chat_stream(request: ChatRequest):
+    """AI 응답 스트리밍 엔드포인트 (Server-Sent Events)
+    
+    이벤트 순서: meta → token* → done
+    - meta: {"respondingCharacter": {...} | null}
+    - token: {"content": "<토큰 조각>"}
+    - fallback: {"content": "<폴백 응답>", "partial": bool}
+      업스트림이 실패하면 전송되며, 클라이언트는 이미 받은 token 내용을 이 내용으로 교체합니다.
+    - done: {"fallback": bool}
+    
+    동시 요청 한도와 대기열이 모두 차 있으면 스트림을 열지 않고 429 + Retry-After를 반환합니다.
+    """
+    try:
+        await request_limiter.acquire()
+    except OverloadedError as e:
+        observe_request('/ai/chat/stream', time.perf_counter(), request.characterId, 'none', 'error')
+        raise overloaded_exception(e)
+    
+    released = False
+    
+    def release_slot() -> None:
+        # 스트림이 끝날 때와 응답 전송 후(BackgroundTask) 중 먼저 오는 쪽에서 한 번만 반환
+        nonlocal released
+        if not released:
+            released = True
+            request_limiter.release()
+    
+    async def event_stream() -> AsyncIterator[str]:
+        started = time.perf_counter()
+        actual_char_id = request.characterId if request.characterId != 'char_group' else 'char_1'
+        meta_sent = False
+        streamed = False
+        
+        try:
+            if not request.message:
+                raise ValueError('Message is required')
+            
+            logger.info(
+                f"📥 Received streaming chat request for character: {request.characterId}",
+                extra={'verbose': True, 'text': log_text(request.message), 'historyLength': len(request.chatHistory or [])}
+            )
+            
+            actual_char_id, responding_character = await resolve_responding_character(request)
+            yield format_sse('meta', {
+                'respondingCharacter': responding_character.model_dump() if responding_character else None
+            })
+            meta_sent = True
+            
+            if not OLLAMA_API_KEY:
+                logger.warning('Ollama API key not configured, using fallback response')
+                observe_request('/ai/chat/stream', started, actual_char_id, 'none', 'fallback')
+                yield format_sse('fallback', {'content': get_fallback_content(actual_char_id), 'partial': False})
+                yield format_sse('done', {'fallback': True})
+                return
+            
+            messages = build_chat_messages(request, actual_char_id)
+            
+            logger.info(f"🔮 Streaming Ollama API for {actual_char_id}...", extra={'verbose': True})
+            
+            upstream_started = time.perf_counter()
+            try:
+                async for token in stream_ollama_completion(messages):
+                    streamed = True
+                    yield format_sse('token', {'content': token})
+                
+                if not streamed:
+                    raise Exception('No content in Ollama stream')
+            except Exception:
+                observe_stage('upstream_generation', upstream_started, actual_char_id, 'ollama', 'error')
+                raise
+            observe_stage('upstream_generation', upstream_started, actual_char_id, 'ollama')
+            
+            logger.info('✅ Ollama stream completed', extra={'verbose': True})
+            observe_request('/ai/chat/stream', started, actual_char_id, 'ollama', 'success')
+            yield format_sse('done', {'fallback': False})
+        
+        except Exception as e:
+            logger.error(f'❌ AI chat stream error: {e}')
+            observe_request('/ai/chat/stream', started, actual_char_id, 'ollama', 'fallback')
+            
+            if not meta_sent:
+                yield format_sse('meta', {'respondingCharacter': None})
+            yield format_sse('fallback', {'content': get_fallback_content(actual_char_id), 'partial': streamed})
+            yield format_sse('done', {'fallback': True})
+        
+        finally:
+            release_slot()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        background=BackgroundTask(release_slot)
+    )
+
+
 if __name__ == '__main__':
     print("🤖 Starting AI Server (Python FastAPI)...")
     print(f"📡 Ollama API: {OLLAMA_BASE_URL}")
     print(f"🔑 API Key configured: {bool(OLLAMA_API_KEY)}")
+    print(f"🔌 HTTP pool: max={HTTP_MAX_CONNECTIONS}, keepalive={HTTP_MAX_KEEPALIVE}, http2={HTTP2_ENABLED}")
     print(f"🚀 Server will run on http://localhost:{PORT}")
     
     uvicorn.run(app, host='0.0.0.0', port=PORT)
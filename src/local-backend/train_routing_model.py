@@ -0,0 +1,221 @@
+"""
+그룹 채팅 라우팅 모델 학습 CLI
+
+LLM 라우터가 고른 (메시지, 캐릭터) 기록으로 문자 n-gram TF-IDF + 소프트맥스 회귀 모델을 학습하고,
+ai_server가 시작할 때 읽는 JSON 모델 파일로 저장합니다 (표준 라이브러리만 사용).
+
+입력 파일은 한 줄에 JSON 하나이며, 다음 두 형식을 모두 읽습니다.
+    {"message": "요즘 너무 지쳐", "character": "char_1"}                 # 직접 만든 데이터
+    {"msg": "🧭 LLM routing decision", "routingSample": true, "text": "...", "character": "char_2", ...}
+                                                                         # ai_server JSON 로그
+로그에서 학습하려면 서버를 AI_LOG_FORMAT=json, AI_LOG_MESSAGE_BODIES=true로 실행해야 합니다
+(본문이 가려진 기록은 건너뜀).
+
+실행:
+    python src/local-backend/train_routing_model.py logs/ai_server.log
+    python src/local-backend/train_routing_model.py data.jsonl --output routing_model.json --epochs 20
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 학습 중 서버 로그가 출력을 방해하지 않도록
+os.environ.setdefault('AI_LOG_LEVEL', 'WARNING')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_server import ROUTING_MODEL_PATH, ROUTING_MODEL_THRESHOLD, RoutingCache, RoutingClassifier  # noqa: E402
+
+
+def read_samples(paths: Iterable[str]) -> List[Tuple[str, str]]:
+    """입력 파일들에서 (메시지, 캐릭터) 쌍 읽기 - 같은 메시지(정규화 기준)는 마지막 라벨만 사용"""
+    samples: Dict[str, Tuple[str, str]] = {}
+    skipped = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line.startswith('{'):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+
+                if record.get('routingSample'):
+                    message = record.get('text', '')
+                else:
+                    message = record.get('message', '')
+                character = record.get('character')
+                if not isinstance(message, str) or not message or not isinstance(character, str):
+                    continue
+                if message.startswith('<redacted'):
+                    skipped += 1
+                    continue
+
+                key = RoutingCache.normalize(message)
+                if key:
+                    samples[key] = (message, character)
+
+    if skipped:
+        print(f"⚠️ Skipped {skipped} unreadable or redacted records")
+    return list(samples.values())
+
+
+def build_idf(documents: List[Dict[str, int]], min_df: int) -> Dict[str, float]:
+    """문서 빈도 min_df 이상인 n-gram의 평활화 IDF"""
+    df: Counter = Counter()
+    for counts in documents:
+        df.update(counts.keys())
+    total = len(documents)
+    return {
+        gram: math.log((1 + total) / (1 + count)) + 1.0
+        for gram, count in df.items() if count >= min_df
+    }
+
+
+def train(
+    samples: List[Tuple[str, str]],
+    ngram_range: Tuple[int, int],
+    epochs: int,
+    learning_rate: float,
+    l2: float,
+    min_df: int,
+    prune: float,
+    seed: int
+) -> RoutingClassifier:
+    """확률적 경사 하강법으로 다중 클래스 로지스틱 회귀 학습"""
+    classes = sorted({character for _, character in samples})
+    class_index = {character: i for i, character in enumerate(classes)}
+
+    counts = [RoutingClassifier.count_ngrams(message, ngram_range) for message, _ in samples]
+    idf = build_idf(counts, min_df)
+    data = [
+        (RoutingClassifier.weigh(sample_counts, idf), class_index[character])
+        for sample_counts, (_, character) in zip(counts, samples)
+    ]
+
+    weights: Dict[str, List[float]] = {gram: [0.0] * len(classes) for gram in idf}
+    bias = [0.0] * len(classes)
+    rng = random.Random(seed)
+
+    for epoch in range(epochs):
+        rng.shuffle(data)
+        rate = learning_rate / (1 + 0.1 * epoch)
+        loss = 0.0
+        for features, label in data:
+            scores = list(bias)
+            for gram, value in features.items():
+                for i, weight in enumerate(weights[gram]):
+                    scores[i] += weight * value
+            top = max(scores)
+            exps = [math.exp(score - top) for score in scores]
+            total = sum(exps)
+            probabilities = [value / total for value in exps]
+            loss -= math.log(max(probabilities[label], 1e-12))
+
+            gradients = [p - (1.0 if i == label else 0.0) for i, p in enumerate(probabilities)]
+            for gram, value in features.items():
+                row = weights[gram]
+                for i, gradient in enumerate(gradients):
+                    row[i] -= rate * (gradient * value + l2 * row[i])
+            for i, gradient in enumerate(gradients):
+                bias[i] -= rate * gradient
+        print(f"  epoch {epoch + 1:>2}/{epochs}  loss {loss / max(len(data), 1):.4f}")
+
+    # 모든 클래스 가중치가 작은 n-gram은 버려서 모델 파일 크기를 줄임
+    kept = {
+        gram: [round(weight, 5) for weight in row]
+        for gram, row in weights.items() if max(abs(weight) for weight in row) >= prune
+    }
+    return RoutingClassifier(
+        classes=classes,
+        ngram_range=ngram_range,
+        idf={gram: round(idf[gram], 5) for gram in kept},
+        weights=kept,
+        bias=[round(value, 5) for value in bias]
+    )
+
+
+def evaluate(classifier: RoutingClassifier, samples: List[Tuple[str, str]], threshold: float) -> Dict[str, float]:
+    """전체 정확도, 임계값 이상으로 결정한 비율(coverage)과 그 정확도"""
+    correct = covered = covered_correct = 0
+    for message, character in samples:
+        prediction = classifier.predict(message)
+        if prediction is None:
+            continue
+        predicted, probability = prediction
+        correct += predicted == character
+        if probability >= threshold:
+            covered += 1
+            covered_correct += predicted == character
+    total = len(samples) or 1
+    return {
+        'accuracy': round(correct / total, 4),
+        'coverage': round(covered / total, 4),
+        'coveredAccuracy': round(covered_correct / covered, 4) if covered else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='그룹 채팅 라우팅 모델 학습')
+    parser.add_argument('inputs', nargs='+', help='(메시지, 캐릭터) JSON Lines 파일 또는 ai_server JSON 로그')
+    parser.add_argument('--output', default=ROUTING_MODEL_PATH, help=f'모델 저장 경로 (기본 {ROUTING_MODEL_PATH})')
+    parser.add_argument('--ngram-min', type=int, default=1, help='최소 문자 n-gram 길이 (기본 1)')
+    parser.add_argument('--ngram-max', type=int, default=3, help='최대 문자 n-gram 길이 (기본 3)')
+    parser.add_argument('--epochs', type=int, default=15, help='학습 반복 횟수 (기본 15)')
+    parser.add_argument('--learning-rate', type=float, default=0.5, help='초기 학습률 (기본 0.5)')
+    parser.add_argument('--l2', type=float, default=1e-5, help='L2 정규화 계수 (기본 1e-5)')
+    parser.add_argument('--min-df', type=int, default=2, help='어휘에 포함할 최소 문서 빈도 (기본 2)')
+    parser.add_argument('--prune', type=float, default=1e-3, help='이보다 작은 가중치만 가진 n-gram 제거 (기본 1e-3)')
+    parser.add_argument('--holdout', type=float, default=0.1, help='평가용으로 떼어 둘 비율 (기본 0.1)')
+    parser.add_argument('--threshold', type=float, default=ROUTING_MODEL_THRESHOLD,
+                        help=f'평가에 쓸 확률 임계값 (기본 AI_ROUTING_MODEL_THRESHOLD={ROUTING_MODEL_THRESHOLD})')
+    parser.add_argument('--seed', type=int, default=42, help='셔플 시드')
+    args = parser.parse_args(argv)
+
+    samples = read_samples(args.inputs)
+    labels = Counter(character for _, character in samples)
+    print(f"📚 {len(samples)} samples: " + ', '.join(f"{character}={count}" for character, count in sorted(labels.items())))
+    if len(labels) < 2 or len(samples) < 20:
+        print("❌ Need at least 20 samples covering 2 or more characters")
+        return 1
+
+    rng = random.Random(args.seed)
+    rng.shuffle(samples)
+    holdout_size = int(len(samples) * args.holdout)
+    holdout, training = samples[:holdout_size], samples[holdout_size:]
+
+    ngram_range = (args.ngram_min, args.ngram_max)
+    classifier = train(training, ngram_range, args.epochs, args.learning_rate, args.l2, args.min_df, args.prune, args.seed)
+
+    report = evaluate(classifier, holdout, args.threshold) if holdout else {}
+    if report:
+        print(
+            f"🎯 Holdout ({len(holdout)}): accuracy {report['accuracy']:.1%}, "
+            f"coverage at {args.threshold:.2f} {report['coverage']:.1%} "
+            f"(accuracy {report['coveredAccuracy']:.1%})"
+        )
+
+    classifier.meta = {
+        'trainedAt': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'samples': len(training),
+        'holdoutAccuracy': report.get('accuracy'),
+        'holdoutCoverage': report.get('coverage'),
+        'threshold': args.threshold,
+    }
+    classifier.save(args.output)
+    print(f"💾 Saved {len(classifier.weights)} features to {args.output} ({os.path.getsize(args.output) / 1024:.1f} KiB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,9 @@
+"""두 서버 모듈과 공용 모듈(src/ai_common)을 import할 수 있도록 경로 추가"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'local-backend'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'ai_serever'))
@@ -0,0 +1,108 @@
+"""ai_common.resilience.AdmissionLimiter: 즉시 획득, 대기 시간 초과, 대기열이 가득 찼을 때 거절"""
+
+import asyncio
+import time
+
+import pytest
+
+from ai_common.resilience import AdmissionLimiter, OverloadedError
+
+
+def test_free_slot_is_acquired_without_waiting():
+    async def scenario():
+        limiter = AdmissionLimiter('test', limit=2, max_queue=0, queue_timeout=1.0)
+        await limiter.acquire()
+        await limiter.acquire()
+        stats = limiter.stats()
+        limiter.release()
+        limiter.release()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats['in_flight'] == 2
+    assert stats['admitted'] == 2
+    assert stats['max_wait_ms'] == 0.0
+
+
+def test_queued_request_times_out():
+    async def scenario():
+        limiter = AdmissionLimiter('test', limit=1, max_queue=1, queue_timeout=0.05)
+        await limiter.acquire()
+        started = time.monotonic()
+        with pytest.raises(OverloadedError) as excinfo:
+            await limiter.acquire()
+        return limiter, time.monotonic() - started, excinfo.value
+
+    limiter, waited, error = asyncio.run(scenario())
+    assert waited >= 0.05
+    assert error.retry_after >= 1.0
+    assert limiter.rejected == 1
+    assert limiter.queued == 0
+    assert limiter.in_flight == 1
+
+
+def test_queued_request_gets_released_slot():
+    async def scenario():
+        limiter = AdmissionLimiter('test', limit=1, max_queue=1, queue_timeout=1.0)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+        limiter.release()
+        await waiter
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.in_flight == 1
+    assert limiter.admitted == 2
+    assert limiter.rejected == 0
+
+
+def test_full_queue_sheds_immediately():
+    async def scenario():
+        limiter = AdmissionLimiter('test', limit=1, max_queue=1, queue_timeout=5.0)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        started = time.monotonic()
+        with pytest.raises(OverloadedError):
+            await limiter.acquire()
+        shed_after = time.monotonic() - started
+
+        limiter.release()
+        await waiter
+        limiter.release()
+        return limiter, shed_after
+
+    limiter, shed_after = asyncio.run(scenario())
+    assert shed_after < 1.0
+    assert limiter.rejected == 1
+    assert limiter.in_flight == 0
+
+
+def test_slot_is_released_when_body_raises():
+    async def scenario():
+        limiter = AdmissionLimiter('test', limit=1, max_queue=0, queue_timeout=1.0)
+        with pytest.raises(RuntimeError):
+            async with limiter.slot():
+                raise RuntimeError('boom')
+        async with limiter.slot():
+            pass
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.in_flight == 0
+    assert limiter.admitted == 2
+
+
+def test_non_positive_limit_disables_admission_control():
+    async def scenario():
+        limiter = AdmissionLimiter('test', limit=0, max_queue=0, queue_timeout=0.01)
+        for _ in range(100):
+            await limiter.acquire()
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.in_flight == 100
+    assert limiter.rejected == 0
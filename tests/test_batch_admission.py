@@ -0,0 +1,87 @@
+"""ai_server.ai_chat_batch: 항목마다 요청 슬롯 사용, 슬롯이 없으면 rejectedCount 또는 429"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import ai_server
+from ai_common.resilience import AdmissionLimiter
+from ai_server import BatchChatRequest, ChatRequest, ChatResponse
+
+
+@pytest.fixture
+def fake_generate(monkeypatch):
+    calls = []
+
+    async def generate(request, endpoint='/ai/chat'):
+        calls.append((request.message, ai_server.request_limiter.in_flight))
+        await asyncio.sleep(0.01)
+        return ChatResponse(content=f'답변: {request.message}')
+
+    monkeypatch.setattr(ai_server, 'generate_chat_response', generate)
+    monkeypatch.setattr(ai_server, 'batch_semaphore', asyncio.Semaphore(ai_server.BATCH_CONCURRENCY))
+    return calls
+
+
+def make_batch(count: int) -> BatchChatRequest:
+    return BatchChatRequest(requests=[ChatRequest(characterId='char_1', message=f'm{i}') for i in range(count)])
+
+
+def test_batch_items_hold_request_slots(monkeypatch, fake_generate):
+    monkeypatch.setattr(ai_server, 'request_limiter', AdmissionLimiter('requests', limit=2, max_queue=8, queue_timeout=1.0))
+
+    response = asyncio.run(ai_server.ai_chat_batch(make_batch(4)))
+
+    assert [result.content for result in response.results] == ['답변: m0', '답변: m1', '답변: m2', '답변: m3']
+    assert response.rejectedCount == 0
+    assert all(in_flight <= 2 for _, in_flight in fake_generate)
+    assert ai_server.request_limiter.in_flight == 0
+
+
+def test_batch_rejected_when_no_item_admitted(monkeypatch, fake_generate):
+    limiter = AdmissionLimiter('requests', limit=1, max_queue=0, queue_timeout=1.0)
+    monkeypatch.setattr(ai_server, 'request_limiter', limiter)
+
+    async def scenario():
+        # 대화형 요청이 슬롯을 모두 차지한 상태
+        await limiter.acquire()
+        try:
+            await ai_server.ai_chat_batch(make_batch(3))
+        finally:
+            limiter.release()
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(scenario())
+    assert excinfo.value.status_code == 429
+    assert 'Retry-After' in excinfo.value.headers
+    assert fake_generate == []
+    # 첫 거절 뒤 남은 항목은 슬롯을 요청하지 않음
+    assert limiter.rejected == 1
+
+
+def test_batch_reports_items_rejected_midway(monkeypatch, fake_generate):
+    limiter = AdmissionLimiter('requests', limit=1, max_queue=1, queue_timeout=0.05)
+    monkeypatch.setattr(ai_server, 'request_limiter', limiter)
+
+    async def scenario():
+        # 첫 배치 항목이 실행되는 동안 대화형 요청이 대기열에 들어가 다음 슬롯을 차지
+        async def interactive():
+            await asyncio.sleep(0.001)
+            await limiter.acquire()
+
+        task = asyncio.create_task(interactive())
+        try:
+            return await ai_server.ai_chat_batch(BatchChatRequest(
+                requests=[ChatRequest(characterId='char_1', message=f'm{i}') for i in range(3)],
+                concurrency=1
+            ))
+        finally:
+            await task
+            limiter.release()
+
+    response = asyncio.run(scenario())
+    assert response.results[0].content == '답변: m0'
+    assert response.rejectedCount == 2
+    assert response.fallbackCount == 2
+    assert all(result.fallback for result in response.results[1:])
@@ -0,0 +1,87 @@
+"""ai_server.CalendarContextBuilder.build: 범위 경계, 범위가 비었을 때, 시간 미정 일정, 캐시"""
+
+import re
+from datetime import datetime, timezone
+
+from ai_server import CalendarContextBuilder
+
+NOW = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc).timestamp()
+HOUR = 3600.0
+
+
+def event(summary: str, offset_hours: float) -> dict:
+    start = datetime.fromtimestamp(NOW + offset_hours * HOUR, tz=timezone.utc)
+    return {'summary': summary, 'start': {'dateTime': start.isoformat()}}
+
+
+def make_builder(max_events: int = 2) -> CalendarContextBuilder:
+    # 범위: 1시간 전 ~ 24시간 후
+    return CalendarContextBuilder(max_events=max_events, lookback=HOUR, lookahead=24 * HOUR, cache_size=8)
+
+
+def selected(block: str) -> list:
+    return re.findall(r'^\d+\. (.+?) - ', block, flags=re.MULTILINE)
+
+
+def test_no_events_gives_empty_block():
+    assert make_builder().build([], now=NOW) == ''
+
+
+def test_picks_nearest_events_inside_window_in_time_order():
+    events = [
+        event('later', 2),
+        event('too-old', -2),
+        event('soon', 1),
+        event('just-now', -0.5),
+        event('too-far', 30),
+    ]
+    assert selected(make_builder().build(events, now=NOW)) == ['just-now', 'soon']
+
+
+def test_window_bounds_are_inclusive():
+    events = [event('edge-past', -1), event('edge-future', 24)]
+    assert selected(make_builder().build(events, now=NOW)) == ['edge-past', 'edge-future']
+
+
+def test_empty_window_falls_back_to_nearest_on_either_side():
+    events = [event('long-ago', -48), event('next-week', 72), event('far-future', 96)]
+    assert selected(make_builder().build(events, now=NOW)) == ['long-ago', 'next-week']
+
+
+def test_empty_window_with_only_future_events():
+    events = [event('a', 48), event('b', 72), event('c', 200)]
+    assert selected(make_builder().build(events, now=NOW)) == ['a', 'b']
+
+
+def test_empty_window_with_only_past_events():
+    events = [event('a', -200), event('b', -72), event('c', -48)]
+    assert selected(make_builder().build(events, now=NOW)) == ['b', 'c']
+
+
+def test_equal_distance_prefers_upcoming_event():
+    events = [event('before', -0.5), event('after', 0.5)]
+    assert selected(make_builder(max_events=1).build(events, now=NOW)) == ['after']
+
+
+def test_undated_events_fill_remaining_slots():
+    events = [event('meeting', 1), {'summary': 'someday', 'start': {}}]
+    block = make_builder(max_events=3).build(events, now=NOW)
+    assert selected(block) == ['meeting', 'someday']
+
+
+def test_only_undated_events_are_listed():
+    block = make_builder().build([{'summary': 'someday', 'start': {}}], now=NOW)
+    assert selected(block) == ['someday']
+
+
+def test_nothing_selected_gives_empty_block():
+    assert make_builder(max_events=0).build([event('meeting', 1)], now=NOW) == ''
+
+
+def test_repeated_event_list_hits_cache():
+    builder = make_builder()
+    events = [event('meeting', 1)]
+    first = builder.build(events, now=NOW)
+    assert builder.build([dict(e) for e in events], now=NOW) == first
+    assert builder.stats()['hits'] == 1
+    assert builder.stats()['misses'] == 1
@@ -0,0 +1,242 @@
+"""ai_common.resilience.CircuitBreaker / RetryBudget와 main_naver_ollama.call_with_resilience: 상태 전이, 재시도 예산"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import main_naver_ollama
+from ai_common import resilience
+from ai_common.resilience import AdmissionLimiter, CircuitBreaker, CircuitOpenError, RetryBudget, UpstreamError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience, 'time', SimpleNamespace(monotonic=fake, time=time.time))
+    return fake
+
+
+def test_breaker_opens_at_failure_threshold(clock):
+    breaker = CircuitBreaker('test', failure_threshold=3, recovery_timeout=30.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.open_count == 1
+    assert not breaker.allow()
+    assert breaker.stats()['retry_in_seconds'] == 30.0
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker('test', failure_threshold=2, recovery_timeout=30.0)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    assert breaker.consecutive_failures == 1
+
+
+def test_retry_after_opens_immediately_for_that_long(clock):
+    breaker = CircuitBreaker('test', failure_threshold=5, recovery_timeout=30.0)
+    breaker.record_failure(open_for=2.0)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    clock.now += 2.0
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=10.0)
+    breaker.record_failure()
+    clock.now += 10.0
+
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker('test', failure_threshold=5, recovery_timeout=10.0)
+    breaker.record_failure(open_for=10.0)
+    clock.now += 10.0
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.open_count == 2
+    assert not breaker.allow()
+
+
+def test_release_frees_the_probe_slot(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=10.0)
+    breaker.record_failure()
+    clock.now += 10.0
+    permit = breaker.allow()
+    assert permit == CircuitBreaker.PROBE
+
+    breaker.release(permit)
+    assert breaker.state == 'half_open'
+    assert breaker.allow() == CircuitBreaker.PROBE
+
+
+def test_cancelled_ordinary_call_keeps_probe_slot(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=10.0)
+    ordinary = breaker.allow()
+    assert ordinary == CircuitBreaker.PASS
+
+    # 일반 호출이 진행 중일 때 다른 호출이 실패해 열렸다가 시험 요청이 나감
+    breaker.record_failure()
+    clock.now += 10.0
+    assert breaker.allow() == CircuitBreaker.PROBE
+
+    breaker.release(ordinary)
+    assert breaker.allow() is None
+
+
+def test_retry_budget_accounting():
+    budget = RetryBudget(ratio=0.5, max_tokens=2.0)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    assert budget.stats() == {'tokens': 0.0, 'retries': 2, 'rejected': 1}
+
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 2.0
+
+
+class FakeAttempt:
+    """정해진 순서대로 예외를 던지거나 값을 반환하는 호출"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def resilience_env(monkeypatch):
+    budget = RetryBudget(ratio=0.2, max_tokens=10.0)
+    monkeypatch.setattr(main_naver_ollama, 'retry_budget', budget)
+    monkeypatch.setattr(main_naver_ollama, 'RETRY_BASE_DELAY', 0.0)
+    monkeypatch.setattr(main_naver_ollama, 'RETRY_MAX_ATTEMPTS', 3)
+    breaker = CircuitBreaker('test', failure_threshold=5, recovery_timeout=30.0)
+    limiter = AdmissionLimiter('test', limit=1, max_queue=0, queue_timeout=1.0)
+    return SimpleNamespace(budget=budget, breaker=breaker, limiter=limiter)
+
+
+def call(env, attempt):
+    return asyncio.run(main_naver_ollama.call_with_resilience(env.breaker, env.limiter, attempt))
+
+
+def test_retries_transient_errors_then_succeeds(resilience_env):
+    attempt = FakeAttempt(UpstreamError(503), UpstreamError(502), 'ok')
+    assert call(resilience_env, attempt) == 'ok'
+    assert attempt.calls == 3
+    assert resilience_env.breaker.state == 'closed'
+    assert resilience_env.breaker.consecutive_failures == 0
+    assert resilience_env.budget.retries == 2
+    assert resilience_env.limiter.in_flight == 0
+
+
+def test_gives_up_after_max_attempts(resilience_env):
+    attempt = FakeAttempt(UpstreamError(503), UpstreamError(503), UpstreamError(503))
+    with pytest.raises(UpstreamError):
+        call(resilience_env, attempt)
+    assert attempt.calls == 3
+    assert resilience_env.breaker.consecutive_failures == 3
+
+
+def test_client_errors_are_not_retried_or_counted(resilience_env):
+    attempt = FakeAttempt(UpstreamError(400))
+    with pytest.raises(UpstreamError):
+        call(resilience_env, attempt)
+    assert attempt.calls == 1
+    assert resilience_env.breaker.consecutive_failures == 0
+    assert resilience_env.budget.retries == 0
+
+
+def test_local_errors_do_not_touch_the_breaker(resilience_env):
+    attempt = FakeAttempt(KeyError('prompt variable'))
+    with pytest.raises(KeyError):
+        call(resilience_env, attempt)
+    assert attempt.calls == 1
+    assert resilience_env.breaker.consecutive_failures == 0
+
+
+def test_long_retry_after_opens_breaker_without_retrying(resilience_env, monkeypatch):
+    monkeypatch.setattr(main_naver_ollama, 'RETRY_MAX_DELAY', 5.0)
+    attempt = FakeAttempt(UpstreamError(429, retry_after=60.0))
+    with pytest.raises(UpstreamError):
+        call(resilience_env, attempt)
+    assert attempt.calls == 1
+    assert resilience_env.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        call(resilience_env, FakeAttempt('ok'))
+    assert resilience_env.limiter.in_flight == 0
+
+
+def test_empty_retry_budget_stops_retries(resilience_env):
+    resilience_env.budget.tokens = 0.0
+    attempt = FakeAttempt(UpstreamError(503), 'ok')
+    with pytest.raises(UpstreamError):
+        call(resilience_env, attempt)
+    assert attempt.calls == 1
+    assert resilience_env.budget.rejected == 1
+
+
+def test_cancelled_probe_releases_half_open_slot(resilience_env):
+    breaker = resilience_env.breaker
+    breaker.record_failure(open_for=0.01)
+
+    async def scenario():
+        await asyncio.sleep(0.02)
+        started = asyncio.Event()
+
+        async def slow_attempt():
+            started.set()
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(main_naver_ollama.call_with_resilience(breaker, resilience_env.limiter, slow_attempt))
+        await started.wait()
+        assert breaker.state == 'half_open'
+        assert not breaker.allow()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert breaker.state == 'half_open'
+    assert resilience_env.limiter.in_flight == 0
+    assert breaker.allow()
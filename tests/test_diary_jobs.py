@@ -0,0 +1,120 @@
+"""main_naver_ollama.DiaryJobQueue: 중복 작업 재사용, 폴백 작업에는 합치지 않음, 대기열 한도"""
+
+import asyncio
+
+import pytest
+
+import main_naver_ollama
+from ai_common.resilience import OverloadedError
+from main_naver_ollama import DiaryDraft, DiaryGenerateRequest, DiaryJobQueue, SingleFlight
+
+
+class FakeDiaryService:
+    """generate_diary_draft 대체: 호출 횟수를 세고, gate가 열릴 때까지 대기"""
+
+    def __init__(self, fallback: bool = False):
+        self.calls = 0
+        self.fallback = fallback
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def generate_diary_draft(self, messages, provider='auto') -> DiaryDraft:
+        self.calls += 1
+        await self.gate.wait()
+        return DiaryDraft(title=f'초안 {self.calls}', emotion='calm', content='...', fallback=self.fallback)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    fake = FakeDiaryService()
+    monkeypatch.setattr(main_naver_ollama, 'ai_service', fake)
+    monkeypatch.setattr(main_naver_ollama, 'diary_flights', SingleFlight(
+        result_ttl=60, max_results=8, cacheable=lambda draft: not draft.fallback
+    ))
+    return fake
+
+
+def make_queue(workers: int = 1, max_queue: int = 10) -> DiaryJobQueue:
+    return DiaryJobQueue(workers=workers, max_queue=max_queue, result_ttl=60, max_jobs=100, retry_after=5)
+
+
+def make_request(*messages: str) -> DiaryGenerateRequest:
+    return DiaryGenerateRequest(messages=list(messages or ['오늘 산책했어']), provider='ollama')
+
+
+async def run_queue(queue: DiaryJobQueue, scenario):
+    queue.start()
+    try:
+        return await scenario()
+    finally:
+        await queue.stop()
+
+
+async def wait_finished(queue: DiaryJobQueue, job_id: str):
+    while queue.get(job_id).finished_at is None:
+        await asyncio.sleep(0.001)
+    return queue.get(job_id)
+
+
+def test_duplicate_submission_returns_existing_job(service):
+    queue = make_queue()
+
+    async def scenario():
+        first = queue.submit(make_request())
+        second = queue.submit(make_request())
+        await wait_finished(queue, first.job_id)
+        third = queue.submit(make_request())
+        return first, second, third
+
+    first, second, third = asyncio.run(run_queue(queue, scenario))
+    assert second.job_id == first.job_id
+    assert third.job_id == first.job_id
+    assert first.status == 'succeeded'
+    assert service.calls == 1
+    assert queue.stats()['deduplicated'] == 2
+
+
+def test_fallback_job_is_not_reused(service):
+    service.fallback = True
+    queue = make_queue()
+
+    async def scenario():
+        first = queue.submit(make_request())
+        await wait_finished(queue, first.job_id)
+        retry = queue.submit(make_request())
+        await wait_finished(queue, retry.job_id)
+        return first, retry
+
+    first, retry = asyncio.run(run_queue(queue, scenario))
+    assert first.fallback is True
+    assert retry.job_id != first.job_id
+    assert service.calls == 2
+    assert queue.stats()['fallback'] == 2
+    assert queue.stats()['deduplicated'] == 0
+
+
+def test_full_queue_rejects_new_jobs(service):
+    service.gate.clear()
+    queue = make_queue(workers=1, max_queue=1)
+
+    async def scenario():
+        running = queue.submit(make_request('첫 번째'))
+        await asyncio.sleep(0.01)  # 워커가 첫 작업을 꺼내 실행 중
+        queued = queue.submit(make_request('두 번째'))
+        with pytest.raises(OverloadedError) as excinfo:
+            queue.submit(make_request('세 번째'))
+        # 중복 요청은 대기열이 가득 차도 기존 작업을 반환
+        assert queue.submit(make_request('두 번째')).job_id == queued.job_id
+        service.gate.set()
+        await wait_finished(queue, queued.job_id)
+        return running, excinfo.value
+
+    running, error = asyncio.run(run_queue(queue, scenario))
+    assert running.status == 'succeeded'
+    assert error.retry_after == 5
+    assert queue.stats()['rejected'] == 1
+
+
+def test_submit_before_start_is_rejected(service):
+    with pytest.raises(OverloadedError):
+        make_queue().submit(make_request())
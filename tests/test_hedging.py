@@ -0,0 +1,122 @@
+"""main_naver_ollama.AIService._generate_hedged: 헤지 시점, 패배한 요청 취소, 메모리 저장"""
+
+import asyncio
+
+import pytest
+
+from main_naver_ollama import AIService, ChatResponse
+
+
+class FakeMemory:
+    def __init__(self):
+        self.saved = []
+
+    def save_context(self, inputs, outputs):
+        self.saved.append((inputs['input'], outputs['output']))
+
+
+class FakeProvider:
+    """지정한 시간 뒤 응답하거나 실패하는 제공자 (취소되었는지 기록)"""
+
+    def __init__(self, name: str, delay: float, error: Exception = None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    async def __call__(self, *args, **kwargs) -> ChatResponse:
+        self.calls += 1
+        assert kwargs.get('save_memory') is False
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return ChatResponse(content=f'{self.name} 답변', model_used=self.name, memory_used=True)
+
+
+def make_service(primary: FakeProvider, secondary: FakeProvider, hedge_delay: float = 0.02) -> AIService:
+    service = AIService()
+    service.hedge_delay = lambda: hedge_delay
+    service._try_hyperclova = primary
+    service._try_ollama = secondary
+    return service
+
+
+def run_hedged(service: AIService, memory: FakeMemory = None) -> ChatResponse:
+    async def scenario():
+        try:
+            return await service._generate_hedged(
+                'system', 'context', '안녕', memory, memory is not None, 'char_1'
+            )
+        finally:
+            # 취소된 요청이 CancelledError를 처리할 기회를 줌
+            await asyncio.sleep(0.01)
+
+    return asyncio.run(scenario())
+
+
+def test_fast_primary_is_not_hedged():
+    primary, secondary = FakeProvider('hyperclova', 0.0), FakeProvider('ollama', 0.0)
+    service = make_service(primary, secondary)
+
+    response = run_hedged(service)
+    assert response.model_used == 'hyperclova'
+    assert response.hedge_wait_ms is None
+    assert secondary.calls == 0
+    assert service.hedge_stats['hedged'] == 0
+
+
+def test_slow_primary_is_cancelled_when_hedge_wins():
+    primary, secondary = FakeProvider('hyperclova', 5.0), FakeProvider('ollama', 0.0)
+    service = make_service(primary, secondary)
+
+    response = run_hedged(service)
+    assert response.model_used == 'ollama'
+    assert response.hedge_wait_ms is not None
+    assert primary.cancelled
+    assert service.hedge_stats['hedged'] == 1
+    assert service.hedge_stats['wins'] == {'hyperclova': 0, 'ollama': 1}
+    # 취소된 1차 요청도 경과 시간을 하한값으로 기록
+    assert len(service.primary_latency) == 1
+
+
+def test_slow_hedge_is_cancelled_when_primary_wins():
+    primary, secondary = FakeProvider('hyperclova', 0.05), FakeProvider('ollama', 5.0)
+    service = make_service(primary, secondary)
+
+    response = run_hedged(service)
+    assert response.model_used == 'hyperclova'
+    assert secondary.calls == 1
+    assert secondary.cancelled
+    assert service.hedge_stats['wins']['hyperclova'] == 1
+
+
+def test_failed_primary_hedges_without_waiting_for_delay():
+    primary = FakeProvider('hyperclova', 0.0, error=RuntimeError('503'))
+    secondary = FakeProvider('ollama', 0.0)
+    service = make_service(primary, secondary, hedge_delay=5.0)
+
+    response = run_hedged(service)
+    assert response.model_used == 'ollama'
+    assert response.hedge_wait_ms < 1000
+
+
+def test_all_providers_failing_raises():
+    primary = FakeProvider('hyperclova', 0.0, error=RuntimeError('503'))
+    secondary = FakeProvider('ollama', 0.0, error=RuntimeError('timeout'))
+    service = make_service(primary, secondary)
+
+    with pytest.raises(Exception, match='All hedged providers failed'):
+        run_hedged(service)
+
+
+def test_winner_is_saved_to_memory_once():
+    primary, secondary = FakeProvider('hyperclova', 5.0), FakeProvider('ollama', 0.0)
+    memory = FakeMemory()
+
+    run_hedged(make_service(primary, secondary), memory)
+    assert memory.saved == [('안녕', 'ollama 답변')]
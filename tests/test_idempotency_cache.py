@@ -0,0 +1,144 @@
+"""ai_server.IdempotencyCache: 키 유도, 응답 재사용, 중복 요청 합치기, 키 충돌"""
+
+import asyncio
+
+import pytest
+
+from ai_server import ChatRequest, ChatResponse, IdempotencyCache, IdempotencyKeyConflict
+
+
+def make_request(**overrides) -> ChatRequest:
+    fields = {'characterId': 'char_1', 'message': '오늘 너무 힘들었어'}
+    fields.update(overrides)
+    return ChatRequest(**fields)
+
+
+class CountingGenerator:
+    """호출 횟수를 세는 응답 생성기 (release가 설정될 때까지 대기 가능)"""
+
+    def __init__(self, fallback: bool = False, release: asyncio.Event = None):
+        self.calls = 0
+        self.fallback = fallback
+        self.release = release
+
+    async def __call__(self) -> ChatResponse:
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        return ChatResponse(content=f'답변 {self.calls}', fallback=self.fallback)
+
+
+def test_make_key_prefers_header_key():
+    assert IdempotencyCache.make_key(make_request(), 'abc') == 'key:abc'
+
+
+def test_make_key_tolerates_null_fields():
+    key = IdempotencyCache.make_key(make_request(chatHistory=None, calendarEvents=None), None)
+    assert key == IdempotencyCache.make_key(make_request(chatHistory=[], calendarEvents=[]), None)
+    assert IdempotencyCache.fingerprint(make_request(chatHistory=None))
+
+
+def test_make_key_depends_on_message():
+    first = IdempotencyCache.make_key(make_request(message='a'), None)
+    second = IdempotencyCache.make_key(make_request(message='b'), None)
+    assert first != second
+
+
+def test_replays_stored_response():
+    cache = IdempotencyCache(max_size=8, ttl=60)
+    generate = CountingGenerator()
+
+    async def scenario():
+        first = await cache.run('k', generate)
+        second = await cache.run('k', generate)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert generate.calls == 1
+    assert first.content == second.content
+    assert cache.stats()['hits'] == 1
+
+
+def test_fallback_responses_are_not_stored():
+    cache = IdempotencyCache(max_size=8, ttl=60)
+    generate = CountingGenerator(fallback=True)
+
+    async def scenario():
+        await cache.run('k', generate)
+        await cache.run('k', generate)
+
+    asyncio.run(scenario())
+    assert generate.calls == 2
+    assert cache.stats()['size'] == 0
+
+
+def test_concurrent_duplicates_share_one_generation():
+    cache = IdempotencyCache(max_size=8, ttl=60)
+
+    async def scenario():
+        generate = CountingGenerator(release=asyncio.Event())
+        first = asyncio.create_task(cache.run('k', generate))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.run('k', generate))
+        await asyncio.sleep(0)
+        generate.release.set()
+        return generate, await first, await second
+
+    generate, first, second = asyncio.run(scenario())
+    assert generate.calls == 1
+    assert first.content == second.content
+    assert cache.stats()['coalesced'] == 1
+    assert cache.stats()['inFlight'] == 0
+
+
+def test_reused_key_with_different_body_conflicts():
+    cache = IdempotencyCache(max_size=8, ttl=60)
+    generate = CountingGenerator()
+
+    async def scenario():
+        await cache.run('k', generate, fingerprint='body-a')
+        assert (await cache.run('k', generate, fingerprint='body-a')).content == '답변 1'
+        await cache.run('k', generate, fingerprint='body-b')
+
+    with pytest.raises(IdempotencyKeyConflict):
+        asyncio.run(scenario())
+    assert generate.calls == 1
+    assert cache.stats()['conflicts'] == 1
+
+
+def test_in_flight_key_with_different_body_conflicts():
+    cache = IdempotencyCache(max_size=8, ttl=60)
+
+    async def scenario():
+        generate = CountingGenerator(release=asyncio.Event())
+        first = asyncio.create_task(cache.run('k', generate, fingerprint='body-a'))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(IdempotencyKeyConflict):
+                await cache.run('k', generate, fingerprint='body-b')
+        finally:
+            generate.release.set()
+        await first
+
+    asyncio.run(scenario())
+
+
+def test_expired_entries_are_regenerated():
+    cache = IdempotencyCache(max_size=8, ttl=0.01)
+    generate = CountingGenerator()
+
+    async def scenario():
+        await cache.run('k', generate)
+        await asyncio.sleep(0.02)
+        await cache.run('k', generate)
+
+    asyncio.run(scenario())
+    assert generate.calls == 2
+
+
+def test_evicts_least_recently_used_entry():
+    cache = IdempotencyCache(max_size=2, ttl=60)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, ChatResponse(content=key))
+    assert cache.get('a') is None
+    assert cache.get('c').content == 'c'
@@ -0,0 +1,54 @@
+"""main_naver_ollama /chat, /diary/generate: 제공자 호출 대기열이 가득 차면 500 대신 429 + Retry-After"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import main_naver_ollama
+from ai_common.resilience import OverloadedError
+from main_naver_ollama import ChatRequest, DiaryGenerateRequest, Message, SingleFlight
+
+
+async def overloaded(*args, **kwargs):
+    raise OverloadedError('hyperclova', retry_after=2.5)
+
+
+def test_chat_with_overloaded_provider_returns_429(monkeypatch):
+    monkeypatch.setattr(main_naver_ollama.ai_service, '_try_hyperclova', overloaded)
+    request = ChatRequest(
+        character_id='char_1',
+        messages=[Message(role='user', content='안녕')],
+        profile={},
+        provider='hyperclova',
+        use_memory=False
+    )
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(main_naver_ollama.chat(request, None))
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers == {'Retry-After': '3'}
+
+
+@pytest.fixture
+def diary_env(monkeypatch):
+    monkeypatch.setattr(main_naver_ollama.ai_service, '_generate_diary_hyperclova', overloaded)
+    monkeypatch.setattr(main_naver_ollama.ai_service.hyperclova, 'is_available', lambda: True)
+    monkeypatch.setattr(main_naver_ollama.ai_service.ollama, 'is_available', lambda: False)
+    monkeypatch.setattr(main_naver_ollama, 'diary_flights', SingleFlight(result_ttl=60, max_results=8))
+
+
+def test_diary_with_overloaded_provider_returns_429(diary_env):
+    request = DiaryGenerateRequest(messages=['오늘 산책했어'], provider='hyperclova')
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(main_naver_ollama.generate_diary(request))
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers == {'Retry-After': '3'}
+
+
+def test_auto_diary_falls_back_when_provider_is_overloaded(diary_env):
+    request = DiaryGenerateRequest(messages=['오늘 산책했어'], provider='auto')
+
+    draft = asyncio.run(main_naver_ollama.generate_diary(request))
+    assert draft.fallback is True
@@ -0,0 +1,90 @@
+"""ai_server.RoutingClassifier: 학습 → 저장 → 로드 후 같은 예측, 임계값 미만이면 LLM 라우터로 넘김"""
+
+import asyncio
+import json
+
+import pytest
+
+import ai_server
+from ai_server import CharacterInfo, RoutingCache, RoutingClassifier, load_routing_classifier
+from train_routing_model import train
+
+# 키워드 라우팅에 걸리지 않는 단어로만 구성 (키워드 점수가 모두 0이어야 분류기까지 내려감)
+SAMPLES = [
+    ('zebra apple tango', 'char_1'),
+    ('apple zebra waltz', 'char_1'),
+    ('tango apple zebra', 'char_1'),
+    ('rocket quasar nebula', 'char_2'),
+    ('nebula rocket orbit', 'char_2'),
+    ('quasar orbit rocket', 'char_2'),
+    ('violin cello sonata', 'char_3'),
+    ('sonata violin piano', 'char_3'),
+    ('cello piano violin', 'char_3'),
+]
+
+
+@pytest.fixture(scope='module')
+def model():
+    return train(SAMPLES, ngram_range=(1, 3), epochs=30, learning_rate=0.5, l2=0.0, min_df=1, prune=0.0, seed=7)
+
+
+def test_save_and_load_round_trip(model, tmp_path):
+    path = str(tmp_path / 'routing_model.json')
+    model.save(path)
+    loaded = RoutingClassifier.load(path)
+
+    assert loaded.classes == ['char_1', 'char_2', 'char_3']
+    assert loaded.ngram_range == model.ngram_range
+    for message in ('zebra tango', 'rocket nebula', 'violin sonata', 'zebra violin'):
+        assert loaded.predict(message) == pytest.approx(model.predict(message))
+
+
+def test_predicts_training_classes(model):
+    assert model.predict('apple zebra')[0] == 'char_1'
+    assert model.predict('quasar nebula')[0] == 'char_2'
+    assert model.predict('cello sonata')[0] == 'char_3'
+
+
+def test_unsupported_version_is_not_loaded(model, tmp_path):
+    path = tmp_path / 'routing_model.json'
+    data = model.to_dict()
+    data['version'] = RoutingClassifier.VERSION + 1
+    path.write_text(json.dumps(data), encoding='utf-8')
+
+    with pytest.raises(ValueError):
+        RoutingClassifier.load(str(path))
+    assert load_routing_classifier(str(path)) is None
+    assert load_routing_classifier(str(tmp_path / 'missing.json')) is None
+
+
+@pytest.fixture
+def group_routing(monkeypatch, model):
+    llm_calls = []
+
+    async def route_with_llm(message):
+        llm_calls.append(message)
+        return CharacterInfo(charId='char_3', charName='레오', charEmoji='🌙', reason='LLM 선택')
+
+    monkeypatch.setattr(ai_server, 'OLLAMA_API_KEY', 'test-key')
+    monkeypatch.setattr(ai_server, 'routing_classifier', model)
+    monkeypatch.setattr(ai_server, 'routing_cache', RoutingCache(max_size=8, ttl=60))
+    monkeypatch.setattr(ai_server, 'route_with_llm', route_with_llm)
+    return llm_calls
+
+
+def test_confident_prediction_skips_llm_router(monkeypatch, model, group_routing):
+    probability = model.predict('rocket quasar')[1]
+    monkeypatch.setattr(ai_server, 'ROUTING_MODEL_THRESHOLD', probability - 0.01)
+
+    character, path = asyncio.run(ai_server.select_group_character('rocket quasar'))
+    assert (path, character.charId) == ('model', 'char_2')
+    assert group_routing == []
+
+
+def test_below_threshold_passes_through_to_llm_router(monkeypatch, model, group_routing):
+    probability = model.predict('rocket quasar')[1]
+    monkeypatch.setattr(ai_server, 'ROUTING_MODEL_THRESHOLD', probability + 0.01)
+
+    character, path = asyncio.run(ai_server.select_group_character('rocket quasar'))
+    assert (path, character.charId) == ('llm', 'char_3')
+    assert group_routing == ['rocket quasar']
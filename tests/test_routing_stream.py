@@ -0,0 +1,114 @@
+"""ai_server.RoutingStreamParser / stream_routing_decision: 조각난 값, 이스케이프, 조기 종료, 잘못된 JSON 폴백"""
+
+import asyncio
+
+import pytest
+
+import ai_server
+from ai_server import RoutingCache, RoutingStreamParser
+
+
+def feed_all(parser: RoutingStreamParser, chunks) -> list:
+    return [parser.feed(chunk) for chunk in chunks]
+
+
+def test_value_split_across_chunks():
+    parser = RoutingStreamParser()
+    decided = feed_all(parser, ['{"chara', 'cter": "ch', 'ar_', '2"', ', "reason": "계획"}'])
+    assert decided == [False, False, False, True, True]
+    assert parser.character == 'char_2'
+
+
+def test_key_before_value_waits_for_closing_quote():
+    parser = RoutingStreamParser()
+    assert parser.feed('{"character"') is False
+    assert parser.feed(': ') is False
+    assert parser.feed('"char_3') is False
+    assert parser.character is None
+    assert parser.feed('", ') is True
+    assert parser.character == 'char_3'
+
+
+def test_escaped_quotes_do_not_end_the_value():
+    parser = RoutingStreamParser()
+    feed_all(parser, ['{"reason": "사용자가 \\"왜', '\\" 라고 물음", ', '"character": "char_3"}'])
+    assert parser.reason == '사용자가 "왜" 라고 물음'
+    assert parser.character == 'char_3'
+
+
+def test_escaped_quote_split_at_chunk_boundary():
+    parser = RoutingStreamParser()
+    assert parser.feed('{"character": "char_1\\') is False
+    assert parser.feed('"x"}') is True
+    assert parser.character == 'char_1"x'
+
+
+def test_reason_after_character_is_left_empty():
+    parser = RoutingStreamParser()
+    assert parser.feed('{"character": "char_1", "rea') is True
+    assert parser.reason is None
+
+
+class FakeStream:
+    """stream_ollama_completion 대체: 토큰을 차례로 내보내고 읽힌 개수와 종료 여부를 기록"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.consumed = 0
+        self.closed = False
+
+    def __call__(self, messages, options=None, timeout=None):
+        return self._generate()
+
+    async def _generate(self):
+        try:
+            for token in self.tokens:
+                self.consumed += 1
+                yield token
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    def install(tokens):
+        stream = FakeStream(tokens)
+        monkeypatch.setattr(ai_server, 'stream_ollama_completion', stream)
+        return stream
+    return install
+
+
+def test_stream_stops_at_first_character_value(fake_stream):
+    stream = fake_stream(['{"character": "char_2"', ', "reason": "계획 필요"', '}'])
+    result = asyncio.run(ai_server.stream_routing_decision([]))
+    assert result == {'character': 'char_2'}
+    assert stream.consumed == 1
+    assert stream.closed
+
+
+def test_stream_decides_inside_code_block(fake_stream):
+    stream = fake_stream(['```json\n{"character":', ' "char_3", "reason": "성찰"}\n```'])
+    assert asyncio.run(ai_server.stream_routing_decision([]))['character'] == 'char_3'
+    assert stream.closed
+
+
+def test_stream_truncated_json_raises(fake_stream):
+    fake_stream(['{"character": "char_', '2'])
+    with pytest.raises(ValueError):
+        asyncio.run(ai_server.stream_routing_decision([]))
+
+
+@pytest.mark.parametrize('tokens', [
+    ['{"character": "char_', '2'],  # 값이 닫히기 전에 잘림
+    ['이건 JSON이 아닙니다'],  # JSON 없음
+    ['{"character": "char_9"}'],  # 알 수 없는 캐릭터
+])
+def test_malformed_router_output_falls_back_to_keywords(monkeypatch, fake_stream, tokens):
+    fake_stream(tokens)
+    monkeypatch.setattr(ai_server, 'OLLAMA_API_KEY', 'test-key')
+    monkeypatch.setattr(ai_server, 'routing_classifier', None)
+    monkeypatch.setattr(ai_server, 'routing_cache', RoutingCache(max_size=8, ttl=60))
+
+    character, path = asyncio.run(ai_server.select_group_character('음 그냥 그래'))
+    assert path == 'fallback'
+    assert character.charId == 'char_1'
@@ -0,0 +1,80 @@
+"""main_naver_ollama.SessionMemoryStore: LRU/바이트 예산 제거, 사용 중인 세션은 저장 시 다시 등록"""
+
+from main_naver_ollama import SessionMemoryStore
+
+
+def make_store(max_sessions: int = 10, idle_ttl: float = 3600, max_bytes: int = 10 ** 9) -> SessionMemoryStore:
+    return SessionMemoryStore(max_sessions=max_sessions, idle_ttl=idle_ttl, max_bytes=max_bytes)
+
+
+def contents(memory) -> list:
+    return [message.content for message in memory.load_memory_variables({})['chat_history']]
+
+
+def test_lru_evicts_least_recently_used():
+    store = make_store(max_sessions=2)
+    store.get('u1', 'char_1')
+    store.get('u2', 'char_1')
+    store.get('u1', 'char_1')
+    store.get('u3', 'char_1')
+
+    assert [key for key, _ in store.items()] == ['u1:char_1', 'u3:char_1']
+    assert store.stats()['evictions']['lru'] == 1
+
+
+def test_requested_session_is_never_evicted():
+    store = make_store(max_sessions=0, max_bytes=0)
+    memory = store.get('u1', 'char_1')
+
+    assert [key for key, _ in store.items()] == ['u1:char_1']
+    assert store.items()[0][1] is memory
+
+
+def test_evicted_session_in_use_is_restored_on_save():
+    store = make_store(max_sessions=1)
+    in_flight = store.get('u1', 'char_1')
+    # 첫 요청이 응답을 기다리는 동안 다른 사용자의 요청이 세션을 밀어냄
+    store.get('u2', 'char_1')
+    assert len(store) == 1
+
+    in_flight.save_context({'input': '안녕'}, {'output': '반가워'})
+
+    assert store.stats()['restored'] == 1
+    assert contents(store.get('u1', 'char_1')) == ['안녕', '반가워']
+
+
+def test_ttl_evicted_session_in_use_is_restored_on_save():
+    store = make_store(idle_ttl=0)
+    in_flight = store.get('u1', 'char_1')
+    store.get('u2', 'char_1')
+    assert [key for key, _ in store.items()] == ['u2:char_1']
+
+    in_flight.save_context({'input': '안녕'}, {'output': '반가워'})
+    assert 'u1:char_1' in dict(store.items())
+    assert store.stats()['restored'] == 1
+
+
+def test_save_remeasures_session_size():
+    store = make_store()
+    memory = store.get('u1', 'char_1')
+    empty = store.stats()['approx_bytes']
+
+    memory.save_context({'input': '가' * 1000}, {'output': '나' * 1000})
+
+    assert store.stats()['approx_bytes'] > empty + 2000
+    store.clear('u1:char_1')
+    assert store.stats()['approx_bytes'] == 0
+
+
+def test_cleared_session_in_use_is_not_restored_on_save():
+    store = make_store()
+    in_flight = store.get('u1', 'char_1')
+    in_flight.save_context({'input': '비밀 이야기'}, {'output': '알겠어'})
+    # 다음 턴이 진행 중일 때 사용자가 대화 기록을 지움
+    assert store.clear('u1:char_1') is True
+
+    in_flight.save_context({'input': '그리고'}, {'output': '응'})
+
+    assert len(store) == 0
+    assert store.stats()['restored'] == 0
+    assert contents(store.get('u1', 'char_1')) == []
@@ -0,0 +1,96 @@
+"""main_naver_ollama.SingleFlight: 동시 중복 요청 병합, 결과 재사용, 폴백 초안은 저장하지 않음"""
+
+import asyncio
+
+from main_naver_ollama import DiaryDraft, SingleFlight
+
+
+class DraftGenerator:
+    """호출 횟수를 세는 일기 생성기 (release가 설정될 때까지 대기)"""
+
+    def __init__(self, fallback: bool = False):
+        self.calls = 0
+        self.fallback = fallback
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> DiaryDraft:
+        self.calls += 1
+        await self.release.wait()
+        return DiaryDraft(title=f'초안 {self.calls}', emotion='calm', content='...', fallback=self.fallback)
+
+
+def make_flights() -> SingleFlight:
+    return SingleFlight(result_ttl=60, max_results=8, cacheable=lambda draft: not draft.fallback)
+
+
+def test_concurrent_duplicates_share_one_execution():
+    async def scenario():
+        flights = make_flights()
+        generate = DraftGenerator()
+        callers = [asyncio.create_task(flights.do('key', generate)) for _ in range(3)]
+        await asyncio.sleep(0)
+        generate.release.set()
+        return flights, generate, await asyncio.gather(*callers)
+
+    flights, generate, drafts = asyncio.run(scenario())
+    assert generate.calls == 1
+    assert [draft.title for draft in drafts] == ['초안 1'] * 3
+    assert flights.stats()['executed'] == 1
+    assert flights.stats()['coalesced'] == 2
+
+
+def test_successful_result_is_reused():
+    async def scenario():
+        flights = make_flights()
+        generate = DraftGenerator()
+        generate.release.set()
+        first = await flights.do('key', generate)
+        second = await flights.do('key', generate)
+        return flights, generate, first, second
+
+    flights, generate, first, second = asyncio.run(scenario())
+    assert generate.calls == 1
+    assert second is first
+    assert flights.stats()['cache_hits'] == 1
+
+
+def test_fallback_draft_is_shared_but_not_cached():
+    async def scenario():
+        flights = make_flights()
+        generate = DraftGenerator(fallback=True)
+        callers = [asyncio.create_task(flights.do('key', generate)) for _ in range(2)]
+        await asyncio.sleep(0)
+        generate.release.set()
+        concurrent = await asyncio.gather(*callers)
+        # 재시도는 제공자를 다시 호출
+        retried = await flights.do('key', generate)
+        return flights, generate, concurrent, retried
+
+    flights, generate, concurrent, retried = asyncio.run(scenario())
+    assert [draft.title for draft in concurrent] == ['초안 1', '초안 1']
+    assert retried.title == '초안 2'
+    assert generate.calls == 2
+    assert flights.stats()['cached_results'] == 0
+    assert flights.stats()['not_cached'] == 2
+
+
+def test_failed_execution_is_not_cached():
+    async def scenario():
+        flights = make_flights()
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            raise RuntimeError('provider down')
+
+        for _ in range(2):
+            try:
+                await flights.do('key', failing)
+            except RuntimeError:
+                pass
+        return flights, calls
+
+    flights, calls = asyncio.run(scenario())
+    assert calls == 2
+    assert flights.stats()['cached_results'] == 0
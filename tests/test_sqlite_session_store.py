@@ -0,0 +1,117 @@
+"""main_naver_ollama.SQLiteSessionStore: 저장 후 읽기, 재시작 후 유지, 세션 삭제, 종료 시 기록"""
+
+import sqlite3
+
+import pytest
+
+from main_naver_ollama import SQLiteSessionStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'sessions.db')
+
+
+def open_store(path: str, flush_interval: float = 0.01) -> SQLiteSessionStore:
+    return SQLiteSessionStore(path=path, idle_ttl=3600, keep_messages=40, flush_interval=flush_interval)
+
+
+def history(store: SQLiteSessionStore, user_id: str = 'user-1', character_id: str = 'char_1') -> list:
+    memory = store.get(user_id, character_id)
+    return [(message.type, message.content) for message in memory.load_memory_variables({})['chat_history']]
+
+
+def test_save_then_load_round_trip(db_path):
+    store = open_store(db_path)
+    try:
+        store.get('user-1', 'char_1').save_context({'input': '안녕'}, {'output': '반가워'})
+        assert history(store) == [('human', '안녕'), ('ai', '반가워')]
+        assert history(store, character_id='char_2') == []
+    finally:
+        store.close()
+
+
+def test_sessions_survive_reopen(db_path):
+    store = open_store(db_path)
+    store.get('user-1', 'char_1').save_context({'input': '오늘 힘들었어'}, {'output': '무슨 일 있었어?'})
+    store.close()
+
+    reopened = open_store(db_path)
+    try:
+        assert history(reopened) == [('human', '오늘 힘들었어'), ('ai', '무슨 일 있었어?')]
+        assert len(reopened) == 1
+    finally:
+        reopened.close()
+
+
+def test_clear_removes_session(db_path):
+    store = open_store(db_path)
+    try:
+        store.get('user-1', 'char_1').save_context({'input': '안녕'}, {'output': '반가워'})
+        key = SQLiteSessionStore.make_key('user-1', 'char_1')
+        assert store.clear(key) is True
+        assert history(store) == []
+        assert len(store) == 0
+        assert store.clear(key) is False
+    finally:
+        store.close()
+
+    reopened = open_store(db_path)
+    try:
+        assert history(reopened) == []
+    finally:
+        reopened.close()
+
+
+def test_writer_flushes_pending_writes_on_close(db_path):
+    # 주기적인 기록이 일어나지 않도록 간격을 길게 두고, close()가 남은 작업을 기록하는지 확인
+    store = open_store(db_path, flush_interval=60.0)
+    store.get('user-1', 'char_1').save_context({'input': '안녕'}, {'output': '반가워'})
+    assert store.stats()['pending_writes'] == 2
+    store.close()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute('SELECT role, content FROM messages ORDER BY id').fetchall()
+    finally:
+        conn.close()
+    assert rows == [('human', '안녕'), ('ai', '반가워')]
+
+
+def test_failed_batch_is_retried(db_path):
+    store = open_store(db_path)
+    original = store._write_batch
+    attempts = []
+
+    def flaky_write(conn, batch):
+        attempts.append(len(batch))
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        original(conn, batch)
+
+    store._write_batch = flaky_write
+    store.get('user-1', 'char_1').save_context({'input': '안녕'}, {'output': '반가워'})
+    store.close()
+
+    assert len(attempts) >= 2
+    assert store.write_failures == 1
+    assert store.dropped_writes == 0
+    reopened = open_store(db_path)
+    try:
+        assert history(reopened) == [('human', '안녕'), ('ai', '반가워')]
+    finally:
+        reopened.close()
+
+
+def test_batch_is_dropped_after_retry_limit(db_path):
+    store = SQLiteSessionStore(path=db_path, idle_ttl=3600, flush_interval=0.01, max_write_retries=2)
+
+    def failing_write(conn, batch):
+        raise sqlite3.OperationalError('database is locked')
+
+    store._write_batch = failing_write
+    store.get('user-1', 'char_1').save_context({'input': '안녕'}, {'output': '반가워'})
+    store.close()
+
+    assert store.write_failures == 3
+    assert store.dropped_writes == 2
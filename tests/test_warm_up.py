@@ -0,0 +1,35 @@
+"""main_naver_ollama.load_langchain: 워밍업 스레드가 import 중이어도 이벤트 루프를 막지 않음"""
+
+import asyncio
+
+import main_naver_ollama
+
+
+def test_request_waits_for_warm_up_without_blocking_the_loop(monkeypatch):
+    monkeypatch.setattr(main_naver_ollama, '_langchain', None)
+    lock = main_naver_ollama._langchain_lock
+    lock.acquire()  # 워밍업 스레드가 import 중인 상태
+    ticks = []
+
+    async def scenario():
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.005)
+
+        ticking = asyncio.create_task(ticker())
+        loading = asyncio.create_task(main_naver_ollama.load_langchain())
+        try:
+            await asyncio.sleep(0.05)
+            assert not loading.done()
+        finally:
+            lock.release()
+        modules = await loading
+        ticking.cancel()
+        return modules
+
+    modules = asyncio.run(scenario())
+
+    assert len(ticks) >= 5
+    assert modules.ConversationBufferWindowMemory is not None
+    assert main_naver_ollama._langchain is modules